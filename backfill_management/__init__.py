@@ -0,0 +1,2 @@
+from .backfill_checkpoint_store import BackfillCheckpointStore
+from .backfill_runner import BackfillRunner, plan_backfill_chunks
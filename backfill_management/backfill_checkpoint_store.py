@@ -0,0 +1,49 @@
+from datetime import datetime, timezone
+import logging
+
+
+class BackfillCheckpointStore:
+    """
+    Records completed backfill chunks in the data table, one item per chunk under a 'backfill#<partition key>'
+    partition, so a rerun of an interrupted backfill skips the chunks that were already written.
+    """
+
+    CHECKPOINT_PARTITION_KEY_PREFIX = 'backfill#'
+    COMPLETED_AT_ATTRIBUTE_NAME = 'completed_at'
+
+    def __init__(self, dynamodb_manager):
+        """
+
+        :param dynamodb_manager: DynamoDbManager of the data table
+        """
+        self.dynamodb_manager = dynamodb_manager
+        self.logger = logging.getLogger(name='BackfillCheckpointStore')
+
+    def _format_checkpoint_partition_key_value(self, partition_key_value) -> str:
+        return f"{self.CHECKPOINT_PARTITION_KEY_PREFIX}{partition_key_value}"
+
+    @staticmethod
+    def format_chunk_id(chunk: tuple[str, str]) -> str:
+        chunk_start, chunk_end = chunk
+        return f"{chunk_start}/{chunk_end}"
+
+    def get_completed_chunk_ids(self, partition_key_value) -> set[str]:
+        checkpoint_partition_key_value = self._format_checkpoint_partition_key_value(partition_key_value)
+        checkpoint_items = self.dynamodb_manager.query_items(
+            partition_key_value=checkpoint_partition_key_value,
+            KeyConditionExpression="#pk = :pk",
+            ExpressionAttributeNames={
+                '#pk': self.dynamodb_manager.partition_key_name
+            },
+            ExpressionAttributeValues={
+                ':pk': checkpoint_partition_key_value
+            }
+        )
+        return {checkpoint_item[self.dynamodb_manager.sort_key_name] for checkpoint_item in checkpoint_items}
+
+    def mark_completed(self, partition_key_value, chunk: tuple[str, str]):
+        self.dynamodb_manager.put_item(item={
+            self.dynamodb_manager.partition_key_name: self._format_checkpoint_partition_key_value(partition_key_value),
+            self.dynamodb_manager.sort_key_name: self.format_chunk_id(chunk),
+            self.COMPLETED_AT_ATTRIBUTE_NAME: datetime.now(timezone.utc).isoformat()
+        })
@@ -0,0 +1,112 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from collections import defaultdict
+from datetime import date, timedelta
+import logging
+import threading
+
+
+def plan_backfill_chunks(start_date: str, end_date: str, chunk_months: int = 12) -> list[tuple[str, str]]:
+    """
+    Splits a date range into chunks of whole months, so every chunk writes complete month items.
+
+    :param start_date: First date of the range, in the format YYYY-MM-DD
+    :param end_date: Last date of the range, inclusive
+    :param chunk_months: Number of months per chunk
+    :return: [(chunk start date, chunk end date)], inclusive and in date order. The first and last chunks are
+        clipped to the range.
+    """
+    range_start, range_end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    chunks = []
+    chunk_start = range_start
+    while chunk_start <= range_end:
+        months_after_start = chunk_start.month - 1 + chunk_months
+        next_chunk_start = date(chunk_start.year + months_after_start // 12, months_after_start % 12 + 1, 1)
+        chunk_end = min(next_chunk_start - timedelta(days=1), range_end)
+        chunks.append((chunk_start.isoformat(), chunk_end.isoformat()))
+        chunk_start = next_chunk_start
+    return chunks
+
+
+class BackfillRunner:
+    """
+    Runs backfill chunks across a worker pool, checkpointing each chunk once it is written. Chunks that already have
+    a checkpoint are skipped, and no new chunks are started once the Lambda is close to its timeout, so a rerun
+    resumes where the previous run stopped.
+
+    Chunks are fetched fully in parallel, but the writes of a single series are serialised, as the watermark and
+    rollup updates of a write read the series' current state first.
+    """
+
+    def __init__(self, checkpoint_store, max_workers: int = 4, context=None, min_remaining_millis: int = 60000):
+        """
+
+        :param checkpoint_store: BackfillCheckpointStore
+        :param max_workers: Number of chunks fetched and written at once
+        :param context: Lambda context, used to stop starting chunks before the Lambda times out
+        :param min_remaining_millis: No new chunks are started with less than this much time left
+        """
+        self.checkpoint_store = checkpoint_store
+        self.max_workers = max_workers
+        self.context = context
+        self.min_remaining_millis = min_remaining_millis
+        self.logger = logging.getLogger(name='BackfillRunner')
+
+    def _has_time_left(self) -> bool:
+        return self.context is None or self.context.get_remaining_time_in_millis() >= self.min_remaining_millis
+
+    def run(self, series_chunks: dict[str, list[tuple[str, str]]], fetch_chunk, store_chunk) -> dict:
+        """
+        :param series_chunks: {partition key value: [(chunk start date, chunk end date)]}
+        :param fetch_chunk: Function taking (partition key value, chunk) that returns the chunk's data
+        :param store_chunk: Function taking (partition key value, chunk, data) that writes the fetched data
+        :return: {'completed': int, 'skipped': int, 'failed': [chunk descriptions], 'remaining': int}. 'remaining'
+            counts chunks left for a rerun because time ran out.
+        """
+        pending_chunks = []
+        skipped = 0
+        for partition_key_value, chunks in series_chunks.items():
+            completed_chunk_ids = self.checkpoint_store.get_completed_chunk_ids(partition_key_value)
+            for chunk in chunks:
+                if self.checkpoint_store.format_chunk_id(chunk) in completed_chunk_ids:
+                    skipped += 1
+                else:
+                    pending_chunks.append((partition_key_value, chunk))
+
+        summary = {'completed': 0, 'skipped': skipped, 'failed': [], 'remaining': 0}
+        self.logger.info(f"Backfilling {len(pending_chunks)} chunks. Skipping {skipped} already completed chunks.")
+
+        series_write_locks = defaultdict(threading.Lock)
+
+        def run_chunk(partition_key_value, chunk):
+            chunk_data = fetch_chunk(partition_key_value, chunk)
+            with series_write_locks[partition_key_value]:
+                store_chunk(partition_key_value, chunk, chunk_data)
+            self.checkpoint_store.mark_completed(partition_key_value, chunk)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='backfill') as executor:
+            running_futures = {}
+            while pending_chunks or running_futures:
+                # Keep the pool full while there is time left to finish more chunks
+                while pending_chunks and len(running_futures) < self.max_workers and self._has_time_left():
+                    partition_key_value, chunk = pending_chunks.pop(0)
+                    future = executor.submit(run_chunk, partition_key_value, chunk)
+                    running_futures[future] = (partition_key_value, chunk)
+
+                if not running_futures:
+                    break
+                done_futures, _ = wait(running_futures, return_when=FIRST_COMPLETED)
+                for future in done_futures:
+                    partition_key_value, chunk = running_futures.pop(future)
+                    try:
+                        future.result()
+                        summary['completed'] += 1
+                    except Exception as e:
+                        chunk_description = f"{partition_key_value} {self.checkpoint_store.format_chunk_id(chunk)}"
+                        self.logger.error(f"Backfill chunk {chunk_description} failed.\nDetails: {str(e)}")
+                        summary['failed'].append(chunk_description)
+
+        summary['remaining'] = len(pending_chunks)
+        if pending_chunks:
+            self.logger.info(f"Stopped before the Lambda timeout with {len(pending_chunks)} chunks remaining. Rerun "
+                             f"the backfill to resume.")
+        return summary
@@ -0,0 +1,4 @@
+from .benchmark_harness import BenchmarkHarness, SCENARIOS
+from .local_dynamodb import LocalDynamoDbResource, LocalDynamoDbTable
+from .stub_api_server import StubApiServer
+from .stub_aws_variable_retriever import StubAwsVariableRetriever
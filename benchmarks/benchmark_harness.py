@@ -0,0 +1,308 @@
+from contextlib import contextmanager, ExitStack
+from datetime import date, datetime, timedelta
+import importlib
+import json
+import os
+import sys
+import tempfile
+import time
+import types
+import uuid
+from unittest import mock
+
+from metrics_management import MetricsRecorder
+
+from .local_dynamodb import LocalDynamoDbResource
+from .stub_api_server import StubApiServer
+from .stub_aws_variable_retriever import StubAwsVariableRetriever
+
+
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DB_TABLE_NAME = 'pet_adoption_and_us_economy'
+DB_PARTITION_KEY_NAME = 'series'
+DB_SORT_KEY_NAME = 'month'
+
+FRED_REQUESTS = {
+    'gdp': {'series_id': 'GDP'},
+    'retail_sales': {'series_id': 'RSXFS'},
+    'unemployment_rate': {'series_id': 'UNRATE'},
+    'cpi': {'series_id': 'CPALTT01USM657N'},
+    'federal_funds_rate': {'series_id': 'DFF'}
+}
+
+PF_REQUESTS = {
+    'dogs': {'category': 'animals', 'parameters': {'type': 'dog'}},
+    'cats': {'category': 'animals', 'parameters': {'type': 'cat'}}
+}
+
+PF_STATE_REQUESTS = {
+    f'{species}_by_state': {'category': 'animals', 'parameters': {'type': species.rstrip('s')}, 'states': 'all'}
+    for species in ('dogs', 'cats')
+}
+
+# Scenarios with 'seed_history' load the table (and export) with the clock set back a day before the measured runs,
+# so the measured runs pick up one new day. Scenarios with 'backfill' invoke the FRED and Petfinder backfill_handler
+# instead of lambda_handler.
+SCENARIOS = {
+    'daily_update': {
+        'description': "One day of new data on top of existing history",
+        'seed_history': True,
+        'pf_requests': PF_REQUESTS
+    },
+    'full_backfill': {
+        'description': "First load of every series into an empty table",
+        'seed_history': False,
+        'pf_requests': PF_REQUESTS
+    },
+    'state_fan_out': {
+        'description': "Daily Petfinder update of dogs and cats in each of the 50 states",
+        'seed_history': True,
+        'pf_requests': PF_STATE_REQUESTS
+    },
+    'backfill': {
+        'description': "Chunked, checkpointed backfill of every series into an empty table",
+        'seed_history': False,
+        'backfill': True,
+        'pf_requests': PF_REQUESTS
+    }
+}
+
+LAMBDA_MODULE_NAMES = {
+    'pf_access_token': 'petfinder_generate_access_token.lambda_function',
+    'fred': 'fred_lambda.lambda_function',
+    'petfinder': 'petfinder_lambda.lambda_function',
+    'export': 'export_lambda.lambda_function'
+}
+
+
+def _create_shifted_clock_classes(offset: timedelta) -> tuple[type, type]:
+    """
+    :return: (date, datetime) subclasses whose today() and now() are offset from the system clock
+    """
+    class ShiftedDate(date):
+
+        @classmethod
+        def today(cls):
+            return date.today() + offset
+
+    class ShiftedDatetime(datetime):
+
+        @classmethod
+        def now(cls, tz=None):
+            return datetime.now(tz) + offset
+
+        @classmethod
+        def today(cls):
+            return datetime.today() + offset
+
+    return ShiftedDate, ShiftedDatetime
+
+
+def _purge_project_modules():
+    """
+    Removes the repository's modules, other than the benchmarks package, from sys.modules, so they're imported again
+    from scratch.
+    """
+    for module_name, module in list(sys.modules.items()):
+        module_path = os.path.abspath(getattr(module, '__file__', None) or '')
+        if module_path.startswith(REPOSITORY_DIR + os.sep) and not module_path.startswith(BENCHMARKS_DIR + os.sep):
+            del sys.modules[module_name]
+
+
+class LambdaContextStub:
+
+    def __init__(self, function_name, timeout_seconds=900):
+        self.function_name = function_name
+        self.function_version = '$LATEST'
+        self.memory_limit_in_mb = 128
+        self.invoked_function_arn = f'arn:aws:lambda:us-east-1:000000000000:function:{function_name}'
+        self.aws_request_id = str(uuid.uuid4())
+        self._deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+
+class BenchmarkHarness:
+    """
+    Drives the lambda_handler of each Lambda end to end against local stand-ins: StubApiServer for FRED and Petfinder,
+    LocalDynamoDbResource for DynamoDB and StubAwsVariableRetriever for parameters and secrets. No AWS or API
+    credentials are needed, and nothing leaves the machine.
+    """
+
+    def __init__(self, latency_seconds: float = 0.0, error_rate: float = 0.0, fred_history_start='1954-07-01',
+                 config_overrides: dict = None):
+        """
+
+        :param latency_seconds: Latency added to every stub API response
+        :param error_rate: Fraction of stub API requests answered with a 503
+        :param fred_history_start: First observation date of the synthetic FRED series
+        :param config_overrides: Values merged into the 'configs' parameter, e.g. {'fred_max_concurrency': 4}
+        """
+        self.stub_api_server = StubApiServer(latency_seconds=latency_seconds,
+                                             error_rate=error_rate,
+                                             fred_history_start=fred_history_start)
+        self.fred_history_start = fred_history_start
+        self.config_overrides = config_overrides or {}
+        self.local_dynamodb = None
+        self.lambda_modules = {}
+        # The Lambdas' metrics go to a JSON lines file instead of EMF logs, and each invocation's line is summarized
+        # into its measurements
+        self.metrics_json_path = os.path.join(tempfile.mkdtemp(prefix='benchmark_metrics_'), 'metrics.jsonl')
+        self.export_dir = None
+
+    def _create_configs(self) -> dict:
+        base_url = self.stub_api_server.base_url
+        configs = {
+            'db_table_name': DB_TABLE_NAME,
+            'db_partition_key_name': DB_PARTITION_KEY_NAME,
+            'db_sort_key_name': DB_SORT_KEY_NAME,
+            'db_fred_values_attribute_name': 'values',
+            'db_pf_values_attribute_name': 'values',
+            'default_data_start_date': self.fred_history_start,
+            'fred_api_url': f'{base_url}/fred/series/observations',
+            'fred_api_key': 'benchmark',
+            'petfinder_api_url': f'{base_url}/petfinder/',
+            'pf_token_url': f'{base_url}/petfinder/oauth2/token',
+            'pf_api_key': 'benchmark',
+            'pf_secret_key': 'benchmark',
+            'http_backoff_base_seconds': 0.01,
+            'http_backoff_max_seconds': 0.1,
+            # Scenarios seed history and rerun the Lambdas against one table, which would use up the real daily quota
+            'pf_daily_request_quota': 1000000,
+            'export_dir': self.export_dir
+        }
+        configs.update(self.config_overrides)
+        return configs
+
+    def _load_lambda_modules(self):
+        """
+        Imports the Lambda modules and every project module they use from scratch, so none of the module level caches
+        of a previous scenario carry over and each scenario's init profiles time the project imports. Third-party
+        packages (NumPy, boto3, Powertools) can't be imported twice in one process, so their init stages are only
+        cold in the first scenario and read about 0 s afterwards.
+        """
+        for env_name, env_value in {'AWS_SESSION_TOKEN': 'benchmark',
+                                    'AWS_REGION': 'us-east-1',
+                                    'PARAMETERS_SECRETS_EXTENSION_HTTP_PORT': '2773',
+                                    'ENV': 'benchmark',
+                                    'FRED_PROJECT_NAME': 'benchmark',
+                                    'POWERTOOLS_LOG_LEVEL': 'WARNING'}.items():
+            os.environ.setdefault(env_name, env_value)
+        os.environ['METRICS_SINKS'] = 'json'
+        os.environ['METRICS_JSON_PATH'] = self.metrics_json_path
+
+        # The Lambdas import AwsVariableRetriever from aws_cache_retrieval, so the stand-in module has to be in place
+        # before they are invoked
+        aws_cache_retrieval_module = types.ModuleType('aws_cache_retrieval')
+        aws_cache_retrieval_module.AwsVariableRetriever = StubAwsVariableRetriever
+        sys.modules['aws_cache_retrieval'] = aws_cache_retrieval_module
+
+        _purge_project_modules()
+        for lambda_name, module_name in LAMBDA_MODULE_NAMES.items():
+            self.lambda_modules[lambda_name] = importlib.import_module(module_name)
+
+    @contextmanager
+    def _shift_clock(self, offset: timedelta):
+        """
+        Moves the clock of the stub APIs and of the Lambda modules (their 'date' and 'datetime' globals) by the offset.
+        """
+        shifted_date, shifted_datetime = _create_shifted_clock_classes(offset)
+        with ExitStack() as exit_stack:
+            for lambda_module in self.lambda_modules.values():
+                for global_name, shifted_class in (('date', shifted_date), ('datetime', shifted_datetime)):
+                    if hasattr(lambda_module, global_name):
+                        exit_stack.enter_context(mock.patch.object(lambda_module, global_name, new=shifted_class))
+            self.stub_api_server.clock_offset = offset
+            try:
+                yield
+            finally:
+                self.stub_api_server.clock_offset = timedelta(0)
+
+    def _create_backfill_events(self) -> dict:
+        """
+        :return: {lambda name: backfill_handler event}. Petfinder is backfilled over the stub's history rather than from
+            'default_data_start_date', which would be decades of synthetic animals.
+        """
+        pf_start_date = date.today() - timedelta(days=self.stub_api_server.pf_history_days)
+        return {
+            'fred': {},
+            'petfinder': {'start_date': pf_start_date.isoformat()}
+        }
+
+    def _invoke(self, lambda_name: str, handler_name: str = 'lambda_handler', event: dict = None) -> dict:
+        context = LambdaContextStub(function_name=lambda_name)
+        self.stub_api_server.reset_stats()
+        self.local_dynamodb.reset_stats()
+
+        start_time = time.perf_counter()
+        getattr(self.lambda_modules[lambda_name], handler_name)(event or {}, context)
+        wall_seconds = time.perf_counter() - start_time
+
+        with open(self.metrics_json_path) as metrics_file:
+            # The handler appends one line per invocation, so the last line is this invocation's
+            data_points = json.loads(metrics_file.readlines()[-1])['data_points']
+
+        return {
+            'wall_seconds': round(wall_seconds, 4),
+            'http_requests': sum(self.stub_api_server.request_counts.values()),
+            'http_errors': sum(self.stub_api_server.error_counts.values()),
+            'http_response_bytes': sum(self.stub_api_server.response_bytes.values()),
+            'dynamodb_requests': dict(self.local_dynamodb.request_counts),
+            'dynamodb_read_units': self.local_dynamodb.read_units,
+            'dynamodb_write_units': self.local_dynamodb.write_units,
+            'metrics': MetricsRecorder.summarize(data_points)
+        }
+
+    def run_scenario(self, scenario_name: str) -> dict:
+        """
+        :return: {'scenario': name, 'description': str, 'items_stored': int, 'lambdas': {lambda name: measurements},
+            'init_profiles': {lambda name: init profile report}}
+        """
+        scenario = SCENARIOS[scenario_name]
+        self._load_lambda_modules()
+        # Every scenario exports into an empty directory, like its empty table
+        self.export_dir = tempfile.mkdtemp(prefix=f'benchmark_export_{scenario_name}_')
+
+        StubAwsVariableRetriever.parameters = {
+            'configs': self._create_configs(),
+            'fred_requests': FRED_REQUESTS,
+            'pf_requests': scenario['pf_requests']
+        }
+        StubAwsVariableRetriever.secrets = {'pf_access_token': ''}
+        self.local_dynamodb = LocalDynamoDbResource(partition_key_name=DB_PARTITION_KEY_NAME,
+                                                    sort_key_name=DB_SORT_KEY_NAME)
+
+        local_dynamodb = self.local_dynamodb
+        # Patched on the freshly imported class the Lambdas use
+        dynamodb_manager_class = importlib.import_module('dynamodb_management').DynamoDbManager
+        with mock.patch.object(dynamodb_manager_class, 'dynamodb_resource', new=property(lambda self: local_dynamodb)):
+            if scenario['seed_history']:
+                # Untimed first load as of yesterday, so the measured runs have one new day to pick up
+                with self._shift_clock(timedelta(days=-1)):
+                    self._invoke('fred')
+                    self._invoke('petfinder')
+                    self._invoke('export')
+
+            backfill_events = self._create_backfill_events() if scenario.get('backfill') else {}
+            lambda_measurements = {
+                lambda_name: self._invoke(lambda_name, handler_name='backfill_handler',
+                                          event=backfill_events[lambda_name])
+                if lambda_name in backfill_events else self._invoke(lambda_name)
+                for lambda_name in LAMBDA_MODULE_NAMES
+            }
+
+        return {
+            'scenario': scenario_name,
+            'description': scenario['description'],
+            'items_stored': self.local_dynamodb.item_count(),
+            'lambdas': lambda_measurements,
+            'init_profiles': {lambda_name: lambda_module.init_profiler.report()
+                              for lambda_name, lambda_module in self.lambda_modules.items()}
+        }
+
+    def run(self, scenario_names: list[str] = None) -> list[dict]:
+        with self.stub_api_server:
+            return [self.run_scenario(scenario_name) for scenario_name in (scenario_names or list(SCENARIOS))]
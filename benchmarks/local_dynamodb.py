@@ -0,0 +1,341 @@
+import copy
+from decimal import Decimal
+import math
+import re
+import threading
+
+from botocore.exceptions import ClientError
+
+from dynamodb_management.dynamodb_manager import estimate_item_size
+
+
+class LocalDynamoDbTable:
+    """
+    In-memory stand-in for a boto3 DynamoDB Table resource. Supports the subset of the Table API used by
+    DynamoDbManager and counts requests and billed read/write units the way DynamoDB would. Reads without
+    ConsistentRead are eventually consistent and billed at half the strongly consistent rate.
+    """
+
+    READ_UNIT_BYTES = 4096
+    WRITE_UNIT_BYTES = 1024
+
+    def __init__(self, local_resource, name, partition_key_name, sort_key_name):
+        self.local_resource = local_resource
+        self.name = name
+        self.partition_key_name = partition_key_name
+        self.sort_key_name = sort_key_name
+        # {partition key value: {sort key value: item}}
+        self.partitions = {}
+
+    def _key(self, item_or_key):
+        return item_or_key[self.partition_key_name], item_or_key[self.sort_key_name]
+
+    def _get(self, key) -> dict:
+        partition_key_value, sort_key_value = self._key(key)
+        return self.partitions.get(partition_key_value, {}).get(sort_key_value)
+
+    def _put(self, item):
+        partition_key_value, sort_key_value = self._key(item)
+        self.partitions.setdefault(partition_key_value, {})[sort_key_value] = copy.deepcopy(item)
+
+    def _consumed_capacity(self, capacity_units, kwargs):
+        if kwargs.get('ReturnConsumedCapacity', 'NONE') == 'NONE':
+            return {}
+        return {'ConsumedCapacity': {'TableName': self.name, 'CapacityUnits': capacity_units}}
+
+    def read_units(self, item) -> int:
+        return math.ceil(estimate_item_size(item) / self.READ_UNIT_BYTES) if item else 0
+
+    @staticmethod
+    def billed_read_units(read_units, consistent_read) -> float:
+        return read_units if consistent_read else read_units / 2
+
+    def write_units(self, item) -> int:
+        return max(1, math.ceil(estimate_item_size(item) / self.WRITE_UNIT_BYTES)) if item else 1
+
+    def get_item(self, Key, **kwargs):
+        with self.local_resource.lock:
+            item = self._get(Key)
+            capacity_units = self.billed_read_units(max(1, self.read_units(item)), kwargs.get('ConsistentRead'))
+            self.local_resource.record('GetItem', read_units=capacity_units)
+            response = {'Item': copy.deepcopy(item)} if item else {}
+            response.update(self._consumed_capacity(capacity_units, kwargs))
+            return response
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeNames=None,
+                 ExpressionAttributeValues=None, **kwargs):
+        with self.local_resource.lock:
+            existing_item = self._get(Item)
+            if ConditionExpression and not evaluate_condition(ConditionExpression, existing_item or {},
+                                                              ExpressionAttributeNames or {},
+                                                              ExpressionAttributeValues or {}):
+                self.local_resource.record('PutItem', write_units=1)
+                raise conditional_check_failed('PutItem')
+            capacity_units = max(self.write_units(Item), self.write_units(existing_item))
+            self._put(Item)
+            self.local_resource.record('PutItem', write_units=capacity_units)
+            return self._consumed_capacity(capacity_units, kwargs)
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+                    ConditionExpression=None, **kwargs):
+        attribute_names = ExpressionAttributeNames or {}
+        attribute_values = ExpressionAttributeValues or {}
+        with self.local_resource.lock:
+            existing_item = self._get(Key)
+            if ConditionExpression and not evaluate_condition(ConditionExpression, existing_item or {},
+                                                              attribute_names, attribute_values):
+                self.local_resource.record('UpdateItem', write_units=1)
+                raise conditional_check_failed('UpdateItem')
+
+            item = copy.deepcopy(existing_item) if existing_item else dict(Key)
+            apply_update_expression(UpdateExpression, item, attribute_names, attribute_values)
+            capacity_units = max(self.write_units(item), self.write_units(existing_item))
+            self._put(item)
+            self.local_resource.record('UpdateItem', write_units=capacity_units)
+            return self._consumed_capacity(capacity_units, kwargs)
+
+    def query(self, KeyConditionExpression, ExpressionAttributeNames=None, ExpressionAttributeValues=None,
+              ScanIndexForward=True, Limit=None, **kwargs):
+        attribute_names = ExpressionAttributeNames or {}
+        attribute_values = ExpressionAttributeValues or {}
+        partition_key_value, sort_key_matches = parse_key_condition(KeyConditionExpression, attribute_names,
+                                                                    attribute_values)
+        with self.local_resource.lock:
+            partition = self.partitions.get(partition_key_value, {})
+            sort_key_values = sorted((sort_key_value for sort_key_value in partition
+                                      if sort_key_matches(sort_key_value)), reverse=not ScanIndexForward)
+            if Limit:
+                sort_key_values = sort_key_values[:Limit]
+            items = [copy.deepcopy(partition[sort_key_value]) for sort_key_value in sort_key_values]
+
+            # Query reads are billed on the total size of the returned items, not per item
+            capacity_units = self.billed_read_units(
+                max(1, math.ceil(sum(estimate_item_size(item) for item in items) / self.READ_UNIT_BYTES)),
+                kwargs.get('ConsistentRead')
+            )
+            self.local_resource.record('Query', read_units=capacity_units)
+            response = {'Items': items, 'Count': len(items)}
+            response.update(self._consumed_capacity(capacity_units, kwargs))
+            return response
+
+    def scan(self, FilterExpression=None, ProjectionExpression=None, ExpressionAttributeNames=None,
+             ExpressionAttributeValues=None, **kwargs):
+        attribute_names = ExpressionAttributeNames or {}
+        attribute_values = ExpressionAttributeValues or {}
+        with self.local_resource.lock:
+            scanned_items = [item for partition in self.partitions.values() for item in partition.values()]
+            # Scans are billed on the size of every scanned item, before the filter, at half the strongly consistent
+            # rate. The whole table is returned as one page.
+            capacity_units = max(1, math.ceil(sum(estimate_item_size(item) for item in scanned_items) /
+                                              self.READ_UNIT_BYTES / 2))
+            items = [copy.deepcopy(item) for item in scanned_items
+                     if not FilterExpression or evaluate_condition(FilterExpression, item, attribute_names,
+                                                                   attribute_values)]
+            if ProjectionExpression:
+                projected_names = [attribute_names.get(name.strip(), name.strip())
+                                   for name in ProjectionExpression.split(',')]
+                items = [{name: item[name] for name in projected_names if name in item} for item in items]
+            self.local_resource.record('Scan', read_units=capacity_units)
+            response = {'Items': items, 'Count': len(items)}
+            response.update(self._consumed_capacity(capacity_units, kwargs))
+            return response
+
+
+class LocalDynamoDbResource:
+    """
+    In-memory stand-in for a boto3 DynamoDB ServiceResource, holding LocalDynamoDbTables and the per-operation request
+    and capacity unit counts of every table.
+    """
+
+    def __init__(self, partition_key_name, sort_key_name):
+        self.partition_key_name = partition_key_name
+        self.sort_key_name = sort_key_name
+        self.tables = {}
+        self.lock = threading.RLock()
+        self.request_counts = {}
+        self.read_units = 0
+        self.write_units = 0
+
+    def Table(self, name) -> LocalDynamoDbTable:
+        with self.lock:
+            if name not in self.tables:
+                self.tables[name] = LocalDynamoDbTable(local_resource=self,
+                                                       name=name,
+                                                       partition_key_name=self.partition_key_name,
+                                                       sort_key_name=self.sort_key_name)
+            return self.tables[name]
+
+    def record(self, operation, read_units=0, write_units=0):
+        self.request_counts[operation] = self.request_counts.get(operation, 0) + 1
+        self.read_units += read_units
+        self.write_units += write_units
+
+    def reset_stats(self):
+        with self.lock:
+            self.request_counts = {}
+            self.read_units = 0
+            self.write_units = 0
+
+    def item_count(self) -> int:
+        return sum(len(partition) for table in self.tables.values() for partition in table.partitions.values())
+
+    def batch_get_item(self, RequestItems, ReturnConsumedCapacity='NONE'):
+        responses = {}
+        consumed_capacity = []
+        with self.lock:
+            for table_name, table_request in RequestItems.items():
+                if len(table_request['Keys']) > 100:
+                    raise ValueError("BatchGetItem is limited to 100 keys.")
+                table = self.Table(table_name)
+                items = [table._get(key) for key in table_request['Keys']]
+                items = [copy.deepcopy(item) for item in items if item]
+                responses[table_name] = items
+                capacity_units = table.billed_read_units(sum(max(1, table.read_units(item)) for item in items),
+                                                         table_request.get('ConsistentRead'))
+                consumed_capacity.append({'TableName': table_name, 'CapacityUnits': capacity_units})
+                self.read_units += capacity_units
+            self.request_counts['BatchGetItem'] = self.request_counts.get('BatchGetItem', 0) + 1
+
+        response = {'Responses': responses, 'UnprocessedKeys': {}}
+        if ReturnConsumedCapacity != 'NONE':
+            response['ConsumedCapacity'] = consumed_capacity
+        return response
+
+    def batch_write_item(self, RequestItems, ReturnConsumedCapacity='NONE'):
+        consumed_capacity = []
+        with self.lock:
+            for table_name, write_requests in RequestItems.items():
+                if len(write_requests) > 25:
+                    raise ValueError("BatchWriteItem is limited to 25 items.")
+                table = self.Table(table_name)
+                capacity_units = 0
+                for write_request in write_requests:
+                    item = write_request['PutRequest']['Item']
+                    capacity_units += max(table.write_units(item), table.write_units(table._get(item)))
+                    table._put(item)
+                consumed_capacity.append({'TableName': table_name, 'CapacityUnits': capacity_units})
+                self.write_units += capacity_units
+            self.request_counts['BatchWriteItem'] = self.request_counts.get('BatchWriteItem', 0) + 1
+
+        response = {'UnprocessedItems': {}}
+        if ReturnConsumedCapacity != 'NONE':
+            response['ConsumedCapacity'] = consumed_capacity
+        return response
+
+
+def conditional_check_failed(operation_name) -> ClientError:
+    return ClientError(error_response={'Error': {'Code': 'ConditionalCheckFailedException',
+                                                 'Message': 'The conditional request failed'}},
+                       operation_name=operation_name)
+
+
+def _resolve_path(path: str, attribute_names: dict) -> list[str]:
+    return [attribute_names.get(path_part, path_part) for path_part in path.strip().split('.')]
+
+
+def _get_path(item: dict, path_parts: list[str]):
+    value = item
+    for path_part in path_parts:
+        if not isinstance(value, dict) or path_part not in value:
+            return None
+        value = value[path_part]
+    return value
+
+
+def parse_key_condition(key_condition_expression: str, attribute_names: dict, attribute_values: dict):
+    """
+    Parses key conditions of the form '#pk = :pk [AND <sort key condition>]', where the sort key condition is a
+    comparison, BETWEEN or begins_with.
+
+    :return: (partition key value, function returning whether a sort key value matches)
+    """
+    match = re.fullmatch(r'\s*(\S+)\s*=\s*(:\w+)\s*(?:AND\s+(.+))?', key_condition_expression, flags=re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Unsupported key condition expression: {key_condition_expression}")
+    partition_key_value = attribute_values[match.group(2)]
+    sort_key_condition = match.group(3)
+    if not sort_key_condition:
+        return partition_key_value, lambda sort_key_value: True
+
+    between_match = re.fullmatch(r'\s*\S+\s+BETWEEN\s+(:\w+)\s+AND\s+(:\w+)\s*', sort_key_condition,
+                                 flags=re.IGNORECASE)
+    if between_match:
+        low, high = attribute_values[between_match.group(1)], attribute_values[between_match.group(2)]
+        return partition_key_value, lambda sort_key_value: low <= sort_key_value <= high
+
+    begins_with_match = re.fullmatch(r'\s*begins_with\(\s*\S+\s*,\s*(:\w+)\s*\)\s*', sort_key_condition)
+    if begins_with_match:
+        prefix = attribute_values[begins_with_match.group(1)]
+        return partition_key_value, lambda sort_key_value: sort_key_value.startswith(prefix)
+
+    comparison_match = re.fullmatch(r'\s*\S+\s*(=|<=|>=|<|>)\s*(:\w+)\s*', sort_key_condition)
+    if comparison_match:
+        operator, value = comparison_match.group(1), attribute_values[comparison_match.group(2)]
+        comparisons = {
+            '=': lambda sort_key_value: sort_key_value == value,
+            '<': lambda sort_key_value: sort_key_value < value,
+            '<=': lambda sort_key_value: sort_key_value <= value,
+            '>': lambda sort_key_value: sort_key_value > value,
+            '>=': lambda sort_key_value: sort_key_value >= value
+        }
+        return partition_key_value, comparisons[operator]
+
+    raise ValueError(f"Unsupported sort key condition: {sort_key_condition}")
+
+
+def _compare(value, operator: str, other) -> bool:
+    if operator == '=':
+        return value == other
+    if operator == '<>':
+        return value != other
+    if value is None:
+        # Ordering comparisons are false for missing attributes, as in DynamoDB
+        return False
+    return {'<': value < other, '<=': value <= other, '>': value > other, '>=': value >= other}[operator]
+
+
+def evaluate_condition(condition_expression: str, item: dict, attribute_names: dict, attribute_values: dict) -> bool:
+    """
+    Evaluates condition expressions made of attribute_exists(path), attribute_not_exists(path) and comparison
+    ('path = :value', '<>', '<', '<=', '>', '>=') clauses joined by OR or AND (without mixing the two).
+    """
+    joiner = ' OR ' if ' OR ' in condition_expression.upper() else ' AND '
+    clauses = re.split(joiner, condition_expression, flags=re.IGNORECASE)
+    results = []
+    for clause in clauses:
+        clause = clause.strip()
+        function_match = re.fullmatch(r'(attribute_exists|attribute_not_exists)\(\s*(\S+?)\s*\)', clause)
+        if function_match:
+            exists = _get_path(item, _resolve_path(function_match.group(2), attribute_names)) is not None
+            results.append(exists if function_match.group(1) == 'attribute_exists' else not exists)
+            continue
+        comparison_match = re.fullmatch(r'(\S+)\s*(=|<>|<=|>=|<|>)\s*(:\w+)', clause)
+        if comparison_match:
+            value = _get_path(item, _resolve_path(comparison_match.group(1), attribute_names))
+            results.append(_compare(value, comparison_match.group(2), attribute_values[comparison_match.group(3)]))
+            continue
+        raise ValueError(f"Unsupported condition expression clause: {clause}")
+    return any(results) if joiner == ' OR ' else all(results)
+
+
+def apply_update_expression(update_expression: str, item: dict, attribute_names: dict, attribute_values: dict):
+    """
+    Applies update expressions made of 'SET path = :value, ...' and 'ADD path :number, ...' sections. Paths may be
+    nested map paths, e.g. '#vals.#day'.
+    """
+    sections = re.split(r'\b(SET|ADD)\b', update_expression, flags=re.IGNORECASE)
+    for action, actions_str in zip(sections[1::2], sections[2::2]):
+        for update_action in filter(None, (action_str.strip() for action_str in actions_str.split(','))):
+            if action.upper() == 'SET':
+                path, value_name = (part.strip() for part in update_action.split('='))
+                value = copy.deepcopy(attribute_values[value_name])
+            else:
+                path, value_name = update_action.split()
+                existing_value = _get_path(item, _resolve_path(path, attribute_names)) or 0
+                value = Decimal(str(existing_value)) + Decimal(str(attribute_values[value_name]))
+
+            path_parts = _resolve_path(path, attribute_names)
+            parent = item
+            for path_part in path_parts[:-1]:
+                parent = parent.setdefault(path_part, {})
+            parent[path_parts[-1]] = value
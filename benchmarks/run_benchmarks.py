@@ -0,0 +1,76 @@
+"""
+Runs the offline benchmark scenarios and prints a report.
+
+Usage, from the repository root:
+    python -m benchmarks.run_benchmarks [--scenario daily_update] [--latency 0.05] [--error-rate 0.1]
+                                        [--config fred_max_concurrency=4] [--json bench_output.json]
+"""
+import argparse
+import json
+
+from .benchmark_harness import BenchmarkHarness, SCENARIOS
+
+
+def parse_config_override(config_override: str) -> tuple[str, object]:
+    name, value = config_override.split('=', 1)
+    try:
+        return name, json.loads(value)
+    except json.JSONDecodeError:
+        return name, value
+
+
+def format_report(scenario_results: list[dict]) -> str:
+    lines = []
+    header = f"{'lambda':<16}{'wall s':>10}{'http req':>10}{'http err':>10}{'http bytes':>12}{'db req':>8}" \
+             f"{'RCU':>8}{'WCU':>8}"
+    for scenario_result in scenario_results:
+        lines.append(f"== {scenario_result['scenario']}: {scenario_result['description']} "
+                     f"({scenario_result['items_stored']} items stored)")
+        lines.append(header)
+        for lambda_name, measurements in scenario_result['lambdas'].items():
+            lines.append(f"{lambda_name:<16}{measurements['wall_seconds']:>10.3f}{measurements['http_requests']:>10}"
+                         f"{measurements['http_errors']:>10}{measurements['http_response_bytes']:>12}"
+                         f"{sum(measurements['dynamodb_requests'].values()):>8}"
+                         f"{measurements['dynamodb_read_units']:>8g}{measurements['dynamodb_write_units']:>8g}")
+        for lambda_name, measurements in scenario_result['lambdas'].items():
+            metrics = measurements['metrics']
+            lines.append(f"{lambda_name} metrics: " + ', '.join(
+                f"{metric_name} {metrics[metric_name]['sum']:g} {metrics[metric_name]['unit'].lower()} over "
+                f"{metrics[metric_name]['count']}"
+                for metric_name in ('api_latency', 'api_retries', 'json_decode_time', 'dynamodb_latency',
+                                    'dynamodb_consumed_capacity')
+                if metric_name in metrics))
+        for lambda_name, init_profile in scenario_result['init_profiles'].items():
+            stage_seconds = ', '.join(f"{stage_name} {seconds:.3f}s"
+                                      for stage_name, seconds in init_profile['stage_seconds'].items())
+            lines.append(f"{lambda_name} init {init_profile['init_seconds']:.3f}s ({stage_seconds})")
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the FRED and Petfinder Lambdas.")
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                        help="Scenario to run. May be repeated. Runs every scenario by default.")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds of latency per stub API response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of stub API requests that fail")
+    parser.add_argument('--fred-history-start', default='1954-07-01', help="First date of the synthetic FRED series")
+    parser.add_argument('--config', action='append', default=[], type=parse_config_override,
+                        help="Override of a 'configs' value as name=value. May be repeated.")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    harness = BenchmarkHarness(latency_seconds=args.latency,
+                               error_rate=args.error_rate,
+                               fred_history_start=args.fred_history_start,
+                               config_overrides=dict(args.config))
+    scenario_results = harness.run(scenario_names=args.scenario)
+    print(format_report(scenario_results))
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(scenario_results, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+from datetime import date, datetime, timedelta
+import gzip
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import math
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+
+# Update frequency of the synthetic FRED series, in the same terms as the README. Unknown series are monthly.
+FRED_SERIES_FREQUENCIES = {
+    'DFF': 'daily',
+    'GDP': 'quarterly'
+}
+
+PF_SPECIES = [('Dog', 'Dog'), ('Cat', 'Cat'), ('Rabbit', 'Rabbit')]
+PF_SIZES = ['Small', 'Medium', 'Large', 'Extra Large']
+US_STATES = ['AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA', 'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY', 'LA',
+             'ME', 'MD', 'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ', 'NM', 'NY', 'NC', 'ND', 'OH', 'OK',
+             'OR', 'PA', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY']
+
+
+class StubApiServer:
+    """
+    Local HTTP server standing in for the FRED observations API and the Petfinder '/animals' and OAuth token endpoints.
+    Responses are synthetic and deterministic. Latency and error injection are configurable, and the server counts
+    requests and response bytes per path.
+
+    The server has its own clock, which can be moved with clock_offset. Petfinder animals are published evenly through
+    each day up to the clock's current time, so today is a partial day, and FRED observations end at the clock's
+    date.
+
+    Endpoints:
+        GET /fred/series/observations
+        GET /petfinder/animals
+        POST /petfinder/oauth2/token
+    """
+
+    def __init__(self, latency_seconds: float = 0.0, error_rate: float = 0.0, pf_animals_per_day: int = 200,
+                 pf_location_animals_per_day: int = 20, pf_history_days: int = 30, fred_history_start='1954-07-01',
+                 pf_rate_limit_per_second: int = 50, seed: int = 0):
+        """
+
+        :param latency_seconds: Sleep before every response
+        :param error_rate: Fraction of requests answered with a 503 (and 'Retry-After: 0')
+        :param pf_animals_per_day: Animals published per day for requests without a 'location'
+        :param pf_location_animals_per_day: Animals published per day for requests with a 'location'
+        :param pf_history_days: Days of animals returned for requests without an 'after' parameter
+        :param fred_history_start: First observation date of every FRED series
+        :param pf_rate_limit_per_second: Limit reported in the X-RateLimit headers of Petfinder '/animals' responses,
+            which count requests per second rather than per day
+        :param seed: Seed of the error injection
+        """
+        self.latency_seconds = latency_seconds
+        self.error_rate = error_rate
+        self.pf_animals_per_day = pf_animals_per_day
+        self.pf_location_animals_per_day = pf_location_animals_per_day
+        self.pf_history_days = pf_history_days
+        self.fred_history_start = date.fromisoformat(fred_history_start)
+        self.clock_offset = timedelta(0)
+        self.pf_rate_limit_per_second = pf_rate_limit_per_second
+        self._rate_limit_second = None
+        self._rate_limit_requests = 0
+
+        self._random = random.Random(seed)
+        self._stats_lock = threading.Lock()
+        self.request_counts = {}
+        self.response_bytes = {}
+        self.error_counts = {}
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._create_handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self.request_counts = {}
+            self.response_bytes = {}
+            self.error_counts = {}
+
+    def _record(self, path, num_bytes, is_error):
+        with self._stats_lock:
+            self.request_counts[path] = self.request_counts.get(path, 0) + 1
+            self.response_bytes[path] = self.response_bytes.get(path, 0) + num_bytes
+            if is_error:
+                self.error_counts[path] = self.error_counts.get(path, 0) + 1
+
+    def now(self) -> datetime:
+        return datetime.now() + self.clock_offset
+
+    def pf_rate_limit_headers(self) -> dict:
+        with self._stats_lock:
+            current_second = int(time.time())
+            if current_second != self._rate_limit_second:
+                self._rate_limit_second, self._rate_limit_requests = current_second, 0
+            self._rate_limit_requests += 1
+            return {
+                'X-RateLimit-Limit': str(self.pf_rate_limit_per_second),
+                'X-RateLimit-Remaining': str(max(0, self.pf_rate_limit_per_second - self._rate_limit_requests))
+            }
+
+    def _should_fail(self) -> bool:
+        with self._stats_lock:
+            return self._random.random() < self.error_rate
+
+    def fred_observations(self, query: dict) -> dict:
+        series_id = query['series_id']
+        frequency = FRED_SERIES_FREQUENCIES.get(series_id, 'monthly')
+        start = max(date.fromisoformat(query.get('observation_start', self.fred_history_start.isoformat())),
+                    self.fred_history_start)
+        today = self.now().date()
+        end = min(date.fromisoformat(query['observation_end']), today) if 'observation_end' in query else today
+
+        observations = []
+        day = start
+        while day <= end:
+            is_observation_day = (frequency == 'daily'
+                                  or (day.day == 1 and (frequency == 'monthly' or day.month in (1, 4, 7, 10))))
+            if is_observation_day:
+                ordinal = day.toordinal()
+                # FRED reports missing observations as '.'
+                value = '.' if ordinal % 97 == 0 else f'{(ordinal % 1000) / 100:.2f}'
+                observations.append({
+                    'realtime_start': today.isoformat(),
+                    'realtime_end': today.isoformat(),
+                    'date': day.isoformat(),
+                    'value': value
+                })
+            day += timedelta(days=1)
+
+        return {
+            'observation_start': start.isoformat(),
+            'observation_end': end.isoformat(),
+            'units': 'lin',
+            'count': len(observations),
+            'offset': 0,
+            'limit': 100000,
+            'observations': observations
+        }
+
+    def pf_animals(self, query: dict) -> dict:
+        now = self.now()
+        today = datetime.combine(now.date(), datetime.min.time())
+        after = datetime.fromisoformat(query['after'].rstrip('Z')) if 'after' in query \
+            else today - timedelta(days=self.pf_history_days)
+        # Nothing is published after the current time, so a request without 'before' gets part of today
+        before = min(datetime.fromisoformat(query['before'].rstrip('Z')), now) if 'before' in query else now
+        location = query.get('location')
+        animals_per_day = self.pf_location_animals_per_day if location else self.pf_animals_per_day
+        seconds_per_animal = 86400 / animals_per_day
+
+        # Animal i is published at after + i * seconds_per_animal
+        total_count = max(0, math.ceil((before - after).total_seconds() / seconds_per_animal))
+        limit = int(query.get('limit', 20))
+        page = int(query.get('page', 1))
+        total_pages = max(1, -(-total_count // limit))
+
+        animals = []
+        for animal_index in range((page - 1) * limit, min(page * limit, total_count)):
+            published_at = after + timedelta(seconds=animal_index * seconds_per_animal)
+            species_type, species = PF_SPECIES[animal_index % len(PF_SPECIES)]
+            if 'type' in query:
+                species_type = species = query['type'].capitalize()
+            animals.append({
+                'id': animal_index,
+                'type': species_type,
+                'species': species,
+                'size': PF_SIZES[(animal_index // len(PF_SPECIES)) % len(PF_SIZES)],
+                'status': 'adoptable',
+                'published_at': published_at.strftime('%Y-%m-%dT%H:%M:%S+0000'),
+                'contact': {
+                    'address': {
+                        'state': location or US_STATES[animal_index % len(US_STATES)]
+                    }
+                }
+            })
+
+        return {
+            'animals': animals,
+            'pagination': {
+                'count_per_page': limit,
+                'total_count': total_count,
+                'current_page': page,
+                'total_pages': total_pages
+            }
+        }
+
+    def _create_handler_class(self):
+        stub_api_server = self
+
+        class StubApiRequestHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately, which would otherwise stall keep-alive clients on delayed ACKs
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status_code: int, body: dict, path: str, headers: dict = None):
+                body_bytes = json.dumps(body).encode('utf-8')
+                if 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    body_bytes = gzip.compress(body_bytes, compresslevel=5)
+                    headers = dict(headers or {}, **{'Content-Encoding': 'gzip'})
+
+                self.send_response(status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body_bytes)))
+                for header_name, header_value in (headers or {}).items():
+                    self.send_header(header_name, header_value)
+                self.end_headers()
+                self.wfile.write(body_bytes)
+                stub_api_server._record(path=path, num_bytes=len(body_bytes), is_error=status_code >= 400)
+
+            def _handle(self, routes: dict, headers_function=None):
+                parsed_url = urlparse(self.path)
+                content_length = int(self.headers.get('Content-Length', 0))
+                if content_length:
+                    self.rfile.read(content_length)
+
+                if stub_api_server.latency_seconds:
+                    time.sleep(stub_api_server.latency_seconds)
+
+                route = routes.get(parsed_url.path)
+                if route is None:
+                    self._send_json(404, {'message': 'Not Found'}, path=parsed_url.path)
+                    return
+                if stub_api_server._should_fail():
+                    self._send_json(503, {'message': 'Injected error'}, path=parsed_url.path,
+                                    headers={'Retry-After': '0'})
+                    return
+
+                query = {name: values[-1] for name, values in parse_qs(parsed_url.query).items()}
+                self._send_json(200, route(query), path=parsed_url.path,
+                                headers=headers_function(parsed_url.path) if headers_function else None)
+
+            def do_GET(self):
+                self._handle({
+                    '/fred/series/observations': stub_api_server.fred_observations,
+                    '/petfinder/animals': stub_api_server.pf_animals
+                }, headers_function=lambda path: stub_api_server.pf_rate_limit_headers()
+                    if path.startswith('/petfinder/') else None)
+
+            def do_POST(self):
+                self._handle({
+                    '/petfinder/oauth2/token': lambda query: {
+                        'token_type': 'Bearer',
+                        'expires_in': 3600,
+                        'access_token': f'stub-token-{time.time_ns()}'
+                    }
+                })
+
+        return StubApiRequestHandler
@@ -0,0 +1,31 @@
+import json
+
+
+class StubAwsVariableRetriever:
+    """
+    Stand-in for aws_cache_retrieval.AwsVariableRetriever that serves parameters and secrets from memory instead of
+    the Parameters and Secrets Lambda extension. The values are class level, so the retrievers the Lambdas construct at
+    import time serve whatever the benchmark harness sets.
+    """
+
+    parameters = {}
+    secrets = {}
+    retrieval_counts = {}
+
+    def __init__(self, cache_port=None, project_name=None, aws_session_token=None):
+        self.cache_port = cache_port
+        self.project_name = project_name
+        self.aws_session_token = aws_session_token
+
+    @classmethod
+    def _count(cls, name):
+        cls.retrieval_counts[name] = cls.retrieval_counts.get(name, 0) + 1
+
+    def retrieve_parameter_value(self, parameter_name, expect_json=False):
+        self._count(parameter_name)
+        value = self.parameters[parameter_name]
+        return json.dumps(value) if expect_json else value
+
+    def retrieve_secret_value(self, secret_name):
+        self._count(secret_name)
+        return self.secrets[secret_name]
@@ -0,0 +1 @@
+from .chart_query_engine import ChartQueryEngine, MonthValuesCache
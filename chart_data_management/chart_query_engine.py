@@ -0,0 +1,261 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+import logging
+import threading
+import time
+from typing import Union
+
+import numpy as np
+
+
+EMPTY_DATES = np.array([], dtype='datetime64[D]')
+EMPTY_VALUES = np.array([], dtype=np.float64)
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        # FRED reports missing observations as '.'
+        return np.nan
+
+
+def month_values_to_arrays(month_values: dict) -> tuple[np.ndarray, np.ndarray]:
+    """
+    :param month_values: {date: value}
+    :return: (dates as a sorted datetime64[D] array, values as a float64 array with NaN for missing values)
+    """
+    if not month_values:
+        return EMPTY_DATES, EMPTY_VALUES
+    sorted_dates = sorted(month_values)
+    dates = np.array(sorted_dates, dtype='datetime64[D]')
+    values = np.fromiter((_to_float(month_values[date_str]) for date_str in sorted_dates), dtype=np.float64,
+                         count=len(sorted_dates))
+    return dates, values
+
+
+def months_between(start_date: np.datetime64, end_date: np.datetime64) -> list[str]:
+    """
+    :return: Month sort keys (YYYY-MM) from the month of start_date through the month of end_date
+    """
+    return [str(month) for month in np.arange(start_date.astype('datetime64[M]'),
+                                              end_date.astype('datetime64[M]') + 1)]
+
+
+def create_time_axis(start_date: np.datetime64, end_date: np.datetime64, frequency: str) -> tuple[np.ndarray,
+                                                                                                  np.ndarray]:
+    """
+    :param frequency: 'D' (daily), 'W' (weeks starting on Monday), 'M' (monthly) or 'Q' (quarterly)
+    :return: (first day of each period, last day of each period), as datetime64[D] arrays
+    """
+    if frequency == 'D':
+        period_starts = np.arange(start_date, end_date + 1, dtype='datetime64[D]')
+        return period_starts, period_starts
+    if frequency == 'W':
+        # Day 0 of datetime64 (1970-01-01) is a Thursday, so Mondays are the days where (day + 3) % 7 == 0
+        first_monday = start_date - (start_date.astype(np.int64) + 3) % 7
+        period_starts = np.arange(first_monday, end_date + 1, 7, dtype='datetime64[D]')
+        return period_starts, period_starts + 6
+    if frequency in ('M', 'Q'):
+        months_per_period = 1 if frequency == 'M' else 3
+        first_month = start_date.astype('datetime64[M]')
+        # Month 0 of datetime64 is January, so quarters start on months divisible by 3
+        first_month -= first_month.astype(np.int64) % months_per_period
+        period_months = np.arange(first_month, end_date.astype('datetime64[M]') + 1, months_per_period)
+        return period_months.astype('datetime64[D]'), (period_months + months_per_period).astype('datetime64[D]') - 1
+    raise ValueError(f"Unknown frequency '{frequency}'. Valid frequencies are D, W, M and Q.")
+
+
+def resample(dates: np.ndarray, values: np.ndarray, period_starts: np.ndarray, period_ends: np.ndarray,
+             aggregation: str) -> np.ndarray:
+    """
+    Resamples a series onto a time axis.
+
+    :param aggregation: 'last' takes the latest observation on or before each period's end, which forward fills
+        series that update less often than the axis (e.g. quarterly GDP on a daily axis). 'sum' and 'mean' aggregate
+        the observations within each period, e.g. daily adoption counts on a monthly axis.
+    :return: float64 array with one value per period, NaN where there is no value
+    """
+    has_value = ~np.isnan(values)
+    dates, values = dates[has_value], values[has_value]
+    num_periods = len(period_starts)
+    if not len(values):
+        return np.full(num_periods, np.nan)
+
+    if aggregation == 'last':
+        last_indexes = np.searchsorted(dates, period_ends, side='right') - 1
+        return np.where(last_indexes >= 0, values[np.clip(last_indexes, 0, None)], np.nan)
+
+    period_indexes = np.searchsorted(period_starts, dates, side='right') - 1
+    in_axis = (period_indexes >= 0) & (dates <= period_ends[-1])
+    period_sums = np.bincount(period_indexes[in_axis], weights=values[in_axis], minlength=num_periods)
+    period_counts = np.bincount(period_indexes[in_axis], minlength=num_periods)
+    if aggregation == 'sum':
+        # A period without observations has no value rather than a total of 0
+        return np.where(period_counts > 0, period_sums, np.nan)
+    if aggregation == 'mean':
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(period_counts > 0, period_sums / period_counts, np.nan)
+    raise ValueError(f"Unknown aggregation '{aggregation}'. Valid aggregations are last, sum and mean.")
+
+
+class MonthValuesCache:
+    """
+    Thread safe LRU cache of decoded month arrays, keyed by (partition key value, month). Months that can still
+    receive data (the current and previous month) expire after recent_month_ttl_seconds. Older months only leave the
+    cache when evicted.
+    """
+
+    def __init__(self, max_months: int = 4096, recent_month_ttl_seconds: float = 300):
+        self.max_months = max_months
+        self.recent_month_ttl_seconds = recent_month_ttl_seconds
+        # {(partition key value, month): (dates, values, cached at)}
+        self._months = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _is_recent(self, month: str) -> bool:
+        return np.datetime64(month, 'M') >= np.datetime64(date.today(), 'M') - 1
+
+    def get(self, partition_key_value, month: str) -> Union[tuple[np.ndarray, np.ndarray], None]:
+        key = (partition_key_value, month)
+        with self._lock:
+            cached_month = self._months.get(key)
+            if cached_month is None or (self._is_recent(month) and
+                                        time.monotonic() - cached_month[2] > self.recent_month_ttl_seconds):
+                self.misses += 1
+                return None
+            self._months.move_to_end(key)
+            self.hits += 1
+            return cached_month[0], cached_month[1]
+
+    def put(self, partition_key_value, month: str, dates: np.ndarray, values: np.ndarray):
+        key = (partition_key_value, month)
+        with self._lock:
+            self._months[key] = (dates, values, time.monotonic())
+            self._months.move_to_end(key)
+            while len(self._months) > self.max_months:
+                self._months.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._months.clear()
+
+
+class ChartQueryEngine:
+    """
+    Read path for the website charts. Reads the month items of several series in parallel, decodes them into NumPy
+    date and value arrays, and aligns series of different frequencies (daily Petfinder counts, daily DFF, monthly
+    UNRATE/RSXFS/CPI, quarterly GDP) on a common time axis. Decoded months are kept in a MonthValuesCache, so repeated
+    chart requests don't read DynamoDB again.
+
+    With an export_reader (a ColumnarSeriesReader of the nightly columnar export), the exported days of a series are
+    sliced from the memory-mapped export instead, and only days after the series' last exported day are read from
+    DynamoDB.
+    """
+
+    def __init__(self, dynamodb_manager, values_attribute_name, cache: MonthValuesCache = None, max_workers: int = 8,
+                 lookback_months: int = 3, export_reader=None):
+        """
+
+        :param dynamodb_manager: DynamoDbManager of the table holding the series
+        :param values_attribute_name: Name of the attribute storing each month's values
+        :param cache: Month cache. Pass the same cache to several engines to share it.
+        :param max_workers: Number of series read at once
+        :param lookback_months: Months read before the start of the range for 'last' aggregations, so series that
+            update less often than monthly have a value to forward fill from at the start of the range
+        :param export_reader: Optional ColumnarSeriesReader serving the exported days of each series
+        """
+        self.dynamodb_manager = dynamodb_manager
+        self.values_attribute_name = values_attribute_name
+        self.cache = cache or MonthValuesCache()
+        self.max_workers = max_workers
+        self.lookback_months = lookback_months
+        self.export_reader = export_reader
+        self.logger = logging.getLogger(name='ChartQueryEngine')
+
+    def get_series(self, partition_key_value, start_date, end_date) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :param start_date: First date of the range, as a YYYY-MM-DD string, date or datetime64
+        :param end_date: Last date of the range, inclusive
+        :return: (dates as a sorted datetime64[D] array, values as a float64 array) within the range
+        """
+        start_date, end_date = np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D')
+        exported_last_day = self.export_reader.last_day(partition_key_value) if self.export_reader else None
+        if exported_last_day is None:
+            return self._get_month_series(partition_key_value, start_date, end_date)
+
+        exported_dates, exported_values = self.export_reader.get_series(partition_key_value, start_date,
+                                                                        min(end_date, exported_last_day))
+        if end_date <= exported_last_day:
+            return exported_dates, exported_values
+        recent_dates, recent_values = self._get_month_series(partition_key_value,
+                                                             max(start_date, exported_last_day + 1), end_date)
+        return np.concatenate([exported_dates, recent_dates]), np.concatenate([exported_values, recent_values])
+
+    def _get_month_series(self, partition_key_value, start_date: np.datetime64,
+                          end_date: np.datetime64) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Reads a date range of a series from its month items, through the month cache.
+        """
+        months = months_between(start_date, end_date)
+
+        month_arrays = {}
+        missing_months = []
+        for month in months:
+            cached_arrays = self.cache.get(partition_key_value, month)
+            if cached_arrays is None:
+                missing_months.append(month)
+            else:
+                month_arrays[month] = cached_arrays
+
+        if missing_months:
+            month_values = self.dynamodb_manager.get_month_values(partition_key_value=partition_key_value,
+                                                                  months=missing_months,
+                                                                  values_attribute_name=self.values_attribute_name)
+            for month in missing_months:
+                # Months without an item are cached as empty, so they aren't read again either
+                dates, values = month_values_to_arrays(month_values.get(month, {}))
+                self.cache.put(partition_key_value, month, dates, values)
+                month_arrays[month] = (dates, values)
+
+        dates = np.concatenate([month_arrays[month][0] for month in months])
+        values = np.concatenate([month_arrays[month][1] for month in months])
+        in_range = (dates >= start_date) & (dates <= end_date)
+        return dates[in_range], values[in_range]
+
+    def get_aligned_series(self, partition_key_values: list, start_date, end_date, frequency: str = 'D',
+                           aggregations: dict = None) -> dict:
+        """
+        :param partition_key_values: Series to align, e.g. ['pf_dogs', 'fred_federal_funds_rate', 'fred_gdp']
+        :param start_date: First date of the range, as a YYYY-MM-DD string, date or datetime64
+        :param end_date: Last date of the range, inclusive
+        :param frequency: Frequency of the common time axis: 'D', 'W', 'M' or 'Q'
+        :param aggregations: {partition key value: 'last', 'sum' or 'mean'}. Series not listed use 'last'.
+        :return: {'dates': datetime64[D] array of period starts, 'values': {partition key value: float64 array}}
+        """
+        start_date, end_date = np.datetime64(start_date, 'D'), np.datetime64(end_date, 'D')
+        aggregations = aggregations or {}
+        period_starts, period_ends = create_time_axis(start_date, end_date, frequency)
+
+        def read_series(partition_key_value):
+            # The first W/M/Q period starts on or before start_date, and 'sum' and 'mean' need all of its days
+            read_start_date = period_starts[0]
+            if aggregations.get(partition_key_value, 'last') == 'last':
+                read_start_date = (start_date.astype('datetime64[M]') - self.lookback_months).astype('datetime64[D]')
+            return self.get_series(partition_key_value, read_start_date, end_date)
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(partition_key_values)))) as executor:
+            series_arrays = dict(zip(partition_key_values, executor.map(read_series, partition_key_values)))
+
+        aligned_values = {
+            partition_key_value: resample(dates, values, period_starts, period_ends,
+                                          aggregation=aggregations.get(partition_key_value, 'last'))
+            for partition_key_value, (dates, values) in series_arrays.items()
+        }
+        return {
+            'dates': period_starts,
+            'values': aligned_values
+        }
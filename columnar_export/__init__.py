@@ -0,0 +1,2 @@
+from .columnar_exporter import ColumnarExporter
+from .columnar_series_store import ColumnarSeriesReader, ColumnarSeriesWriter
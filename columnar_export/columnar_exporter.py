@@ -0,0 +1,135 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+import numpy as np
+
+from chart_data_management.chart_query_engine import month_values_to_arrays, months_between
+from .columnar_series_store import ColumnarSeriesWriter
+
+
+class ColumnarExporter:
+    """
+    Exports the month items of every series in DynamoDB into a columnar export (see ColumnarSeriesWriter). Meant to run
+    nightly, after the FRED and Petfinder pulls.
+
+    Exports are incremental. Series are found through the series registry (see DynamoDbManager.
+    get_registered_watermarks), and only series whose watermark is past their last exported day are read, from the day
+    after it. Days already exported are not read again, so revisions of exported days only reach the export through a
+    full export (export(full=True)). A full export finds the series with a Scan instead, and registers any series
+    missing from the registry, such as series last written before it existed.
+    """
+
+    def __init__(self, dynamodb_manager, values_attribute_names: dict, export_dir: str, default_start_date: str,
+                 max_workers: int = 8, compact_after_segments: int = 32):
+        """
+
+        :param dynamodb_manager: DynamoDbManager of the data table
+        :param values_attribute_names: {partition key prefix: values attribute name}, e.g. {'fred_': 'values',
+            'pf_': 'values'}. Series matching none of the prefixes aren't exported.
+        :param export_dir: Directory of the export, e.g. an EFS mount shared with the web tier
+        :param default_start_date: First day read for series that haven't been exported yet
+        :param max_workers: Number of series read at once
+        :param compact_after_segments: The export is compacted once a series has more segments than this
+        """
+        self.dynamodb_manager = dynamodb_manager
+        self.values_attribute_names = values_attribute_names
+        self.export_dir = export_dir
+        self.default_start_date = default_start_date
+        self.max_workers = max_workers
+        self.compact_after_segments = compact_after_segments
+        self.logger = logging.getLogger(name='ColumnarExporter')
+
+    def _get_values_attribute_name(self, partition_key_value):
+        for partition_key_prefix, values_attribute_name in self.values_attribute_names.items():
+            if partition_key_value.startswith(partition_key_prefix):
+                return values_attribute_name
+        return None
+
+    def _read_series(self, partition_key_value, start_date: np.datetime64,
+                     end_date: np.datetime64) -> tuple[np.ndarray, np.ndarray]:
+        month_values = self.dynamodb_manager.get_month_values(
+            partition_key_value=partition_key_value,
+            months=months_between(start_date, end_date),
+            values_attribute_name=self._get_values_attribute_name(partition_key_value)
+        )
+        dates, values = month_values_to_arrays({date_str: value
+                                                for month_dates in month_values.values()
+                                                for date_str, value in month_dates.items()})
+        in_range = (dates >= start_date) & (dates <= end_date)
+        return dates[in_range], values[in_range]
+
+    @staticmethod
+    def _append_read(writer: ColumnarSeriesWriter, partition_key_value, read_future) -> int:
+        """
+        :return: Number of rows appended
+        """
+        dates, values = read_future.result()
+        writer.append(partition_key_value, dates, values)
+        return len(dates)
+
+    def export(self, full: bool = False) -> dict:
+        """
+        :param full: Export every series again from its first day, picking up revisions of exported days, and repair
+            the series registry
+        :return: {'series_exported': int, 'rows_appended': int, 'series_unchanged': int, 'compacted': bool,
+            'num_rows': int}
+        """
+        writer = ColumnarSeriesWriter(export_dir=self.export_dir)
+        if full:
+            writer.reset()
+            watermarks = self.dynamodb_manager.scan_watermarks()
+            registered_watermarks = self.dynamodb_manager.get_registered_watermarks()
+            self.dynamodb_manager.register_watermarks({
+                partition_key_value: last_updated_day
+                for partition_key_value, last_updated_day in watermarks.items()
+                if registered_watermarks.get(partition_key_value) != last_updated_day
+            })
+        else:
+            watermarks = self.dynamodb_manager.get_registered_watermarks()
+
+        series_ranges = {}
+        num_unchanged_series = 0
+        for partition_key_value, last_updated_day in sorted(watermarks.items()):
+            if self._get_values_attribute_name(partition_key_value) is None:
+                continue
+            last_exported_day = writer.last_day(partition_key_value)
+            if last_exported_day is not None and last_updated_day <= last_exported_day:
+                num_unchanged_series += 1
+                continue
+            start_date = np.datetime64(last_exported_day, 'D') + 1 if last_exported_day \
+                else np.datetime64(self.default_start_date, 'D')
+            series_ranges[partition_key_value] = (start_date, np.datetime64(last_updated_day, 'D'))
+
+        def read_series(partition_key_value):
+            return self._read_series(partition_key_value, *series_ranges[partition_key_value])
+
+        num_rows_appended = 0
+        if series_ranges:
+            max_workers = max(1, min(self.max_workers, len(series_ranges)))
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                # Reads are submitted at most two per worker ahead of the append, which takes them in sorted order, so
+                # only the columns of those series are held at once
+                pending_reads = deque()
+                for partition_key_value in series_ranges:
+                    pending_reads.append((partition_key_value, executor.submit(read_series, partition_key_value)))
+                    if len(pending_reads) >= 2 * max_workers:
+                        num_rows_appended += self._append_read(writer, *pending_reads.popleft())
+                while pending_reads:
+                    num_rows_appended += self._append_read(writer, *pending_reads.popleft())
+
+        is_compacted = any(writer.num_segments(partition_key_value) > self.compact_after_segments
+                           for partition_key_value in series_ranges)
+        if is_compacted:
+            writer.compact()
+        writer.commit()
+
+        export_summary = {
+            'series_exported': len(series_ranges),
+            'rows_appended': num_rows_appended,
+            'series_unchanged': num_unchanged_series,
+            'compacted': is_compacted,
+            'num_rows': writer.index['num_rows']
+        }
+        self.logger.info(f"Columnar export finished: {export_summary}")
+        return export_summary
@@ -0,0 +1,237 @@
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import re
+from typing import Union
+
+import numpy as np
+
+
+# Each column is a raw little-endian array with no header. Days are stored as datetime64[D], so a memory-mapped slice
+# is already a date array and needs no conversion (or copy) before resampling.
+DAYS_DTYPE = np.dtype('<M8[D]')
+VALUES_DTYPE = np.dtype('<f8')
+
+INDEX_FILE_NAME = 'index.json'
+INDEX_FORMAT_VERSION = 1
+
+EMPTY_DATES = np.array([], dtype='datetime64[D]')
+EMPTY_VALUES = np.array([], dtype=np.float64)
+
+
+COLUMN_FILE_NAME_PATTERN = re.compile(r'^(?:days|values)\.(\d+)\.bin$')
+
+
+def _format_column_file_names(generation: int) -> tuple[str, str]:
+    return f"days.{generation}.bin", f"values.{generation}.bin"
+
+
+def _load_index(export_dir: str) -> Union[dict, None]:
+    try:
+        with open(os.path.join(export_dir, INDEX_FILE_NAME)) as index_file:
+            index = json.load(index_file)
+    except FileNotFoundError:
+        return None
+    if index.get('version') != INDEX_FORMAT_VERSION:
+        raise ValueError(f"Unsupported columnar export index version {index.get('version')}.")
+    return index
+
+
+class ColumnarSeriesWriter:
+    """
+    Writes every series into one pair of append-only column files, a days column and a values column, described by a
+    small JSON index:
+
+        {'version': 1, 'generation': 3, 'num_rows': 51234, 'days_file': 'days.3.bin', 'values_file': 'values.3.bin',
+         'series': {'fred_DFF': {'segments': [[offset, length], ...], 'last_day': '2024-05-31'}}}
+
+    Each append adds one segment of rows at the end of the columns. Days within a segment are sorted, and a series only
+    ever receives days after its last_day, so its segments are in date order too. Rows are only appended, and the
+    index is replaced atomically once the rows are on disk, so readers never see a partial export. Rows appended after
+    the last committed index (an export that failed halfway) are truncated before the next append.
+
+    compact() rewrites the columns under a new generation with each series in a single contiguous segment, and reset()
+    starts an empty generation for a full re-export. Once the new index is in place, the files of the previous
+    generation are kept, so readers that loaded the previous index can still open and read them until they refresh,
+    and only older generations are deleted.
+    """
+
+    def __init__(self, export_dir: str):
+        self.export_dir = export_dir
+        os.makedirs(export_dir, exist_ok=True)
+        self.index = _load_index(export_dir) or self._create_index(generation=0)
+        self.logger = logging.getLogger(name='ColumnarSeriesWriter')
+
+    @staticmethod
+    def _create_index(generation: int) -> dict:
+        days_file_name, values_file_name = _format_column_file_names(generation)
+        return {
+            'version': INDEX_FORMAT_VERSION,
+            'generation': generation,
+            'num_rows': 0,
+            'days_file': days_file_name,
+            'values_file': values_file_name,
+            'series': {}
+        }
+
+    def _column_path(self, file_key: str) -> str:
+        return os.path.join(self.export_dir, self.index[file_key])
+
+    def last_day(self, partition_key_value) -> Union[str, None]:
+        """
+        :return: Last exported day of the series (YYYY-MM-DD), or None if it hasn't been exported
+        """
+        return self.index['series'].get(partition_key_value, {}).get('last_day')
+
+    def num_segments(self, partition_key_value) -> int:
+        return len(self.index['series'].get(partition_key_value, {}).get('segments', []))
+
+    def append(self, partition_key_value, dates: np.ndarray, values: np.ndarray):
+        """
+        Appends the days of a series after its last exported day. Call commit() to make them visible to readers.
+
+        :param dates: Sorted datetime64[D] array, all after the series' last_day
+        :param values: float64 array of the same length, NaN for missing values
+        """
+        if not len(dates):
+            return
+        series_index = self.index['series'].setdefault(partition_key_value, {'segments': [], 'last_day': None})
+        if series_index['last_day'] is not None and dates[0] <= np.datetime64(series_index['last_day'], 'D'):
+            raise ValueError(f"Days of {partition_key_value} must be appended after its last exported day "
+                             f"{series_index['last_day']}.")
+
+        num_rows = self.index['num_rows']
+        for file_key, column, dtype in (('days_file', dates, DAYS_DTYPE), ('values_file', values, VALUES_DTYPE)):
+            with open(self._column_path(file_key), 'ab') as column_file:
+                # Drops rows of an export that never committed its index
+                column_file.truncate(num_rows * dtype.itemsize)
+                column_file.write(np.ascontiguousarray(column, dtype=dtype).tobytes())
+        series_index['segments'].append([num_rows, len(dates)])
+        series_index['last_day'] = str(dates[-1])
+        self.index['num_rows'] = num_rows + len(dates)
+
+    def commit(self):
+        """
+        Flushes the appended rows to disk and atomically replaces the index, then deletes the column files of every
+        generation other than this one and the previous one.
+        """
+        for file_key in ('days_file', 'values_file'):
+            column_path = self._column_path(file_key)
+            if os.path.exists(column_path):
+                with open(column_path, 'ab') as column_file:
+                    os.fsync(column_file.fileno())
+
+        self.index['exported_at'] = datetime.now(timezone.utc).isoformat()
+        index_path = os.path.join(self.export_dir, INDEX_FILE_NAME)
+        temporary_index_path = f"{index_path}.tmp"
+        with open(temporary_index_path, 'w') as index_file:
+            json.dump(self.index, index_file, separators=(',', ':'))
+            index_file.flush()
+            os.fsync(index_file.fileno())
+        os.replace(temporary_index_path, index_path)
+
+        # Besides generations older than the previous one, this drops the files of a compaction that never committed
+        kept_generations = {self.index['generation'], self.index['generation'] - 1}
+        for file_name in os.listdir(self.export_dir):
+            file_name_match = COLUMN_FILE_NAME_PATTERN.match(file_name)
+            if file_name_match and int(file_name_match.group(1)) not in kept_generations:
+                os.remove(os.path.join(self.export_dir, file_name))
+
+    def reset(self):
+        """
+        Starts an empty generation, so every series is exported again from its first day. Takes effect on commit().
+        """
+        self.index = self._create_index(generation=self.index['generation'] + 1)
+
+    def compact(self):
+        """
+        Rewrites the columns under a new generation with every series in a single segment, so reads of any range are
+        zero-copy slices. Takes effect on commit().
+        """
+        reader = ColumnarSeriesReader(export_dir=self.export_dir, index=self.index)
+        previous_index = self.index
+        self.index = self._create_index(generation=previous_index['generation'] + 1)
+        for partition_key_value in previous_index['series']:
+            self.append(partition_key_value, *reader.get_series(partition_key_value))
+        self.logger.info(f"Compacted {len(previous_index['series'])} series into generation "
+                         f"{self.index['generation']}.")
+
+
+class ColumnarSeriesReader:
+    """
+    Read side of a columnar export, for the web tier. The column files are memory-mapped, so a date range of a series
+    is sliced straight from the page cache: a range within one segment is returned as views of the mapped columns,
+    without reading or copying anything else. Ranges spanning several segments (series appended to since the last
+    compaction) are concatenated.
+
+    The reader keeps the index it was created with. Call refresh() (e.g. on a timer) to pick up a newer export.
+    """
+
+    def __init__(self, export_dir: str, index: dict = None):
+        """
+
+        :param export_dir: Directory of the export
+        :param index: Index to read with instead of the committed one, used by ColumnarSeriesWriter.compact
+        """
+        self.export_dir = export_dir
+        self.index = None
+        self.days = EMPTY_DATES
+        self.values = EMPTY_VALUES
+        self._load(index=index if index is not None else _load_index(export_dir))
+
+    def _load(self, index: Union[dict, None]):
+        self.index = index or ColumnarSeriesWriter._create_index(generation=0)
+        num_rows = self.index['num_rows']
+        if not num_rows:
+            # mmap can't map an empty file
+            self.days, self.values = EMPTY_DATES, EMPTY_VALUES
+            return
+        # Only the committed rows are mapped, even if an export is appending to the files
+        self.days = np.memmap(os.path.join(self.export_dir, self.index['days_file']), dtype=DAYS_DTYPE, mode='r',
+                              shape=(num_rows,))
+        self.values = np.memmap(os.path.join(self.export_dir, self.index['values_file']), dtype=VALUES_DTYPE,
+                                mode='r', shape=(num_rows,))
+
+    def refresh(self) -> bool:
+        """
+        Reloads the index and remaps the columns if a newer export was committed.
+
+        :return: Whether a newer export was loaded
+        """
+        index = _load_index(self.export_dir)
+        if index is None or index.get('exported_at') == self.index.get('exported_at'):
+            return False
+        self._load(index=index)
+        return True
+
+    def last_day(self, partition_key_value) -> Union[np.datetime64, None]:
+        last_day = self.index['series'].get(partition_key_value, {}).get('last_day')
+        return np.datetime64(last_day, 'D') if last_day else None
+
+    def get_series(self, partition_key_value, start_date=None, end_date=None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        :param start_date: First date of the range, as a YYYY-MM-DD string, date or datetime64. Defaults to the first
+            exported day.
+        :param end_date: Last date of the range, inclusive. Defaults to the last exported day.
+        :return: (dates as a sorted datetime64[D] array, values as a float64 array) within the range. Read-only views
+            of the mapped columns when the range lies within one segment.
+        """
+        segments = self.index['series'].get(partition_key_value, {}).get('segments', [])
+        start_date = np.datetime64(start_date, 'D') if start_date is not None else None
+        end_date = np.datetime64(end_date, 'D') if end_date is not None else None
+
+        date_slices, value_slices = [], []
+        for offset, length in segments:
+            segment_days = self.days[offset:offset + length]
+            first_index = np.searchsorted(segment_days, start_date, side='left') if start_date is not None else 0
+            last_index = np.searchsorted(segment_days, end_date, side='right') if end_date is not None else length
+            if first_index < last_index:
+                date_slices.append(segment_days[first_index:last_index])
+                value_slices.append(self.values[offset + first_index:offset + last_index])
+
+        if not date_slices:
+            return EMPTY_DATES, EMPTY_VALUES
+        if len(date_slices) == 1:
+            return date_slices[0], value_slices[0]
+        return np.concatenate(date_slices), np.concatenate(value_slices)
@@ -1 +1,2 @@
-from .dynamodb_manager import DynamoDbManager
\ No newline at end of file
+from .dynamodb_manager import DynamoDbManager
+from .value_codecs import JsonValueCodec, MapValueCodec, PackedValueCodec, create_value_codec, hash_month_values
@@ -1,66 +1,970 @@
-import boto3
-from datetime import datetime
-import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+import logging
+import math
+import random
+import re
+import threading
+import time
 
 from typing import Union
 
+from metrics_management import get_metrics_recorder
+from .value_codecs import MapValueCodec, _to_decimal, detect_value_codec, hash_month_values
+
+
+class MaxBatchRequestTriesError(Exception):
+    pass
+
+
+class MaxConditionalWriteTriesError(Exception):
+    pass
+
+
+def is_conditional_check_failure(error: Exception) -> bool:
+    # Checked on the error code rather than botocore's exception class, so botocore isn't imported before first use
+    return getattr(error, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException'
+
+
+def estimate_item_size(item: dict) -> int:
+    """
+    Estimates the billed size of an item in bytes, per the DynamoDB item size rules: the UTF-8 length of each attribute
+    name plus the size of its value.
+    """
+    item_size = 0
+    for attribute_name, value in item.items():
+        item_size += len(attribute_name.encode('utf-8')) + _estimate_value_size(value)
+    return item_size
+
+
+def _estimate_value_size(value) -> int:
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, bool) or value is None:
+        return 1
+    if isinstance(value, (int, float, Decimal)):
+        # Numbers take roughly one byte per two significant digits, plus one byte
+        significant_digits = len(str(abs(value)).replace('.', '').lstrip('0')) or 1
+        return math.ceil(significant_digits / 2) + 1
+    if isinstance(value, dict):
+        return 3 + sum(len(key.encode('utf-8')) + _estimate_value_size(map_value) + 1
+                       for key, map_value in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return 3 + sum(_estimate_value_size(list_value) + 1 for list_value in value)
+    # Binary
+    return len(bytes(getattr(value, 'value', value)))
+
+
+# First character of the rollup item sort keys of each period
+ROLLUP_LABEL_PREFIXES = {
+    'week': 'W',
+    'month': 'M',
+    'quarter': 'Q',
+    'year': 'Y'
+}
+
+
+def format_rollup_labels(date_str: str, rollup_periods) -> list[str]:
+    """
+    :param date_str: Date in the format YYYY-MM-DD
+    :param rollup_periods: Any of 'week', 'month', 'quarter' and 'year'
+    :return: Sort keys of the rollup items the date falls in, e.g. ['W2024-05', 'M2024-02', 'Q2024-1', 'Y2024']
+    """
+    day = date.fromisoformat(date_str)
+    labels = []
+    for rollup_period in rollup_periods:
+        if rollup_period == 'week':
+            iso_year, iso_week, _ = day.isocalendar()
+            period_label = f"{iso_year}-{iso_week:02d}"
+        elif rollup_period == 'month':
+            period_label = date_str[:7]
+        elif rollup_period == 'quarter':
+            period_label = f"{day.year}-{(day.month - 1) // 3 + 1}"
+        elif rollup_period == 'year':
+            period_label = str(day.year)
+        else:
+            raise ValueError(f"Unknown rollup period '{rollup_period}'.")
+        labels.append(f"{ROLLUP_LABEL_PREFIXES[rollup_period]}{period_label}")
+    return labels
+
+
+ROLLUP_PARTITION_KEY_SUFFIX = '#rollup'
+
+
+def format_series_family(partition_key_value: str) -> str:
+    """
+    :return: The partition key up to its first '_' or '#', e.g. 'pf' for 'pf_dogs#state#CA' or 'quota' for
+        'quota#petfinder', followed by '#rollup' for rollup partitions ('pf#rollup'). There are only a handful of
+        families, so unlike partition keys they can be metric dimensions.
+    """
+    series_family = re.split(r'[_#]', partition_key_value, maxsplit=1)[0]
+    if partition_key_value.endswith(ROLLUP_PARTITION_KEY_SUFFIX):
+        series_family += ROLLUP_PARTITION_KEY_SUFFIX
+    return series_family
+
+
+# Day numbers count days since 1970-01-01, the same convention as NumPy's datetime64[D]
+DAY_NUMBER_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
 
 class DynamoDbManager:
 
-    def __init__(self, table_name, region, partition_key_name, sort_key_name):
-        dynamodb_client = boto3.resource('dynamodb', region_name=region)
-        self.dynamodb_table = dynamodb_client.Table(table_name)
+    # DynamoDB limits on the number of items per BatchWriteItem and keys per BatchGetItem request
+    BATCH_WRITE_MAX_ITEMS = 25
+    BATCH_GET_MAX_KEYS = 100
+
+    # Read units are billed per 4 KB and write units per 1 KB of item size
+    READ_UNIT_BYTES = 4096
+    WRITE_UNIT_BYTES = 1024
+
+    # Sort key of the per-series item holding the last updated day. '#' sorts before the YYYY-MM month sort keys, so
+    # the marker never shows up as the latest month of a series.
+    WATERMARK_SORT_KEY_VALUE = '#last_updated'
+    WATERMARK_ATTRIBUTE_NAME = 'last_updated_day'
+    # Partition listing every series with a watermark, one small item per series (sort key = the series' partition
+    # key) holding a copy of its last updated day, so every series can be found with one Query instead of a Scan
+    SERIES_REGISTRY_PARTITION_KEY_VALUE = 'registry#series'
+
+    # Attribute of each month item holding the content hash of its values (see hash_month_values). Writes are skipped
+    # when the merged values hash the same, and are conditioned on the hash being unchanged since the month was read.
+    VALUES_HASH_ATTRIBUTE_NAME = 'values_hash'
+
+    # Rollup items live in their own '<partition key>#rollup' partition, with one item per period holding the sum of
+    # the period's values and the number of days with a value
+    ROLLUP_PERIODS = ('week', 'month', 'quarter', 'year')
+    ROLLUP_PARTITION_KEY_SUFFIX = ROLLUP_PARTITION_KEY_SUFFIX
+    ROLLUP_TOTAL_ATTRIBUTE_NAME = 'total'
+    ROLLUP_COUNT_ATTRIBUTE_NAME = 'count'
+    # Above this many rollup items, the ADD updates are made in parallel on the writer threads. Backfills touch
+    # thousands of periods, while daily updates touch one item per period.
+    ROLLUP_PARALLEL_UPDATE_THRESHOLD = 25
+    # put_day_arrays converts and writes this many months at a time, so only those months exist as dicts at once
+    DAY_ARRAY_WRITE_MONTHS = 120
+
+    def __init__(self, table_name, region, partition_key_name, sort_key_name, max_batch_tries: int = 8,
+                 batch_backoff_base_seconds: float = 0.05, batch_backoff_max_seconds: float = 5.0, value_codec=None,
+                 rollup_periods=ROLLUP_PERIODS, max_write_workers: int = 8):
+        """
+
+        :param value_codec: Codec used to encode each month's values when writing. Defaults to MapValueCodec, the
+            only codec whose months are updated one day at a time. Reads detect the codec of each stored item, so items
+            written with a different codec remain readable.
+        :param rollup_periods: Periods whose rollup items are kept up to date on every write. Pass an empty tuple to
+            disable rollups.
+        :param max_batch_tries: Number of tries for a batch request before giving up on its unprocessed items/keys,
+            and for a month write whose condition keeps failing because of concurrent writes
+        :param batch_backoff_base_seconds: Sleep before the first batch retry. Doubles on each following retry.
+        :param batch_backoff_max_seconds: Upper bound of the sleep between batch retries
+        :param max_write_workers: Number of month items written at once. Each changed month is its own conditional
+            UpdateItem, so backfills writing hundreds of months write them in parallel. The writer threads are shared
+            by every caller of the manager, so this bounds the manager's parallel writes as a whole.
+        """
+        self.table_name = table_name
+        self.region = region
         self.partition_key_name = partition_key_name
         self.sort_key_name = sort_key_name
+        self.max_batch_tries = max_batch_tries
+        self.batch_backoff_base_seconds = batch_backoff_base_seconds
+        self.batch_backoff_max_seconds = batch_backoff_max_seconds
+        self.value_codec = value_codec or MapValueCodec()
+        self.rollup_periods = tuple(rollup_periods)
+        self.max_write_workers = max_write_workers
+        self.logger = logging.getLogger(name='DynamoDbManager')
+
+        # boto3 resources are not thread safe, so each thread gets its own session, resource and table
+        self._thread_local = threading.local()
+        # Created on first use and kept for the life of the manager (and so across warm invocations), so the writer
+        # threads, and the session and resource each of them builds, are only created once
+        self._write_executor = None
+        self._write_executor_lock = threading.Lock()
+
+    @property
+    def dynamodb_resource(self):
+        dynamodb_resource = getattr(self._thread_local, 'dynamodb_resource', None)
+        if dynamodb_resource is None:
+            # Imported on first use, as boto3 is one of the slowest imports of a cold start
+            import boto3
+
+            session = boto3.session.Session()
+            dynamodb_resource = session.resource('dynamodb', region_name=self.region)
+            self._thread_local.dynamodb_resource = dynamodb_resource
+        return dynamodb_resource
+
+    @property
+    def dynamodb_table(self):
+        dynamodb_table = getattr(self._thread_local, 'dynamodb_table', None)
+        if dynamodb_table is None:
+            dynamodb_table = self.dynamodb_resource.Table(self.table_name)
+            self._thread_local.dynamodb_table = dynamodb_table
+        return dynamodb_table
+
+    def _get_write_executor(self) -> ThreadPoolExecutor:
+        with self._write_executor_lock:
+            if self._write_executor is None:
+                self._write_executor = ThreadPoolExecutor(max_workers=self.max_write_workers,
+                                                          thread_name_prefix='dynamodb_write')
+            return self._write_executor
+
+    def _request(self, operation_name: str, request_function, partition_key_value=None, **request_kwargs) -> dict:
+        """
+        Makes a DynamoDB request with ReturnConsumedCapacity, recording its 'dynamodb_latency' and
+        'dynamodb_consumed_capacity' metrics.
+
+        :param operation_name: DynamoDB operation, e.g. 'BatchWriteItem'
+        :param request_function: boto3 method making the request
+        :param partition_key_value: Partition key the request is for. Its series family (see format_series_family) is
+            a metric dimension and the partition key itself a metric property, as there is one partition per series,
+            state and breakdown.
+        :param request_kwargs: Passed to request_function
+        :return: The response
+        """
+        metrics_recorder = get_metrics_recorder()
+        metric_dimensions = {
+            'operation': operation_name,
+            'series_family': format_series_family(partition_key_value) if partition_key_value else None
+        }
+        metric_properties = {'partition_key': partition_key_value}
+        with metrics_recorder.timer('dynamodb_latency', properties=metric_properties, **metric_dimensions):
+            response = request_function(ReturnConsumedCapacity='TOTAL', **request_kwargs)
+
+        # Single item and query operations return one ConsumedCapacity, batch operations one per table
+        consumed_capacity = response.get('ConsumedCapacity', [])
+        if isinstance(consumed_capacity, dict):
+            consumed_capacity = [consumed_capacity]
+        capacity_units = sum(float(table_capacity.get('CapacityUnits', 0)) for table_capacity in consumed_capacity)
+        metrics_recorder.record('dynamodb_consumed_capacity', capacity_units,
+                                properties=metric_properties,
+                                **metric_dimensions)
+        return response
 
     def get_last_updated_day(self, partition_key_value, values_attribute_name) -> Union[datetime, None]:
-        response = self.dynamodb_table.query(
-            KeyConditionExpression="#pk = :pk AND #sk = :sk",
+        """
+        Finds the last updated day by decoding the latest month item of the partition key. Prefer
+        get_last_updated_days, which reads the precomputed watermark items and only falls back to this.
+        """
+        response = self._request(
+            'Query',
+            self.dynamodb_table.query,
+            partition_key_value=partition_key_value,
+            KeyConditionExpression="#pk = :pk AND #sk > :watermark_sk",
             ExpressionAttributeNames={
                 '#pk': self.partition_key_name,
                 '#sk': self.sort_key_name
             },
             ExpressionAttributeValues={
-                ":pk": {'S': partition_key_value}
+                ":pk": partition_key_value,
+                ":watermark_sk": self.WATERMARK_SORT_KEY_VALUE
             },
             # Sort dates in descending order (most recent at the top)
             ScanIndexForward=False,
             Limit=1
         )
-        if response and 'Items' in response:
+        if response and response.get('Items'):
             last_item = response['Items'][0]
             last_month_data = last_item[values_attribute_name]
-            json_data = json.loads(last_month_data)
-
-            dates = [datetime.strptime(date_str, '%Y-%m-%d') for date_str in json_data.keys()]
-            latest_date = max(dates)
+            latest_date_str = detect_value_codec(last_month_data).last_date(last_month_data)
+            if latest_date_str is None:
+                return None
 
-            return latest_date
+            return datetime.strptime(latest_date_str, '%Y-%m-%d')
         else:
             # Return None if no data was found for the provided partition key
             return None
 
-    def put_fred_data(self, data, partition_key_value, values_attribute_name):
-        new_data = []
-        for observation in data:
-            new_item = {
+    def _format_watermark_key(self, partition_key_value) -> dict:
+        return {
+            self.partition_key_name: partition_key_value,
+            self.sort_key_name: self.WATERMARK_SORT_KEY_VALUE
+        }
+
+    def get_last_updated_days(self, partition_key_values: list, values_attribute_name) -> dict:
+        """
+        Retrieves the last updated day of every partition key in a single BatchGetItem round trip on the watermark
+        items. Partition keys without a watermark item (e.g. data written before watermarks existed) fall back to
+        get_last_updated_day.
+
+        :return: {partition key value: datetime of the last updated day, or None if there is no data}
+        """
+        watermark_items = self._batch_get_items(keys=[self._format_watermark_key(partition_key_value)
+                                                      for partition_key_value in set(partition_key_values)])
+        last_updated_days = {
+            watermark_item[self.partition_key_name]:
+                datetime.strptime(watermark_item[self.WATERMARK_ATTRIBUTE_NAME], '%Y-%m-%d')
+            for watermark_item in watermark_items
+        }
+
+        for partition_key_value in partition_key_values:
+            if partition_key_value not in last_updated_days:
+                self.logger.info(f"No watermark item for partition key {partition_key_value}. Falling back to "
+                                 f"reading its latest month.")
+                last_updated_days[partition_key_value] = self.get_last_updated_day(
+                    partition_key_value=partition_key_value,
+                    values_attribute_name=values_attribute_name
+                )
+        return last_updated_days
+
+    def get_registered_watermarks(self) -> dict[str, str]:
+        """
+        Reads every series and its last updated day from the series registry, with one eventually consistent Query
+        billed on the size of the registry items alone. Series whose watermark hasn't advanced since the registry was
+        introduced are missing until it does; register_watermarks(scan_watermarks()) adds them.
+
+        :return: {partition key value: last updated day in the format YYYY-MM-DD}
+        """
+        registry_items = self.query_items(
+            partition_key_value=self.SERIES_REGISTRY_PARTITION_KEY_VALUE,
+            KeyConditionExpression="#pk = :pk",
+            ExpressionAttributeNames={
+                '#pk': self.partition_key_name
+            },
+            ExpressionAttributeValues={
+                ':pk': self.SERIES_REGISTRY_PARTITION_KEY_VALUE
+            }
+        )
+        return {registry_item[self.sort_key_name]: registry_item[self.WATERMARK_ATTRIBUTE_NAME]
+                for registry_item in registry_items}
+
+    def register_watermarks(self, watermarks: dict[str, str]):
+        """
+        Overwrites the series registry items of the watermarks, e.g. to add series found by scan_watermarks. Not
+        conditioned, so run it while the data pulls aren't running.
+
+        :param watermarks: {partition key value: last updated day in the format YYYY-MM-DD}
+        """
+        self._batch_write_items(items=[
+            {
+                self.partition_key_name: self.SERIES_REGISTRY_PARTITION_KEY_VALUE,
+                self.sort_key_name: partition_key_value,
+                self.WATERMARK_ATTRIBUTE_NAME: last_updated_day
+            }
+            for partition_key_value, last_updated_day in watermarks.items()
+        ], partition_key_value=self.SERIES_REGISTRY_PARTITION_KEY_VALUE)
+
+    def scan_watermarks(self) -> dict[str, str]:
+        """
+        Finds every series and its last updated day by scanning for the watermark items. A Scan reads (and is billed
+        for) the whole table, so prefer get_registered_watermarks. This is meant for repairing the registry.
+
+        :return: {partition key value: last updated day in the format YYYY-MM-DD}
+        """
+        watermarks = {}
+        scan_kwargs = {
+            'FilterExpression': "#sk = :watermark_sk",
+            'ProjectionExpression': "#pk, #watermark",
+            'ExpressionAttributeNames': {
+                '#pk': self.partition_key_name,
+                '#sk': self.sort_key_name,
+                '#watermark': self.WATERMARK_ATTRIBUTE_NAME
+            },
+            'ExpressionAttributeValues': {
+                ':watermark_sk': self.WATERMARK_SORT_KEY_VALUE
+            }
+        }
+        while True:
+            response = self._request('Scan', self.dynamodb_table.scan, **scan_kwargs)
+            for watermark_item in response.get('Items', []):
+                watermarks[watermark_item[self.partition_key_name]] = watermark_item[self.WATERMARK_ATTRIBUTE_NAME]
+            if 'LastEvaluatedKey' not in response:
+                return watermarks
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    @staticmethod
+    def format_month(date_str: str) -> str:
+        """
+        :param date_str: Date in the format YYYY-MM-DD
+        :return: Month bucket sort key in the format YYYY-MM
+        """
+        return date_str[:7]
+
+    @classmethod
+    def group_by_month(cls, date_values: dict) -> dict[str, dict]:
+        """
+
+        :param date_values: Expected format is {date: value}
+        :return: {month: {date: value}}
+        """
+        month_buckets = {}
+        for date_str, value in date_values.items():
+            month_buckets.setdefault(cls.format_month(date_str), {})[date_str] = value
+        return month_buckets
+
+    def _backoff_sleep(self, tries):
+        # Exponential backoff with full jitter
+        backoff_seconds = min(self.batch_backoff_max_seconds, self.batch_backoff_base_seconds * (2 ** tries))
+        time.sleep(random.uniform(0, backoff_seconds))
+
+    def _batch_get_items(self, keys: list[dict], partition_key_value=None, consistent_read: bool = True) -> list[dict]:
+        """
+        Retrieves the items for the keys through BatchGetItem, retrying any UnprocessedKeys with backoff.
+
+        :param keys: Item keys in the format {partition_key_name: value, sort_key_name: value}
+        :param partition_key_value: Partition key of the series the keys belong to, for metrics
+        :param consistent_read: Strongly consistent reads, which writes merging with the stored items need. Eventually
+            consistent reads cost half as much.
+        :return: The items that exist, in no particular order
+        """
+        items = []
+        for chunk_start in range(0, len(keys), self.BATCH_GET_MAX_KEYS):
+            request_keys = keys[chunk_start:chunk_start + self.BATCH_GET_MAX_KEYS]
+            for tries in range(self.max_batch_tries):
+                if tries >= 1:
+                    self._backoff_sleep(tries - 1)
+                response = self._request(
+                    'BatchGetItem',
+                    self.dynamodb_resource.batch_get_item,
+                    partition_key_value=partition_key_value,
+                    RequestItems={
+                        self.table_name: {
+                            'Keys': request_keys,
+                            'ConsistentRead': consistent_read
+                        }
+                    }
+                )
+                items.extend(response.get('Responses', {}).get(self.table_name, []))
+                request_keys = response.get('UnprocessedKeys', {}).get(self.table_name, {}).get('Keys', [])
+                if not request_keys:
+                    break
+            else:
+                self.logger.error(f"Max number of tries ({self.max_batch_tries}) reached with {len(request_keys)} "
+                                  f"unprocessed keys in BatchGetItem.")
+                raise MaxBatchRequestTriesError
+        return items
+
+    def _batch_write_items(self, items: list[dict], partition_key_value=None):
+        """
+        Puts the items through BatchWriteItem in chunks of 25, retrying any UnprocessedItems with backoff.
+
+        :param partition_key_value: Partition key of the series the items belong to, for metrics
+        """
+        for chunk_start in range(0, len(items), self.BATCH_WRITE_MAX_ITEMS):
+            write_requests = [{'PutRequest': {'Item': item}}
+                              for item in items[chunk_start:chunk_start + self.BATCH_WRITE_MAX_ITEMS]]
+            for tries in range(self.max_batch_tries):
+                if tries >= 1:
+                    self.logger.info(f"Retrying {len(write_requests)} unprocessed items in BatchWriteItem. "
+                                     f"Retry number {tries}.")
+                    self._backoff_sleep(tries - 1)
+                response = self._request(
+                    'BatchWriteItem',
+                    self.dynamodb_resource.batch_write_item,
+                    partition_key_value=partition_key_value,
+                    RequestItems={
+                        self.table_name: write_requests
+                    }
+                )
+                write_requests = response.get('UnprocessedItems', {}).get(self.table_name, [])
+                if not write_requests:
+                    break
+            else:
+                self.logger.error(f"Max number of tries ({self.max_batch_tries}) reached with {len(write_requests)} "
+                                  f"unprocessed items in BatchWriteItem.")
+                raise MaxBatchRequestTriesError
+
+    def create_size_report(self, items: list[dict]) -> list[dict]:
+        """
+        :return: The estimated size, read units and write units of each item, in the format
+            [{'sort_key': sort key value, 'size_bytes': int, 'read_units': int, 'write_units': int}]
+        """
+        size_report = []
+        for item in items:
+            item_size = estimate_item_size(item)
+            size_report.append({
+                'sort_key': item[self.sort_key_name],
+                'size_bytes': item_size,
+                'read_units': math.ceil(item_size / self.READ_UNIT_BYTES),
+                'write_units': math.ceil(item_size / self.WRITE_UNIT_BYTES)
+            })
+        return size_report
+
+    def decode_values(self, encoded_values) -> dict:
+        """
+        Decodes a stored values attribute written by any of the value codecs.
+
+        :return: {date: value}
+        """
+        return detect_value_codec(encoded_values).decode(encoded_values)
+
+    def get_month_values(self, partition_key_value, months: list[str], values_attribute_name) -> dict[str, dict]:
+        """
+        Reads and decodes the month items of a partition key through BatchGetItem. The reads are eventually
+        consistent, as they are for charts and the export, so a write from the last second may be missing.
+
+        :param months: Month sort keys in the format YYYY-MM
+        :return: {month: {date: value}}. Months without an item are left out.
+        """
+        month_items = self._batch_get_items(keys=[
+            {
                 self.partition_key_name: partition_key_value,
-                self.sort_key_name: observation['date'],
-                values_attribute_name: observation['value']
+                self.sort_key_name: month
             }
-            new_data.append(new_item)
+            for month in set(months)
+        ], partition_key_value=partition_key_value, consistent_read=False)
+        return {month_item[self.sort_key_name]: self.decode_values(month_item[values_attribute_name])
+                for month_item in month_items}
 
-    def put_pf_data(self, data: dict, partition_key_value, values_attribute_name):
+    def put_month_buckets(self, date_values: dict, partition_key_value, values_attribute_name) -> list[dict]:
         """
+        Groups the values into month items and writes only what changed. The months' stored items are read in bulk
+        and merged with the new values. Months whose merged content hash equals the stored one are skipped, and the
+        others are written with conditional UpdateItems (see _update_month), setting only the new and changed days of
+        Map items.
 
-        :param data: Expected format is {date: value}
+        :param date_values: Expected format is {date: value}
         :param partition_key_value:
-        :param values_attribute_name:
-        :return:
+        :param values_attribute_name: Name of the attribute storing each month's encoded {date: value}
+        :return: Size report of the written items. See create_size_report.
         """
-        item_data = {
+        month_buckets = self.group_by_month(date_values)
+        if not month_buckets:
+            return []
+
+        month_keys = [
+            {
+                self.partition_key_name: partition_key_value,
+                self.sort_key_name: month
+            }
+            for month in month_buckets
+        ]
+        # The watermark is read alongside the months, so it is only written when it advances
+        existing_items = self._batch_get_items(keys=month_keys + [self._format_watermark_key(partition_key_value)],
+                                               partition_key_value=partition_key_value)
+
+        existing_last_updated_day = None
+        existing_month_items = {}
+        for existing_item in existing_items:
+            month = existing_item[self.sort_key_name]
+            if month == self.WATERMARK_SORT_KEY_VALUE:
+                existing_last_updated_day = existing_item[self.WATERMARK_ATTRIBUTE_NAME]
+            else:
+                existing_month_items[month] = existing_item
+
+        def update_month(month):
+            return self._update_month(partition_key_value=partition_key_value,
+                                      month=month,
+                                      month_values=month_buckets[month],
+                                      existing_item=existing_month_items.get(month),
+                                      values_attribute_name=values_attribute_name)
+
+        if len(month_buckets) > 1 and self.max_write_workers > 1:
+            month_results = dict(zip(month_buckets, self._get_write_executor().map(update_month, month_buckets)))
+        else:
+            month_results = {month: update_month(month) for month in month_buckets}
+
+        written_items = [written_item for _, written_item in month_results.values() if written_item is not None]
+        num_unchanged_months = len(month_buckets) - len(written_items)
+        # Values of each month as they were when its write succeeded, which the rollup deltas are computed against
+        existing_month_values = {month: existing_values for month, (existing_values, _) in month_results.items()}
+
+        last_updated_day = max(date_values)
+        if existing_last_updated_day is None or last_updated_day > existing_last_updated_day:
+            written_items.extend(self._advance_watermark(partition_key_value=partition_key_value,
+                                                         last_updated_day=last_updated_day))
+
+        if self.rollup_periods:
+            try:
+                self._apply_rollup_deltas(partition_key_value=partition_key_value,
+                                          rollup_deltas=self._compute_rollup_deltas(
+                                              date_values=date_values,
+                                              existing_month_values=existing_month_values
+                                          ))
+            except Exception:
+                # The months are already written, so a later write of the same days computes no deltas for them
+                self.logger.error(f"Updating the rollups of partition key {partition_key_value} failed after its "
+                                  f"months were written. Run rebuild_rollups to correct them.")
+                raise
+
+        size_report = self.create_size_report(items=written_items)
+        self.logger.info(f"Wrote {len(written_items)} items for partition key {partition_key_value} totaling "
+                         f"{sum(item_sizes['size_bytes'] for item_sizes in size_report)} bytes and "
+                         f"{sum(item_sizes['write_units'] for item_sizes in size_report)} write units. Skipped "
+                         f"{num_unchanged_months} unchanged months.")
+        return size_report
+
+    # Single item operations for the other stores kept in the data table (the Petfinder quota, backfill checkpoints),
+    # so their requests are recorded in the same metrics as the series writes
+
+    def get_item(self, key: dict) -> Union[dict, None]:
+        """
+        Reads an item with a strongly consistent GetItem.
+
+        :return: The item, or None if it doesn't exist
+        """
+        response = self._request('GetItem',
+                                 self.dynamodb_table.get_item,
+                                 partition_key_value=key[self.partition_key_name],
+                                 Key=key,
+                                 ConsistentRead=True)
+        return response.get('Item')
+
+    def put_item(self, item: dict):
+        self._request('PutItem',
+                      self.dynamodb_table.put_item,
+                      partition_key_value=item[self.partition_key_name],
+                      Item=item)
+
+    def update_item(self, key: dict, **update_kwargs) -> dict:
+        """
+        :param update_kwargs: UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues, ...
+        :return: The response
+        """
+        return self._request('UpdateItem',
+                             self.dynamodb_table.update_item,
+                             partition_key_value=key[self.partition_key_name],
+                             Key=key,
+                             **update_kwargs)
+
+    def query_items(self, partition_key_value, **query_kwargs) -> list[dict]:
+        """
+        Reads every page of a Query.
+
+        :param partition_key_value: Partition key the query is for, used as the metric dimension
+        :param query_kwargs: KeyConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues, ...
+        :return: The items of every page
+        """
+        items = []
+        while True:
+            response = self._request('Query',
+                                     self.dynamodb_table.query,
+                                     partition_key_value=partition_key_value,
+                                     **query_kwargs)
+            items.extend(response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                return items
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def _format_month_update(self, existing_item: Union[dict, None], merged_values: dict, merged_hash: str,
+                             values_attribute_name) -> dict:
+        """
+        :return: UpdateItem arguments writing the merged values of a month, conditioned on the stored item being the
+            one the values were merged with: the same content hash, the same values for items written before hashes
+            were stored, or no item at all
+        """
+        attribute_names = {
+            '#vals': values_attribute_name,
+            '#hash': self.VALUES_HASH_ATTRIBUTE_NAME
+        }
+        attribute_values = {':new_hash': merged_hash}
+        existing_encoded_values = existing_item[values_attribute_name] if existing_item else None
+
+        if isinstance(existing_encoded_values, dict) and isinstance(self.value_codec, MapValueCodec):
+            # Only the new and changed days are set. Other days of the stored Map are left as they are.
+            set_actions = []
+            for date_str in sorted(merged_values):
+                encoded_value = MapValueCodec.encode_value(merged_values[date_str])
+                if date_str in existing_encoded_values and existing_encoded_values[date_str] == encoded_value:
+                    continue
+                day_index = len(set_actions)
+                attribute_names[f'#day{day_index}'] = date_str
+                attribute_values[f':value{day_index}'] = encoded_value
+                set_actions.append(f"#vals.#day{day_index} = :value{day_index}")
+        else:
+            attribute_values[':vals'] = self.value_codec.encode(merged_values)
+            set_actions = ["#vals = :vals"]
+        set_actions.append("#hash = :new_hash")
+
+        if existing_item is None:
+            condition_expression = "attribute_not_exists(#vals)"
+        elif self.VALUES_HASH_ATTRIBUTE_NAME in existing_item:
+            condition_expression = "#hash = :old_hash"
+            attribute_values[':old_hash'] = existing_item[self.VALUES_HASH_ATTRIBUTE_NAME]
+        else:
+            condition_expression = "#vals = :old_vals"
+            attribute_values[':old_vals'] = existing_encoded_values
+
+        return {
+            'UpdateExpression': f"SET {', '.join(set_actions)}",
+            'ConditionExpression': condition_expression,
+            'ExpressionAttributeNames': attribute_names,
+            'ExpressionAttributeValues': attribute_values
+        }
+
+    def _update_month(self, partition_key_value, month: str, month_values: dict, existing_item: Union[dict, None],
+                      values_attribute_name) -> tuple[dict, Union[dict, None]]:
+        """
+        Merges a month's new values into its stored item and writes the result, unless the content hash shows nothing
+        changed. The write is conditional, so a concurrent run writing the same month between the read and the write
+        can't be overwritten. When the condition fails, the month is read again and merged again.
+
+        :param existing_item: The month's stored item, or None if there is none
+        :return: (the month's {date: value} before the write, the written item or None if the month was unchanged)
+        """
+        month_key = {
             self.partition_key_name: partition_key_value,
-            self.sort_key_name:
+            self.sort_key_name: month
+        }
+        for tries in range(self.max_batch_tries):
+            if tries >= 1:
+                self.logger.info(f"Month {month} of partition key {partition_key_value} changed since it was read. "
+                                 f"Merging again. Retry number {tries}.")
+                self._backoff_sleep(tries - 1)
+                existing_item = self.get_item(key=month_key)
+
+            existing_values = self.decode_values(existing_item[values_attribute_name]) if existing_item else {}
+            # Newly received values take precedence over stored values, so data revisions are picked up
+            merged_values = dict(existing_values)
+            merged_values.update(month_values)
+            merged_hash = hash_month_values(merged_values)
+            if existing_item is not None and merged_hash == (existing_item.get(self.VALUES_HASH_ATTRIBUTE_NAME) or
+                                                             hash_month_values(existing_values)):
+                return existing_values, None
+
+            try:
+                self._request('UpdateItem',
+                              self.dynamodb_table.update_item,
+                              partition_key_value=partition_key_value,
+                              Key=month_key,
+                              **self._format_month_update(existing_item=existing_item,
+                                                          merged_values=merged_values,
+                                                          merged_hash=merged_hash,
+                                                          values_attribute_name=values_attribute_name))
+            except Exception as e:
+                if not is_conditional_check_failure(e):
+                    raise
+                continue
+
+            written_item = dict(month_key)
+            written_item[values_attribute_name] = self.value_codec.encode(merged_values)
+            written_item[self.VALUES_HASH_ATTRIBUTE_NAME] = merged_hash
+            return existing_values, written_item
+
+        self.logger.error(f"Max number of tries ({self.max_batch_tries}) reached writing month {month} of partition "
+                          f"key {partition_key_value}.")
+        raise MaxConditionalWriteTriesError
+
+    def _advance_watermark(self, partition_key_value, last_updated_day: str) -> list[dict]:
+        """
+        Sets the watermark, and the series' registry item, to the day, unless a concurrent run already set them to a
+        later day.
+
+        :return: The written items, none if the watermark was already later
+        """
+        registry_key = {
+            self.partition_key_name: self.SERIES_REGISTRY_PARTITION_KEY_VALUE,
+            self.sort_key_name: partition_key_value
         }
+        written_items = []
+        for key in (self._format_watermark_key(partition_key_value), registry_key):
+            try:
+                self.update_item(key=key,
+                                 UpdateExpression="SET #watermark = :day",
+                                 ConditionExpression="attribute_not_exists(#watermark) OR #watermark < :day",
+                                 ExpressionAttributeNames={'#watermark': self.WATERMARK_ATTRIBUTE_NAME},
+                                 ExpressionAttributeValues={':day': last_updated_day})
+            except Exception as e:
+                if not is_conditional_check_failure(e):
+                    raise
+                # A later day is already set, which a concurrent run also writes to the registry
+                if not written_items:
+                    return written_items
+                continue
+            written_items.append({**key, self.WATERMARK_ATTRIBUTE_NAME: last_updated_day})
+        return written_items
 
+    def format_rollup_partition_key_value(self, partition_key_value) -> str:
+        return f"{partition_key_value}{self.ROLLUP_PARTITION_KEY_SUFFIX}"
+
+    def _compute_rollup_deltas(self, date_values: dict, existing_month_values: dict) -> dict[str, list[Decimal]]:
+        """
+        :param date_values: Newly written {date: value}
+        :param existing_month_values: Values stored before the write, in the format {month: {date: value}}
+        :return: {rollup sort key: [total delta, count delta]}, without periods whose deltas are both zero
+        """
+        rollup_deltas = {}
+        for date_str, value in date_values.items():
+            new_value = _to_decimal(value)
+            old_value = _to_decimal(existing_month_values.get(self.format_month(date_str), {}).get(date_str))
+            total_delta = (new_value or 0) - (old_value or 0)
+            count_delta = (new_value is not None) - (old_value is not None)
+            if not total_delta and not count_delta:
+                continue
+            for rollup_label in format_rollup_labels(date_str, self.rollup_periods):
+                period_deltas = rollup_deltas.setdefault(rollup_label, [Decimal(0), Decimal(0)])
+                period_deltas[0] += total_delta
+                period_deltas[1] += count_delta
+        return {rollup_label: period_deltas for rollup_label, period_deltas in rollup_deltas.items()
+                if period_deltas[0] or period_deltas[1]}
+
+    def _apply_rollup_deltas(self, partition_key_value, rollup_deltas: dict[str, list[Decimal]]):
+        """
+        Adds the deltas to the rollup items with atomic ADD updates, which create the items when they don't exist. ADDs
+        commute, so concurrent writers of a series (e.g. a backfill and a daily run) never lose each other's deltas.
+        Large sets of deltas are added in parallel on the writer threads.
+        """
+        rollup_partition_key_value = self.format_rollup_partition_key_value(partition_key_value)
+
+        def add_rollup_delta(rollup_label):
+            total_delta, count_delta = rollup_deltas[rollup_label]
+            return self._request(
+                'UpdateItem',
+                self.dynamodb_table.update_item,
+                partition_key_value=rollup_partition_key_value,
+                Key={
+                    self.partition_key_name: rollup_partition_key_value,
+                    self.sort_key_name: rollup_label
+                },
+                UpdateExpression="ADD #total :total_delta, #count :count_delta",
+                ExpressionAttributeNames={
+                    '#total': self.ROLLUP_TOTAL_ATTRIBUTE_NAME,
+                    '#count': self.ROLLUP_COUNT_ATTRIBUTE_NAME
+                },
+                ExpressionAttributeValues={
+                    ':total_delta': total_delta,
+                    ':count_delta': count_delta
+                }
+            )
+
+        if len(rollup_deltas) > self.ROLLUP_PARALLEL_UPDATE_THRESHOLD and self.max_write_workers > 1:
+            # Consumed so that the first failed update is raised
+            list(self._get_write_executor().map(add_rollup_delta, rollup_deltas))
+        else:
+            for rollup_label in rollup_deltas:
+                add_rollup_delta(rollup_label)
+        if rollup_deltas:
+            self.logger.info(f"Updated {len(rollup_deltas)} rollup items for partition key {partition_key_value}.")
+
+    def rebuild_rollups(self, partition_key_value, values_attribute_name) -> int:
+        """
+        Recomputes every rollup item of the partition key from its month items and overwrites the stored ones. Periods
+        that no longer have any value are reset to a total and count of 0. Use it to correct rollups after a write
+        whose rollup updates failed. Run it while nothing else is writing to the series, since deltas added between
+        reading the months and writing the rollups would be overwritten.
 
+        :return: Number of rollup items written
+        """
+        date_values = {}
+        query_kwargs = {
+            'KeyConditionExpression': "#pk = :pk AND #sk > :watermark_sk",
+            'ExpressionAttributeNames': {
+                '#pk': self.partition_key_name,
+                '#sk': self.sort_key_name
+            },
+            'ExpressionAttributeValues': {
+                ':pk': partition_key_value,
+                ':watermark_sk': self.WATERMARK_SORT_KEY_VALUE
+            },
+            # The rebuilt rollups overwrite the stored ones, so they must include every write so far
+            'ConsistentRead': True
+        }
+        while True:
+            response = self._request('Query',
+                                     self.dynamodb_table.query,
+                                     partition_key_value=partition_key_value,
+                                     **query_kwargs)
+            for month_item in response.get('Items', []):
+                date_values.update(self.decode_values(month_item[values_attribute_name]))
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        # Deltas against no stored values are the full totals and counts
+        rollup_totals = self._compute_rollup_deltas(date_values=date_values, existing_month_values={})
+        for rollup_period in self.rollup_periods:
+            for rollup_label in self.get_rollups(partition_key_value, rollup_period):
+                rollup_totals.setdefault(rollup_label, [Decimal(0), Decimal(0)])
+
+        rollup_partition_key_value = self.format_rollup_partition_key_value(partition_key_value)
+        rollup_items = [
+            {
+                self.partition_key_name: rollup_partition_key_value,
+                self.sort_key_name: rollup_label,
+                self.ROLLUP_TOTAL_ATTRIBUTE_NAME: total,
+                self.ROLLUP_COUNT_ATTRIBUTE_NAME: count
+            }
+            for rollup_label, (total, count) in rollup_totals.items()
+        ]
+        self._batch_write_items(items=rollup_items,
+                                partition_key_value=rollup_partition_key_value)
+        self.logger.info(f"Rebuilt {len(rollup_items)} rollup items for partition key {partition_key_value} from "
+                         f"{len(date_values)} days.")
+        return len(rollup_items)
+
+    def get_rollups(self, partition_key_value, rollup_period: str) -> dict[str, dict]:
+        """
+        :param rollup_period: 'week', 'month', 'quarter' or 'year'
+        :return: {rollup sort key: {'total': Decimal, 'count': Decimal}}, e.g. {'M2024-02': {'total': 31, 'count': 29}}
+        """
+        rollup_prefix = ROLLUP_LABEL_PREFIXES[rollup_period]
+        rollup_partition_key_value = self.format_rollup_partition_key_value(partition_key_value)
+        rollups = {}
+        query_kwargs = {
+            'KeyConditionExpression': "#pk = :pk AND begins_with(#sk, :prefix)",
+            'ExpressionAttributeNames': {
+                '#pk': self.partition_key_name,
+                '#sk': self.sort_key_name
+            },
+            'ExpressionAttributeValues': {
+                ':pk': rollup_partition_key_value,
+                ':prefix': rollup_prefix
+            }
+        }
+        while True:
+            response = self._request('Query',
+                                     self.dynamodb_table.query,
+                                     partition_key_value=rollup_partition_key_value,
+                                     **query_kwargs)
+            for rollup_item in response.get('Items', []):
+                rollups[rollup_item[self.sort_key_name]] = {
+                    'total': rollup_item.get(self.ROLLUP_TOTAL_ATTRIBUTE_NAME, Decimal(0)),
+                    'count': rollup_item.get(self.ROLLUP_COUNT_ATTRIBUTE_NAME, Decimal(0))
+                }
+            if 'LastEvaluatedKey' not in response:
+                return rollups
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def put_fred_data(self, data, partition_key_value, values_attribute_name) -> list[dict]:
+        """
+
+        :param data: FRED observations, in the format [{'date': date, 'value': value, ...}]
+        :param partition_key_value:
+        :param values_attribute_name:
+        :return: Size report of the written items. See create_size_report.
+        """
+        date_values = {observation['date']: observation['value'] for observation in data}
+        return self.put_month_buckets(date_values=date_values,
+                                      partition_key_value=partition_key_value,
+                                      values_attribute_name=values_attribute_name)
+
+    def put_day_arrays(self, day_numbers, values, partition_key_value, values_attribute_name) -> list[dict]:
+        """
+        Writes compact day and value arrays, such as those of FredApiConnectionManager.stream_observations, converting
+        them to month items DAY_ARRAY_WRITE_MONTHS months at a time.
+
+        :param day_numbers: Sequence of days since 1970-01-01, e.g. array('i')
+        :param values: Sequence of floats of the same length, with NaN for missing values
+        :param partition_key_value:
+        :param values_attribute_name:
+        :return: Size report of the written items. See create_size_report.
+        """
+        size_report = []
+        date_values = {}
+        months = set()
+        for day_number, value in zip(day_numbers, values):
+            date_str = date.fromordinal(DAY_NUMBER_EPOCH_ORDINAL + day_number).isoformat()
+            month = self.format_month(date_str)
+            if month not in months and len(months) == self.DAY_ARRAY_WRITE_MONTHS:
+                size_report.extend(self.put_month_buckets(date_values=date_values,
+                                                          partition_key_value=partition_key_value,
+                                                          values_attribute_name=values_attribute_name))
+                date_values = {}
+                months = set()
+            months.add(month)
+            # Missing values are stored the way FRED reports them, the same as observations written by put_fred_data
+            date_values[date_str] = '.' if math.isnan(value) else value
+        if date_values:
+            size_report.extend(self.put_month_buckets(date_values=date_values,
+                                                      partition_key_value=partition_key_value,
+                                                      values_attribute_name=values_attribute_name))
+        return size_report
+
+    def put_pf_data(self, data: dict, partition_key_value, values_attribute_name) -> list[dict]:
+        """
+
+        :param data: Expected format is {date: value}
+        :param partition_key_value:
+        :param values_attribute_name:
+        :return: Size report of the written items. See create_size_report.
+        """
+        return self.put_month_buckets(date_values=data,
+                                      partition_key_value=partition_key_value,
+                                      values_attribute_name=values_attribute_name)
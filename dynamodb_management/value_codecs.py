@@ -0,0 +1,174 @@
+from datetime import date
+from decimal import Decimal, InvalidOperation
+import hashlib
+import json
+import math
+import struct
+from typing import Union
+
+
+class InvalidEncodedValuesError(Exception):
+    pass
+
+
+def _to_decimal(value) -> Union[Decimal, None]:
+    """
+    :return: The value as a Decimal, or None if it isn't a number (e.g. FRED's '.' or a NaN)
+    """
+    try:
+        decimal_value = Decimal(str(value))
+    except (InvalidOperation, ValueError):
+        return None
+    return None if decimal_value.is_nan() or decimal_value.is_infinite() else decimal_value
+
+
+def hash_month_values(month_values: dict) -> str:
+    """
+    Content hash of a month's {date: value}. Numbers hash the same whatever their type or trailing zeros (5.3, '5.30'
+    and Decimal('5.3')) and every value that isn't a number hashes as '.', so values decoded by any codec hash the same
+    as the values they were encoded from.
+    """
+    canonical_values = []
+    for date_str in sorted(month_values):
+        decimal_value = _to_decimal(month_values[date_str])
+        canonical_value = '.' if decimal_value is None else format(decimal_value.normalize(), 'f')
+        canonical_values.append(f"{date_str}={canonical_value}")
+    return hashlib.blake2b(';'.join(canonical_values).encode('utf-8'), digest_size=16).hexdigest()
+
+
+class JsonValueCodec:
+    """
+    Stores a month's values as a JSON formatted {date: value} string attribute.
+    """
+
+    name = 'json'
+
+    def encode(self, month_values: dict) -> str:
+        return json.dumps(dict(sorted(month_values.items())), separators=(',', ':'))
+
+    def decode(self, encoded_values: str) -> dict:
+        return json.loads(encoded_values)
+
+    def last_date(self, encoded_values: str) -> Union[str, None]:
+        # YYYY-MM-DD strings sort in date order, so no date parsing is needed to find the latest
+        month_values = self.decode(encoded_values)
+        return max(month_values) if month_values else None
+
+
+class PackedValueCodec:
+    """
+    Stores a month's values as a Binary attribute made of a header and a packed little-endian float64 array.
+
+    The header holds a format version, the month's year and month, and a 32-bit bitmap where bit N is set when day N+1
+    of the month has a value. Values are stored in day order, one per set bit. Values that are not numbers (FRED uses
+    '.' for missing observations) are stored as NaN.
+    """
+
+    name = 'packed'
+
+    FORMAT_VERSION = 1
+    HEADER_STRUCT = struct.Struct('<BHBI')
+
+    def encode(self, month_values: dict) -> bytes:
+        if not month_values:
+            raise InvalidEncodedValuesError("Cannot encode a month without values.")
+
+        dates = sorted(month_values)
+        year, month = int(dates[0][0:4]), int(dates[0][5:7])
+        day_bitmap = 0
+        packed_values = []
+        for date_str in dates:
+            if int(date_str[0:4]) != year or int(date_str[5:7]) != month:
+                raise InvalidEncodedValuesError(f"Date {date_str} is not in month {year:04d}-{month:02d}.")
+            day_bitmap |= 1 << (int(date_str[8:10]) - 1)
+            packed_values.append(self._to_float(month_values[date_str]))
+
+        header = self.HEADER_STRUCT.pack(self.FORMAT_VERSION, year, month, day_bitmap)
+        return header + struct.pack(f'<{len(packed_values)}d', *packed_values)
+
+    def _unpack(self, encoded_values) -> tuple[int, int, list[int], tuple]:
+        encoded_bytes = bytes(getattr(encoded_values, 'value', encoded_values))
+        version, year, month, day_bitmap = self.HEADER_STRUCT.unpack_from(encoded_bytes)
+        if version != self.FORMAT_VERSION:
+            raise InvalidEncodedValuesError(f"Unsupported packed values format version {version}.")
+
+        days = [day_offset + 1 for day_offset in range(32) if day_bitmap >> day_offset & 1]
+        values = struct.unpack_from(f'<{len(days)}d', encoded_bytes, self.HEADER_STRUCT.size)
+        return year, month, days, values
+
+    def decode(self, encoded_values) -> dict:
+        year, month, days, values = self._unpack(encoded_values)
+        return {f'{year:04d}-{month:02d}-{day:02d}': value for day, value in zip(days, values)}
+
+    def last_date(self, encoded_values) -> Union[str, None]:
+        encoded_bytes = bytes(getattr(encoded_values, 'value', encoded_values))
+        _, year, month, day_bitmap = self.HEADER_STRUCT.unpack_from(encoded_bytes)
+        if not day_bitmap:
+            return None
+        return date(year, month, day_bitmap.bit_length()).isoformat()
+
+    @staticmethod
+    def _to_float(value) -> float:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return math.nan
+
+
+class MapValueCodec:
+    """
+    Stores a month's values as a Map attribute of {date: Number}, with '.' for values that are not numbers (FRED uses
+    '.' for missing observations). Single days of a Map can be set with an UpdateItem, so DynamoDbManager only writes
+    the days that changed instead of the whole month.
+    """
+
+    name = 'map'
+
+    # Stored in place of values that are not numbers
+    MISSING_VALUE = '.'
+
+    @classmethod
+    def encode_value(cls, value) -> Union[Decimal, str]:
+        decimal_value = _to_decimal(value)
+        return cls.MISSING_VALUE if decimal_value is None else decimal_value
+
+    def encode(self, month_values: dict) -> dict:
+        return {date_str: self.encode_value(month_values[date_str]) for date_str in sorted(month_values)}
+
+    def decode(self, encoded_values: dict) -> dict:
+        # Numbers are read back as Decimals
+        return dict(encoded_values)
+
+    def last_date(self, encoded_values: dict) -> Union[str, None]:
+        return max(encoded_values) if encoded_values else None
+
+
+VALUE_CODECS = {
+    MapValueCodec.name: MapValueCodec,
+    JsonValueCodec.name: JsonValueCodec,
+    PackedValueCodec.name: PackedValueCodec
+}
+
+
+def create_value_codec(codec_name: str):
+    """
+    :param codec_name: 'map', 'json' or 'packed'
+    :return: A new value codec instance
+    """
+    try:
+        return VALUE_CODECS[codec_name]()
+    except KeyError:
+        raise InvalidEncodedValuesError(f"Unknown value codec '{codec_name}'. Valid codecs are "
+                                        f"{', '.join(VALUE_CODECS)}.")
+
+
+def detect_value_codec(encoded_values):
+    """
+    Determines the codec of a stored values attribute from its DynamoDB type, so items written by any codec can be read
+    regardless of the codec currently used for writes.
+    """
+    if isinstance(encoded_values, dict):
+        return MapValueCodec()
+    if isinstance(encoded_values, str):
+        return JsonValueCodec()
+    return PackedValueCodec()
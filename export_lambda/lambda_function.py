@@ -0,0 +1,55 @@
+from lambda_runtime_management import InitProfiler, create_parameter_cache, get_dynamodb_manager
+
+init_profiler = InitProfiler()
+
+with init_profiler.stage('aws_lambda_powertools'):
+    from aws_lambda_powertools import Logger
+
+with init_profiler.stage('project_modules'):
+    from columnar_export import ColumnarExporter
+    from metrics_management import instrument_handler
+
+SERVICE_NAME = "columnar_export"
+logger = Logger(service=SERVICE_NAME)
+
+# Export settings when 'export_dir', 'export_max_concurrency' and 'export_compact_after_segments' are not set in
+# configs. The export directory should be an EFS mount shared with the web tier; /tmp only lasts as long as the
+# container.
+DEFAULT_EXPORT_DIR = '/tmp/columnar_export'
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_COMPACT_AFTER_SEGMENTS = 32
+
+parameter_cache = create_parameter_cache()
+
+init_profiler.finish_init()
+
+
+@logger.inject_lambda_context
+@instrument_handler(service=SERVICE_NAME, logger=logger)
+def lambda_handler(event, context):
+    """
+    Appends the days added to every series since the last export to the columnar export. Schedule it after the FRED and
+    Petfinder pulls. The event may set 'full': true to export every series again from its first day, which picks up
+    revisions of days that were already exported.
+
+    :return: Export summary. See ColumnarExporter.export.
+    """
+    init_profiler.log_cold_start_report(logger=logger)
+
+    config_values, configs_version = parameter_cache.get(parameter_name='configs')
+    dynamodb_manager = get_dynamodb_manager(config_values=config_values,
+                                            configs_version=configs_version)
+
+    exporter = ColumnarExporter(
+        dynamodb_manager=dynamodb_manager,
+        values_attribute_names={
+            'fred_': config_values['db_fred_values_attribute_name'],
+            'pf_': config_values['db_pf_values_attribute_name']
+        },
+        export_dir=config_values.get('export_dir', DEFAULT_EXPORT_DIR),
+        default_start_date=config_values['default_data_start_date'],
+        max_workers=max(1, int(config_values.get('export_max_concurrency', DEFAULT_MAX_CONCURRENCY))),
+        compact_after_segments=int(config_values.get('export_compact_after_segments',
+                                                     DEFAULT_COMPACT_AFTER_SEGMENTS))
+    )
+    return exporter.export(full=bool(event.get('full')))
@@ -1 +1,2 @@
 from .fred_api_connection_manager import FredApiConnectionManager, FredApiRequest
+from .fred_observations_parser import parse_observations_stream
@@ -1,9 +1,13 @@
+from array import array
+import json
 import logging
-import time
 
 import requests
 
+from http_transport_management import HttpTransport, MaxHttpRequestTriesError, get_shared_transport
+from metrics_management import get_metrics_recorder
 from .fred_api_request import FredApiRequest
+from .fred_observations_parser import parse_observations_stream
 
 
 class MaxFredDataRequestTriesError(Exception):
@@ -12,56 +16,111 @@ class MaxFredDataRequestTriesError(Exception):
 
 class FredApiConnectionManager:
 
-    def __init__(self, observations_api_url):
+    def __init__(self, observations_api_url, transport: HttpTransport = None):
+        """
+
+        :param observations_api_url: FRED series observations API URL
+        :param transport: HTTP transport used for requests. Defaults to the shared pooled transport.
+        """
         self.observations_api_url = observations_api_url
+        self.transport = transport or get_shared_transport()
         self.logger = logging.getLogger(name='FredApiConnectionManager')
 
-    def make_request(self, fred_api_request: FredApiRequest, api_key: str,  retry_seconds: list[int]):
+    # Size of the decompressed chunks streamed into the observations parser
+    STREAM_CHUNK_BYTES = 1 << 16
+
+    def make_request(self, fred_api_request: FredApiRequest, api_key: str):
         """
 
         :param fred_api_request:
         :param api_key:
-        :param retry_seconds:
         :return: Request data in JSON format
         """
         params = fred_api_request.parameters
         params['series_id'] = fred_api_request.series_id
         params['api_key'] = api_key
+        metrics_recorder = get_metrics_recorder()
+        metric_dimensions = {'api': 'fred'}
+        metric_properties = {'series': fred_api_request.name}
+
+        try:
+            response = self.transport.get(url=self.observations_api_url,
+                                          request_name=f"FRED series {fred_api_request.series_id}",
+                                          params=params,
+                                          metric_dimensions=metric_dimensions,
+                                          metric_properties=metric_properties)
+        except MaxHttpRequestTriesError as error:
+            raise MaxFredDataRequestTriesError(str(error)) from error
+        except requests.RequestException as error:
+            self.logger.error(f"FRED API failed request for series ID '{fred_api_request.series_id}'.\n"
+                              f"Details:{str(error)}")
+            raise error
+        self.logger.info(f"FRED API successful request for series ID '{fred_api_request.series_id}'.")
+        metrics_recorder.record('api_response_bytes', len(response.content), unit='Bytes', properties=metric_properties,
+                                **metric_dimensions)
+
+        try:
+            with metrics_recorder.timer('json_decode_time', properties=metric_properties, **metric_dimensions):
+                return response.json()
+        except requests.exceptions.JSONDecodeError as error:
+            self.logger.error(f"Error when attempting to decode JSON for series ID '{fred_api_request.series_id}'.\n"
+                              f"Details: {str(error)}")
+            raise error
+
+    def stream_observations(self, fred_api_request: FredApiRequest, api_key: str) -> tuple[array, array]:
+        """
+        Requests the series' observations and parses them while the response streams in, instead of decoding the
+        whole body into a list of dicts as make_request does. Preferred for long histories.
+
+        :param fred_api_request:
+        :param api_key:
+        :return: (day numbers as array('i') of days since 1970-01-01, values as array('d') with NaN for missing
+            observations)
+        """
+        params = fred_api_request.parameters
+        params['series_id'] = fred_api_request.series_id
+        params['api_key'] = api_key
+        metrics_recorder = get_metrics_recorder()
+        metric_dimensions = {'api': 'fred'}
+        metric_properties = {'series': fred_api_request.name}
+
+        try:
+            response = self.transport.get(url=self.observations_api_url,
+                                          request_name=f"FRED series {fred_api_request.series_id}",
+                                          params=params,
+                                          metric_dimensions=metric_dimensions,
+                                          metric_properties=metric_properties,
+                                          stream=True)
+        except MaxHttpRequestTriesError as error:
+            raise MaxFredDataRequestTriesError(str(error)) from error
+        except requests.RequestException as error:
+            self.logger.error(f"FRED API failed request for series ID '{fred_api_request.series_id}'.\n"
+                              f"Details:{str(error)}")
+            raise error
+        self.logger.info(f"FRED API successful request for series ID '{fred_api_request.series_id}'.")
+
+        response_bytes = 0
+
+        def count_chunks():
+            nonlocal response_bytes
+            for chunk in response.iter_content(chunk_size=self.STREAM_CHUNK_BYTES):
+                response_bytes += len(chunk)
+                yield chunk
 
-        # The 0th index of retry_seconds represents the sleep time for when "tries" is 1 (the second try).
-        max_tries = len(retry_seconds) + 1
-        for tries in range(max_tries):
-            if tries >= 1:
-                self.logger.info(f"Beginning FRED API request retry number {tries} for series {fred_api_request.series_id}.")
-                # The 0th index of retry_seconds represents the sleep time for when "tries" is 1 (the second try).
-                time.sleep(retry_seconds[tries - 1])
-
-            try:
-                response = requests.get(url=self.observations_api_url,
-                                        params=params)
-                response.raise_for_status()
-            except requests.RequestException as error:
-                self.logger.error(f"FRED API failed request for series ID '{fred_api_request.series_id}.\n"
-                                  f"Details:{str(error)}")
-                if tries == max_tries:
-                    self.logger.error(f"Reached last API request try. Exception raised when decoding JSON.\nExiting this "
-                                      f"API request.")
-                    raise error
-                continue
-            self.logger.info(f"FRED API successful request for series ID '{fred_api_request.series_id}'.")
-
-            try:
-                json_data = response.json()
-                return json_data
-            except requests.exceptions.JSONDecodeError as error:
-                if tries == max_tries:
-                    self.logger.error(
-                        f"Reached last API request try. Exception raised when decoding JSON.\nDetails: {str(error)}\n"
-                        f"Exiting this API request.")
-                    raise error
-                else:
-                    self.logger.error(f"Error when attempting to decode JSON.\nDetails: {str(error)}")
-
-        # Out of the for loop - this is reached if no data is successfully received
-        self.logger.error("Max request attempts reached.")
-        raise MaxFredDataRequestTriesError
+        # The body is read while parsing, so json_decode_time includes the time spent receiving it
+        try:
+            with metrics_recorder.timer('json_decode_time', properties=metric_properties, **metric_dimensions):
+                observations = parse_observations_stream(count_chunks())
+        except json.JSONDecodeError as error:
+            self.logger.error(f"Error when attempting to decode JSON for series ID '{fred_api_request.series_id}'.\n"
+                              f"Details: {str(error)}")
+            raise requests.exceptions.JSONDecodeError(error.msg, error.doc, error.pos) from error
+        except requests.RequestException as error:
+            self.logger.error(f"FRED API response failed for series ID '{fred_api_request.series_id}'.\n"
+                              f"Details:{str(error)}")
+            raise error
+        finally:
+            response.close()
+        metrics_recorder.record('api_response_bytes', response_bytes, unit='Bytes', properties=metric_properties,
+                                **metric_dimensions)
+        return observations
@@ -0,0 +1,128 @@
+from array import array
+import codecs
+from datetime import date
+import json
+import math
+import re
+from typing import Iterable
+
+
+# Day numbers count days since 1970-01-01, the same convention as NumPy's datetime64[D]
+DAY_NUMBER_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Text left unparsed at the front of the buffer is dropped once it grows past this many characters
+BUFFER_COMPACT_CHARS = 1 << 16
+
+SEPARATOR_PATTERN = re.compile(r'[\s,]*')
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except ValueError:
+        return math.nan
+
+
+def parse_observations_stream(chunks: Iterable[bytes]) -> tuple[array, array]:
+    """
+    Parses the 'observations' array of a FRED observations response incrementally, so the full response body and the
+    list of observation dicts are never held in memory at once.
+
+    The complete observations in the buffer are decoded with a single json.loads call, which keeps nearly all of the
+    parsing in C. Observation objects hold no nested objects, so the buffer's last '}' ends a complete observation.
+    Anything that doesn't decode that way (the end of the array, or a '}' inside a string) falls back to decoding one
+    observation at a time.
+
+    :param chunks: Response body as UTF-8 byte chunks, e.g. requests' Response.iter_content()
+    :return: (day numbers as array('i') of days since 1970-01-01, values as array('d')). Values FRED reports as
+        missing ('.') are NaN.
+    :raises json.JSONDecodeError: When the body is not a valid observations response
+    """
+    # The decoder's C scanner parses one observation object per call, without raw_decode's Python level wrapper
+    scan_once = json.JSONDecoder().scan_once
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    chunk_iterator = iter(chunks)
+    day_numbers = array('i')
+    values = array('d')
+
+    buffer = ''
+    position = 0
+    is_exhausted = False
+
+    def read_more() -> bool:
+        nonlocal buffer, position, is_exhausted
+        if is_exhausted:
+            return False
+        chunk = next(chunk_iterator, None)
+        if chunk is None:
+            is_exhausted = True
+            buffer = buffer[position:] + text_decoder.decode(b'', final=True)
+        else:
+            buffer = buffer[position:] + text_decoder.decode(chunk)
+        position = 0
+        return True
+
+    def skip_separators():
+        nonlocal position
+        while True:
+            position = SEPARATOR_PATTERN.match(buffer, position).end()
+            if position < len(buffer) or not read_more():
+                return
+
+    # Skip ahead to the opening bracket of the observations array. Keys before it (count, units, ...) are ignored.
+    while True:
+        key_index = buffer.find('"observations"', position)
+        if key_index >= 0:
+            bracket_index = buffer.find('[', key_index)
+            if bracket_index >= 0:
+                position = bracket_index + 1
+                break
+            position = key_index
+        else:
+            # Keep a tail in case the key is split across chunks
+            position = max(position, len(buffer) - len('"observations"'))
+        if not read_more():
+            raise json.JSONDecodeError("Response has no observations array", buffer, position)
+
+    while True:
+        skip_separators()
+        if position >= len(buffer):
+            raise json.JSONDecodeError("Unterminated observations array", buffer, position)
+        if buffer[position] == ']':
+            return day_numbers, values
+
+        array_end = buffer.find(']', position)
+        last_object_end = buffer.rfind('}', position, array_end if array_end >= 0 else len(buffer))
+        observations = None
+        if last_object_end > position:
+            try:
+                observations = json.loads(f'[{buffer[position:last_object_end + 1]}]')
+                end_position = last_object_end + 1
+            except json.JSONDecodeError:
+                pass
+        if observations is None:
+            try:
+                observation, end_position = scan_once(buffer, position)
+                observations = [observation]
+            except (StopIteration, json.JSONDecodeError):
+                # The observation is split across chunks, unless the stream has ended
+                if read_more():
+                    continue
+                raise json.JSONDecodeError("Invalid observation", buffer, position)
+
+        try:
+            day_numbers.extend([date.fromisoformat(observation['date']).toordinal() - DAY_NUMBER_EPOCH_ORDINAL
+                                for observation in observations])
+        except (KeyError, TypeError, ValueError):
+            raise json.JSONDecodeError("Observation without a valid date", buffer, position)
+        try:
+            # FRED reports missing observations as '.'
+            values.extend([math.nan if observation['value'] == '.' else float(observation['value'])
+                           for observation in observations])
+        except ValueError:
+            values.extend([_to_float(observation['value']) for observation in observations])
+
+        position = end_position
+        if position > BUFFER_COMPACT_CHARS:
+            buffer = buffer[position:]
+            position = 0
@@ -1,30 +1,85 @@
-from datetime import datetime, timedelta
-import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
 import os
-import requests
 from typing import Union
-import urllib3
 
-from aws_lambda_powertools import Logger
-from aws_cache_retrieval import AwsVariableRetriever
+from lambda_runtime_management import InitProfiler, create_parameter_cache, get_dynamodb_manager
 
-from dynamodb_management import DynamoDbManager
-from fred_lambda.fred_api_management import FredApiConnectionManager as FredManager, FredApiRequest as FredRequest
+init_profiler = InitProfiler()
 
+with init_profiler.stage('aws_lambda_powertools'):
+    from aws_lambda_powertools import Logger
 
-logger = Logger(service="fred_api_pull")
+with init_profiler.stage('requests'):
+    import requests
 
-http = urllib3.PoolManager()
+with init_profiler.stage('botocore_exceptions'):
+    # Only the exception classes. boto3 itself is still imported on first use by DynamoDbManager.
+    from botocore.exceptions import BotoCoreError, ClientError
+
+with init_profiler.stage('project_modules'):
+    from backfill_management import BackfillCheckpointStore, BackfillRunner, plan_backfill_chunks
+    from dynamodb_management import DynamoDbManager
+    from dynamodb_management.dynamodb_manager import MaxBatchRequestTriesError, MaxConditionalWriteTriesError
+    from http_transport_management import get_shared_transport
+    from metrics_management import instrument_handler
+    from fred_lambda.fred_api_management import FredApiConnectionManager as FredManager, \
+        FredApiRequest as FredRequest
+    from fred_lambda.fred_api_management.fred_api_connection_manager import MaxFredDataRequestTriesError
+
+
+SERVICE_NAME = "fred_api_pull"
+logger = Logger(service=SERVICE_NAME)
 
-AWS_SESSION_TOKEN = os.environ['AWS_SESSION_TOKEN']
-AWS_REGION = os.environ['AWS_REGION']
-CACHE_PORT = os.environ['PARAMETERS_SECRETS_EXTENSION_HTTP_PORT']
 ENV = os.environ['ENV']
-PROJECT_NAME = os.environ['FRED_PROJECT_NAME']
 
-aws_variable_retriever = AwsVariableRetriever(cache_port=CACHE_PORT,
-                                              project_name=PROJECT_NAME,
-                                              aws_session_token=AWS_SESSION_TOKEN)
+# Number of series fetched and stored at once when 'fred_max_concurrency' is not set in configs. Capped at the number
+# of series.
+DEFAULT_MAX_CONCURRENCY = 4
+# Backfill chunking when 'fred_backfill_chunk_months' and 'fred_backfill_max_concurrency' are not set in configs
+DEFAULT_BACKFILL_CHUNK_MONTHS = 120
+DEFAULT_BACKFILL_MAX_CONCURRENCY = 4
+# No new backfill chunks are started with less time than this left before the Lambda times out
+BACKFILL_MIN_REMAINING_MILLIS = 60000
+
+# Everything below is created on first use and kept for warm invocations
+cached_fred_manager = None
+cached_managers_configs_version = None
+cached_executor = None
+cached_executor_max_workers = None
+
+
+parameter_cache = create_parameter_cache()
+
+init_profiler.finish_init()
+
+
+def get_managers(config_values: dict, configs_version: str) -> tuple[DynamoDbManager, FredManager]:
+    """
+    Returns the DynamoDB and FRED managers of previous invocations, unless the configs have changed since they were
+    built. Reusing them keeps their boto3 resources and pooled connections alive across warm invocations.
+    """
+    global cached_fred_manager, cached_managers_configs_version
+    dynamodb_manager = get_dynamodb_manager(config_values=config_values, configs_version=configs_version)
+    if cached_managers_configs_version != configs_version:
+        cached_fred_manager = FredManager(observations_api_url=config_values['fred_api_url'],
+                                          transport=get_shared_transport(config_values=config_values))
+        cached_managers_configs_version = configs_version
+    return dynamodb_manager, cached_fred_manager
+
+
+def get_executor(max_concurrency: int) -> ThreadPoolExecutor:
+    """
+    Returns the worker pool of previous invocations when its size still matches. Its threads, and the boto3 resource
+    each thread holds, then survive across warm invocations.
+    """
+    global cached_executor, cached_executor_max_workers
+    if cached_executor is None or cached_executor_max_workers != max_concurrency:
+        if cached_executor is not None:
+            cached_executor.shutdown(wait=True)
+        cached_executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='fred_request')
+        cached_executor_max_workers = max_concurrency
+    return cached_executor
 
 
 def determine_observation_start(last_updated_day: datetime, default_date: str) -> Union[str, None]:
@@ -52,7 +107,8 @@ def create_fred_requests(requests_json) -> list[FredRequest]:
     fred_requests = []
     for request_name, request_values in requests_json.items():
         request_series_id = request_values['series_id']
-        request_params = request_values.get('parameters', {})
+        # Copied, as requests add their own parameters and requests_json is cached across invocations
+        request_params = dict(request_values.get('parameters', {}))
         new_request = FredRequest(name=request_name,
                                   series_id=request_series_id,
                                   parameters=request_params)
@@ -60,46 +116,140 @@ def create_fred_requests(requests_json) -> list[FredRequest]:
     return fred_requests
 
 
+def format_partition_key_value(request: FredRequest) -> str:
+    return f"fred_{request.name}"
+
+
+def process_fred_request(request: FredRequest, last_updated_day: Union[datetime, None], fred_manager: FredManager,
+                         dynamodb_manager: DynamoDbManager, config_values: dict) -> bool:
+    """
+    Fetches and stores the new observations of a single FRED series. Safe to run concurrently with other series, as
+    each series only touches its own request object and partition key.
+
+    :param last_updated_day: Last updated day of the series, or None if the series has no data
+    :return: True if new data was uploaded, False if the series was already up to date.
+    """
+    partition_key_value = format_partition_key_value(request)
+    observation_start_str = determine_observation_start(last_updated_day=last_updated_day,
+                                                        default_date=config_values['default_data_start_date'])
+
+    if not observation_start_str:
+        return False
+
+    request.add_parameter(name='observation_start',
+                          value=observation_start_str)
+    day_numbers, values = fred_manager.stream_observations(api_key=config_values['fred_api_key'],
+                                                           fred_api_request=request)
+    dynamodb_manager.put_day_arrays(partition_key_value=partition_key_value,
+                                    day_numbers=day_numbers,
+                                    values=values,
+                                    values_attribute_name=config_values['db_fred_values_attribute_name'])
+    logger.info(f"Successfully uploaded data to DynamoDB for request {request.name}.")
+    return True
+
+
 @logger.inject_lambda_context
+@instrument_handler(service=SERVICE_NAME, logger=logger)
 def lambda_handler(event, context):
-    raw_config_values = aws_variable_retriever.retrieve_parameter_value(parameter_name='configs',
-                                                                        expect_json=True)
-    config_values = json.loads(raw_config_values)
+    init_profiler.log_cold_start_report(logger=logger)
 
-    raw_fred_requests = aws_variable_retriever.retrieve_parameter_value(parameter_name='fred_requests',
-                                                                        expect_json=True)
-    fred_requests_json = json.loads(raw_fred_requests)
+    config_values, configs_version = parameter_cache.get(parameter_name='configs')
+    fred_requests_json, _ = parameter_cache.get(parameter_name='fred_requests')
     fred_requests = create_fred_requests(requests_json=fred_requests_json)
 
-    dynamodb_manager = DynamoDbManager(table_name=config_values['db_table_name'],
-                                       region=AWS_REGION,
-                                       partition_key_name=config_values['db_partition_key_name'],
-                                       sort_key_name=config_values['db_sort_key_name'])
+    dynamodb_manager, fred_manager = get_managers(config_values=config_values,
+                                                  configs_version=configs_version)
+
+    last_updated_days = dynamodb_manager.get_last_updated_days(
+        partition_key_values=[format_partition_key_value(request) for request in fred_requests],
+        values_attribute_name=config_values['db_fred_values_attribute_name']
+    )
+
+    # Each series runs in its own worker, so one series' retry sleeps don't hold up the others
+    max_concurrency = max(1, min(len(fred_requests),
+                                 int(config_values.get('fred_max_concurrency', DEFAULT_MAX_CONCURRENCY))))
+    request_executor = get_executor(max_concurrency=max_concurrency)
+    failed_request_names = []
+    futures = {
+        request_executor.submit(process_fred_request,
+                                request=request,
+                                last_updated_day=last_updated_days[format_partition_key_value(request)],
+                                fred_manager=fred_manager,
+                                dynamodb_manager=dynamodb_manager,
+                                config_values=config_values): request
+        for request in fred_requests
+    }
+    for future in as_completed(futures):
+        request = futures[future]
+        try:
+            future.result()
+        except (requests.exceptions.RequestException, MaxFredDataRequestTriesError) as e:
+            logger.error(f"FRED request {request.name} failed.\nDetails: {str(e)}")
+            failed_request_names.append(request.name)
+        except (ClientError, BotoCoreError, MaxBatchRequestTriesError, MaxConditionalWriteTriesError) as e:
+            # The watermark never advances past months that weren't written, so the next run picks the series up again
+            logger.error(f"Storing FRED request {request.name} failed.\nDetails: {str(e)}")
+            failed_request_names.append(request.name)
 
-    fred_manager = FredManager(observations_api_url=config_values['fred_api_url'])
+    if failed_request_names:
+        logger.error(f"{len(failed_request_names)} of {len(fred_requests)} FRED requests failed: "
+                     f"{', '.join(failed_request_names)}")
 
-    default_data_start_date = config_values['default_data_start_date']
-    for request in fred_requests:
-        partition_key_value = f"fred_{request.name}"
-        last_updated_day = dynamodb_manager.get_last_updated_day(partition_key_value=partition_key_value,
-                                                                 values_attribute_name=config_values['db_fred_values_attribute_name'])
-        observation_start_str = determine_observation_start(last_updated_day=last_updated_day,
-                                                            default_date=default_data_start_date)
 
-        if not observation_start_str:
-            continue
+@logger.inject_lambda_context
+@instrument_handler(service=SERVICE_NAME, logger=logger)
+def backfill_handler(event, context):
+    """
+    Loads the full history of the FRED series in chunks of whole months, fetched and written across a worker pool.
+    Completed chunks are checkpointed, so invoking the handler again after a timeout resumes the backfill.
 
-        request.add_parameter(name='observation_start',
-                              value=observation_start_str)
-        try:
-            request_json_data = fred_manager.make_request(api_key=config_values['fred_api_key'],
-                                                          fred_api_request=request,
-                                                          retry_seconds=config_values['fred_retry_seconds'])
-            observations_data = request_json_data['observations']
-            dynamodb_manager.put_fred_data(partition_key_value=request.name,
-                                           data=observations_data,
-                                           values_attribute_name=config_values['db_fred_values_attribute_name'])
-            logger.info(f"Successfully uploaded data to DynamoDB for request {request.name}.")
-        except requests.exceptions.JSONDecodeError as e:
-            logger.error(str(e))
-            continue
+    The event may set 'start_date' and 'end_date' (YYYY-MM-DD, defaulting to 'default_data_start_date' and today) and
+    'series', a list of request names to backfill instead of all of them.
+    """
+    init_profiler.log_cold_start_report(logger=logger)
+
+    config_values, configs_version = parameter_cache.get(parameter_name='configs')
+    fred_requests_json, _ = parameter_cache.get(parameter_name='fred_requests')
+    fred_requests = create_fred_requests(requests_json=fred_requests_json)
+    if event.get('series'):
+        fred_requests = [request for request in fred_requests if request.name in event['series']]
+
+    dynamodb_manager, fred_manager = get_managers(config_values=config_values,
+                                                  configs_version=configs_version)
+
+    chunks = plan_backfill_chunks(start_date=event.get('start_date', config_values['default_data_start_date']),
+                                  end_date=event.get('end_date', date.today().isoformat()),
+                                  chunk_months=int(config_values.get('fred_backfill_chunk_months',
+                                                                     DEFAULT_BACKFILL_CHUNK_MONTHS)))
+    requests_by_partition_key_value = {format_partition_key_value(request): request for request in fred_requests}
+
+    def fetch_chunk(partition_key_value, chunk):
+        request = requests_by_partition_key_value[partition_key_value]
+        chunk_start, chunk_end = chunk
+        # Each chunk gets its own request, as chunks of the same series run concurrently
+        chunk_request = FredRequest(name=request.name,
+                                    series_id=request.series_id,
+                                    parameters={**request.parameters,
+                                                'observation_start': chunk_start,
+                                                'observation_end': chunk_end})
+        return fred_manager.stream_observations(api_key=config_values['fred_api_key'],
+                                                fred_api_request=chunk_request)
+
+    def store_chunk(partition_key_value, chunk, observations):
+        day_numbers, values = observations
+        dynamodb_manager.put_day_arrays(partition_key_value=partition_key_value,
+                                        day_numbers=day_numbers,
+                                        values=values,
+                                        values_attribute_name=config_values['db_fred_values_attribute_name'])
+
+    backfill_runner = BackfillRunner(checkpoint_store=BackfillCheckpointStore(dynamodb_manager=dynamodb_manager),
+                                     max_workers=max(1, int(config_values.get('fred_backfill_max_concurrency',
+                                                                              DEFAULT_BACKFILL_MAX_CONCURRENCY))),
+                                     context=context,
+                                     min_remaining_millis=BACKFILL_MIN_REMAINING_MILLIS)
+    backfill_summary = backfill_runner.run(series_chunks={partition_key_value: chunks
+                                                          for partition_key_value in requests_by_partition_key_value},
+                                           fetch_chunk=fetch_chunk,
+                                           store_chunk=store_chunk)
+    logger.info(f"FRED backfill finished: {backfill_summary}")
+    return backfill_summary
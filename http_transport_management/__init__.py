@@ -0,0 +1,2 @@
+from .http_transport import HttpTransport, MaxHttpRequestTriesError, get_shared_transport
+from .token_bucket import TokenBucket
@@ -0,0 +1,161 @@
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import logging
+import random
+import threading
+import time
+from typing import Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics_management import get_metrics_recorder
+
+
+class MaxHttpRequestTriesError(Exception):
+    pass
+
+
+class HttpTransport:
+    """
+    Pooled HTTP transport shared by the FRED and Petfinder clients. Connections are kept alive in a requests Session,
+    every request has connect and read timeouts, and failed requests are retried with exponential backoff and full
+    jitter, honoring any Retry-After header.
+    """
+
+    # Responses with these status codes are retried. Other 4xx responses are raised to the caller right away.
+    RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+    def __init__(self, connect_timeout_seconds: float = 3.05, read_timeout_seconds: float = 30,
+                 max_tries: int = 5, backoff_base_seconds: float = 0.5, backoff_max_seconds: float = 30,
+                 pool_maxsize: int = 10):
+        """
+
+        :param connect_timeout_seconds: Timeout for establishing a connection
+        :param read_timeout_seconds: Timeout between bytes received from the server
+        :param max_tries: Number of tries per request, including the first
+        :param backoff_base_seconds: Upper bound of the sleep before the first retry. Doubles on each following retry.
+        :param backoff_max_seconds: Upper bound of any sleep between retries, including Retry-After sleeps
+        :param pool_maxsize: Number of kept-alive connections per host. Should be at least the number of threads
+            making requests at once.
+        """
+        self.connect_timeout_seconds = connect_timeout_seconds
+        self.read_timeout_seconds = read_timeout_seconds
+        self.max_tries = max_tries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.logger = logging.getLogger(name='HttpTransport')
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers['Accept-Encoding'] = 'gzip'
+
+    def _backoff_seconds(self, tries: int) -> float:
+        # Full jitter: a uniformly random sleep up to the exponential backoff bound
+        return random.uniform(0, min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** tries)))
+
+    def _retry_after_seconds(self, response: requests.Response) -> Union[float, None]:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is None:
+            return None
+        try:
+            retry_after_seconds = float(retry_after)
+        except ValueError:
+            try:
+                retry_at = parsedate_to_datetime(retry_after)
+            except (TypeError, ValueError):
+                return None
+            retry_after_seconds = (retry_at - datetime.now(timezone.utc)).total_seconds()
+        return min(max(retry_after_seconds, 0.0), self.backoff_max_seconds)
+
+    def request(self, method: str, url: str, request_name: str = None, rate_limiter=None, priority: int = 0,
+                metric_dimensions: dict = None, metric_properties: dict = None, **kwargs) -> requests.Response:
+        """
+        :param method: HTTP method
+        :param url:
+        :param request_name: Identifier of the request, used in log messages
+        :param rate_limiter: Optional limiter with acquire(priority) and observe(response) methods. Every try,
+            including retries, acquires from it first, and every response is passed to it, so it can follow the
+            server's rate limit headers and 429s.
+        :param priority: Priority passed to the rate limiter. Lower values go first.
+        :param metric_dimensions: Dimensions of the request's 'api_latency' (per try) and 'api_retries' metrics, e.g.
+            {'api': 'fred'}
+        :param metric_properties: Properties of the same metrics, e.g. {'series': 'gdp'}. See MetricsRecorder.record.
+        :param kwargs: Passed to requests.Session.request, e.g. params, data and headers
+        :return: The successful response
+        :raises requests.HTTPError: When the response has a non-retryable error status code
+        :raises MaxHttpRequestTriesError: When every try failed with a retryable error
+        """
+        request_name = request_name or url
+        kwargs.setdefault('timeout', (self.connect_timeout_seconds, self.read_timeout_seconds))
+        metrics_recorder = get_metrics_recorder()
+        metric_dimensions = metric_dimensions or {}
+
+        sleep_seconds = 0.0
+        for tries in range(self.max_tries):
+            if tries >= 1:
+                self.logger.info(f"Retry number {tries} for request {request_name} in {sleep_seconds:.2f} seconds.")
+                time.sleep(sleep_seconds)
+            if rate_limiter is not None:
+                rate_limiter.acquire(priority=priority)
+            try:
+                with metrics_recorder.timer('api_latency', properties=metric_properties, **metric_dimensions):
+                    response = self.session.request(method=method, url=url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as error:
+                self.logger.error(f"Request {request_name} failed.\nDetails: {str(error)}")
+                sleep_seconds = self._backoff_seconds(tries)
+                continue
+            if rate_limiter is not None:
+                rate_limiter.observe(response)
+
+            if response.status_code in self.RETRY_STATUS_CODES:
+                self.logger.error(f"Request {request_name} failed with status code {response.status_code}.")
+                retry_after_seconds = self._retry_after_seconds(response)
+                sleep_seconds = retry_after_seconds if retry_after_seconds is not None \
+                    else self._backoff_seconds(tries)
+                continue
+
+            metrics_recorder.record('api_retries', tries, properties=metric_properties, **metric_dimensions)
+            response.raise_for_status()
+            return response
+
+        metrics_recorder.record('api_retries', self.max_tries - 1, properties=metric_properties, **metric_dimensions)
+        self.logger.error(f"Max number of tries ({self.max_tries}) reached for request {request_name}.")
+        raise MaxHttpRequestTriesError(f"Max number of tries ({self.max_tries}) reached for request {request_name}.")
+
+    def get(self, url: str, request_name: str = None, **kwargs) -> requests.Response:
+        return self.request('GET', url, request_name=request_name, **kwargs)
+
+    def post(self, url: str, request_name: str = None, **kwargs) -> requests.Response:
+        return self.request('POST', url, request_name=request_name, **kwargs)
+
+
+# Module level, so the transport and its kept-alive connections persist across warm Lambda invocations
+_shared_transport = None
+_shared_transport_lock = threading.Lock()
+
+
+def get_shared_transport(config_values: dict = None) -> HttpTransport:
+    """
+    Returns the process-wide transport, creating it on first use. Timeout and retry settings are read from the
+    optional 'http_*' configs and applied to the existing transport on later calls.
+
+    :param config_values: Lambda configs
+    """
+    global _shared_transport
+    config_values = config_values or {}
+    with _shared_transport_lock:
+        if _shared_transport is None:
+            _shared_transport = HttpTransport(pool_maxsize=config_values.get('http_pool_maxsize', 10))
+        _shared_transport.connect_timeout_seconds = config_values.get('http_connect_timeout_seconds',
+                                                                      _shared_transport.connect_timeout_seconds)
+        _shared_transport.read_timeout_seconds = config_values.get('http_read_timeout_seconds',
+                                                                   _shared_transport.read_timeout_seconds)
+        _shared_transport.max_tries = config_values.get('http_max_tries', _shared_transport.max_tries)
+        _shared_transport.backoff_base_seconds = config_values.get('http_backoff_base_seconds',
+                                                                   _shared_transport.backoff_base_seconds)
+        _shared_transport.backoff_max_seconds = config_values.get('http_backoff_max_seconds',
+                                                                  _shared_transport.backoff_max_seconds)
+        return _shared_transport
@@ -0,0 +1,72 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket that hands out tokens in priority order. Tokens refill continuously at rate_per_second
+    up to capacity. Waiting callers are served lowest priority value first, then in arrival order, so a burst of
+    optional requests queued earlier doesn't delay a critical one.
+    """
+
+    def __init__(self, rate_per_second: float, capacity: float = None):
+        """
+
+        :param rate_per_second: Tokens added per second
+        :param capacity: Most tokens held at once, i.e. the largest burst. Defaults to one second of tokens.
+        """
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_second)
+
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        # Heap of (priority, arrival number) of waiting callers
+        self._waiters = []
+        self._arrivals = itertools.count()
+        self._condition = threading.Condition()
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_second)
+        self._updated_at = now
+
+    def acquire(self, priority: int = 0):
+        """
+        Blocks until a token is available and no caller with a lower priority value is waiting, then takes it.
+        """
+        with self._condition:
+            waiter = (priority, next(self._arrivals))
+            heapq.heappush(self._waiters, waiter)
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self._waiters[0] == waiter and now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    heapq.heappop(self._waiters)
+                    # The next waiter may be able to take a token right away
+                    self._condition.notify_all()
+                    return
+
+                if self._waiters[0] != waiter:
+                    wait_seconds = None
+                elif now < self._paused_until:
+                    wait_seconds = self._paused_until - now
+                else:
+                    wait_seconds = (1 - self._tokens) / self.rate_per_second
+                self._condition.wait(timeout=wait_seconds)
+
+    def pause(self, seconds: float):
+        """
+        Hands out no tokens for the given number of seconds, e.g. after the server answered with a 429.
+        """
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._condition.notify_all()
+
+    def set_rate(self, rate_per_second: float):
+        with self._condition:
+            self._refill(time.monotonic())
+            self.rate_per_second = rate_per_second
+            self._condition.notify_all()
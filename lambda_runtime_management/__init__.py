@@ -0,0 +1,3 @@
+from .aws_runtime import create_parameter_cache, get_aws_variable_retriever, get_dynamodb_manager
+from .init_profiler import InitProfiler
+from .parameter_cache import ParameterCache
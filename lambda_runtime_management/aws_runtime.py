@@ -0,0 +1,62 @@
+import os
+
+from .parameter_cache import ParameterCache
+
+# Everything below is created on first use and kept for warm invocations
+aws_variable_retriever = None
+cached_dynamodb_manager = None
+cached_dynamodb_manager_configs_version = None
+
+
+def get_aws_variable_retriever():
+    """
+    Returns the container's AwsVariableRetriever, created on first use from the Lambda's environment
+    ('PARAMETERS_SECRETS_EXTENSION_HTTP_PORT', 'FRED_PROJECT_NAME' and 'AWS_SESSION_TOKEN').
+    """
+    global aws_variable_retriever
+    if aws_variable_retriever is None:
+        from aws_cache_retrieval import AwsVariableRetriever
+
+        aws_variable_retriever = AwsVariableRetriever(cache_port=os.environ['PARAMETERS_SECRETS_EXTENSION_HTTP_PORT'],
+                                                      project_name=os.environ['FRED_PROJECT_NAME'],
+                                                      aws_session_token=os.environ['AWS_SESSION_TOKEN'])
+    return aws_variable_retriever
+
+
+def create_parameter_cache() -> ParameterCache:
+    """
+    :return: ParameterCache of JSON parameters read through get_aws_variable_retriever, checked for a new version
+        after 'PARAMETER_CACHE_TTL_SECONDS' (environment variable, default 300)
+    """
+    return ParameterCache(
+        retrieve_raw_value=lambda parameter_name: get_aws_variable_retriever().retrieve_parameter_value(
+            parameter_name=parameter_name,
+            expect_json=True
+        ),
+        ttl_seconds=float(os.environ.get('PARAMETER_CACHE_TTL_SECONDS', 300))
+    )
+
+
+def get_dynamodb_manager(config_values: dict, configs_version: str):
+    """
+    Returns the DynamoDB manager of previous invocations, unless the configs have changed since it was built. Reusing it
+    keeps its boto3 resources, pooled connections and writer threads alive across warm invocations.
+
+    :param config_values: The 'configs' parameter, with 'db_table_name', 'db_partition_key_name', 'db_sort_key_name'
+        and optionally 'db_value_codec' (default 'map')
+    :param configs_version: Version of config_values, as returned by ParameterCache.get
+    :return: DynamoDbManager
+    """
+    global cached_dynamodb_manager, cached_dynamodb_manager_configs_version
+    if cached_dynamodb_manager_configs_version != configs_version:
+        # Imported here so Lambdas that never touch DynamoDB don't import it
+        from dynamodb_management import DynamoDbManager, create_value_codec
+
+        cached_dynamodb_manager = DynamoDbManager(table_name=config_values['db_table_name'],
+                                                  region=os.environ['AWS_REGION'],
+                                                  partition_key_name=config_values['db_partition_key_name'],
+                                                  sort_key_name=config_values['db_sort_key_name'],
+                                                  value_codec=create_value_codec(config_values.get('db_value_codec',
+                                                                                                   'map')))
+        cached_dynamodb_manager_configs_version = configs_version
+    return cached_dynamodb_manager
@@ -0,0 +1,46 @@
+from contextlib import contextmanager
+import time
+
+
+class InitProfiler:
+    """
+    Times the stages of a Lambda's init phase (imports and module level setup), and reports them once on the first
+    invocation of the container so cold start cost can be tracked from the logs.
+    """
+
+    def __init__(self):
+        self.init_start = time.perf_counter()
+        self.init_end = None
+        self.stage_seconds = {}
+        self.is_cold_start = True
+
+    @contextmanager
+    def stage(self, stage_name: str):
+        stage_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_seconds[stage_name] = self.stage_seconds.get(stage_name, 0.0) + \
+                                             time.perf_counter() - stage_start
+
+    def finish_init(self):
+        self.init_end = time.perf_counter()
+
+    def report(self) -> dict:
+        """
+        :return: {'init_seconds': float, 'stage_seconds': {stage name: float}}
+        """
+        init_end = self.init_end or time.perf_counter()
+        return {
+            'init_seconds': round(init_end - self.init_start, 4),
+            'stage_seconds': {stage_name: round(seconds, 4) for stage_name, seconds in self.stage_seconds.items()}
+        }
+
+    def log_cold_start_report(self, logger):
+        """
+        Logs the init report on the container's first invocation only. Later (warm) invocations log nothing.
+        """
+        if not self.is_cold_start:
+            return
+        self.is_cold_start = False
+        logger.info("Cold start init profile", extra=self.report())
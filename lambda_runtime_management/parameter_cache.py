@@ -0,0 +1,54 @@
+import hashlib
+import json
+import logging
+import threading
+import time
+
+
+class ParameterCache:
+    """
+    Keeps parsed JSON parameters in process memory across warm invocations. Once a parameter's TTL has passed its raw
+    value is fetched again, but it is only re-parsed, and its version only changes, when the value itself changed.
+    Callers use the version to decide whether anything built from the parameter (managers, request lists) has to be
+    rebuilt.
+
+    AwsVariableRetriever only returns parameter values, so the version is a hash of the raw value rather than the
+    Parameter Store version number.
+    """
+
+    def __init__(self, retrieve_raw_value, ttl_seconds: float = 300):
+        """
+
+        :param retrieve_raw_value: Function taking a parameter name and returning its raw JSON string
+        :param ttl_seconds: Seconds before a cached parameter is checked for changes
+        """
+        self.retrieve_raw_value = retrieve_raw_value
+        self.ttl_seconds = ttl_seconds
+        # {parameter name: (value, version, fetched at)}
+        self._parameters = {}
+        self._lock = threading.Lock()
+        self.logger = logging.getLogger(name='ParameterCache')
+
+    def get(self, parameter_name: str) -> tuple[object, str]:
+        """
+        :return: (parsed parameter value, version of the value)
+        """
+        with self._lock:
+            cached_parameter = self._parameters.get(parameter_name)
+            if cached_parameter and time.monotonic() - cached_parameter[2] < self.ttl_seconds:
+                return cached_parameter[0], cached_parameter[1]
+
+            raw_value = self.retrieve_raw_value(parameter_name)
+            version = hashlib.sha256(raw_value.encode('utf-8')).hexdigest()[:16]
+            if cached_parameter and cached_parameter[1] == version:
+                value = cached_parameter[0]
+            else:
+                self.logger.info(f"Loaded version {version} of parameter {parameter_name}.")
+                value = json.loads(raw_value)
+
+            self._parameters[parameter_name] = (value, version, time.monotonic())
+            return value, version
+
+    def clear(self):
+        with self._lock:
+            self._parameters = {}
@@ -0,0 +1,3 @@
+from .metrics_recorder import MetricsRecorder, get_metrics_recorder
+from .metrics_sinks import JsonFileMetricsSink, PowertoolsMetricsSink, create_metrics_sinks
+from .handler_instrumentation import InvocationProfiler, instrument_handler
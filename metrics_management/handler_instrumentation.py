@@ -0,0 +1,128 @@
+import cProfile
+import functools
+import io
+import os
+import pstats
+import time
+import tracemalloc
+
+from .metrics_recorder import get_metrics_recorder
+from .metrics_sinks import create_metrics_sinks
+
+
+DEFAULT_NAMESPACE = 'PetAdoptionUsEconomy'
+
+
+class InvocationProfiler:
+    """
+    Opt-in profiling of a single handler invocation, enabled by the HANDLER_PROFILE environment variable: 'cprofile',
+    'tracemalloc' or both, comma separated. cProfile only sees the handler's own thread, not the worker pools, while
+    tracemalloc tracks allocations of every thread. Both slow the handler down noticeably, so leave them off outside
+    of investigations.
+    """
+
+    def __init__(self, use_cprofile: bool = False, use_tracemalloc: bool = False, top_entries: int = 25,
+                 output_dir: str = None):
+        """
+
+        :param use_cprofile: Profile function calls with cProfile
+        :param use_tracemalloc: Track memory allocations with tracemalloc
+        :param top_entries: Number of functions and allocation sites included in the report
+        :param output_dir: Optional directory the raw cProfile stats are dumped to, for snakeviz or pstats
+        """
+        self.use_cprofile = use_cprofile
+        self.use_tracemalloc = use_tracemalloc
+        self.top_entries = top_entries
+        self.output_dir = output_dir
+        self._profile = None
+
+    @classmethod
+    def from_environment(cls) -> 'InvocationProfiler':
+        profilers = {profiler.strip() for profiler in os.environ.get('HANDLER_PROFILE', '').split(',')}
+        return cls(use_cprofile='cprofile' in profilers,
+                   use_tracemalloc='tracemalloc' in profilers,
+                   top_entries=int(os.environ.get('HANDLER_PROFILE_TOP_ENTRIES', 25)),
+                   output_dir=os.environ.get('HANDLER_PROFILE_DIR'))
+
+    @property
+    def is_enabled(self) -> bool:
+        return self.use_cprofile or self.use_tracemalloc
+
+    def start(self):
+        if self.use_tracemalloc:
+            tracemalloc.start()
+        if self.use_cprofile:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self, report_name: str) -> dict:
+        """
+        :param report_name: Name of the dumped cProfile stats file, without extension
+        :return: {'cprofile': top functions by cumulative time, 'tracemalloc': {'peak_bytes': int, 'top_allocations':
+            [str]}}, with only the enabled profilers
+        """
+        report = {}
+        if self._profile is not None:
+            self._profile.disable()
+            stats_output = io.StringIO()
+            stats = pstats.Stats(self._profile, stream=stats_output)
+            stats.sort_stats('cumulative').print_stats(self.top_entries)
+            report['cprofile'] = stats_output.getvalue()
+            if self.output_dir:
+                stats.dump_stats(os.path.join(self.output_dir, f"{report_name}.prof"))
+            self._profile = None
+
+        if self.use_tracemalloc and tracemalloc.is_tracing():
+            _, peak_bytes = tracemalloc.get_traced_memory()
+            top_statistics = tracemalloc.take_snapshot().statistics('lineno')[:self.top_entries]
+            tracemalloc.stop()
+            report['tracemalloc'] = {
+                'peak_bytes': peak_bytes,
+                'top_allocations': [str(statistic) for statistic in top_statistics]
+            }
+        return report
+
+
+def instrument_handler(service: str, logger, namespace: str = DEFAULT_NAMESPACE):
+    """
+    Decorates a lambda_handler so that every invocation starts with an empty metrics recorder, records its own
+    duration, runs under the opt-in InvocationProfiler, and ends by publishing the recorded data points to the metrics
+    sinks and logging a summary. Apply it below @logger.inject_lambda_context.
+
+    :param service: Service name of the metrics, e.g. 'fred_api_pull'
+    :param logger: Logger the metrics summary and profiling reports are written to
+    :param namespace: CloudWatch namespace of the metrics
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def instrumented_handler(event, context):
+            metrics_recorder = get_metrics_recorder()
+            metrics_recorder.clear()
+            profiler = InvocationProfiler.from_environment()
+            if profiler.is_enabled:
+                profiler.start()
+
+            start_time = time.perf_counter()
+            try:
+                return handler(event, context)
+            finally:
+                metrics_recorder.record('handler_duration', (time.perf_counter() - start_time) * 1000,
+                                        unit='Milliseconds')
+                if profiler.is_enabled:
+                    profile_report = profiler.stop(
+                        report_name=f"{service}_{getattr(context, 'aws_request_id', int(time.time()))}")
+                    if 'tracemalloc' in profile_report:
+                        metrics_recorder.record('handler_peak_memory', profile_report['tracemalloc']['peak_bytes'],
+                                                unit='Bytes')
+                    logger.info("Handler profile", extra=profile_report)
+
+                data_points = metrics_recorder.drain()
+                logger.info("Invocation metrics", extra={'metrics': metrics_recorder.summarize(data_points)})
+                for sink in create_metrics_sinks(namespace=namespace, service=service):
+                    try:
+                        sink.emit(data_points)
+                    except Exception as e:
+                        # Losing metrics must never fail the data pull itself
+                        logger.error(f"Failed to publish metrics through {type(sink).__name__}.\nDetails: {str(e)}")
+        return instrumented_handler
+    return decorator
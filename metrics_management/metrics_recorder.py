@@ -0,0 +1,97 @@
+from contextlib import contextmanager
+import threading
+import time
+
+
+def _format_string_values(values: dict) -> dict[str, str]:
+    return {name: str(value) for name, value in values.items() if value is not None}
+
+
+class MetricsRecorder:
+    """
+    Thread safe, in-memory collection of the data points recorded during one invocation. Worker threads of the
+    Lambdas record into the same recorder, and the handler instrumentation drains it into the metrics sinks once the
+    invocation ends.
+    """
+
+    def __init__(self):
+        self._data_points = []
+        self._lock = threading.Lock()
+
+    def record(self, metric_name: str, value: float, unit: str = 'Count', properties: dict = None, **dimensions):
+        """
+        :param metric_name: e.g. 'api_latency'
+        :param value:
+        :param unit: CloudWatch unit name, e.g. 'Count', 'Milliseconds' or 'Bytes'
+        :param properties: Context logged with the data point but not used as a dimension, e.g. {'series': 'gdp'}.
+            Use it for anything with many distinct values, since every combination of dimension values is billed as
+            its own CloudWatch metric.
+        :param dimensions: Low-cardinality dimensions, e.g. api='fred'. Dimensions with a None value are left out.
+        """
+        data_point = {
+            'name': metric_name,
+            'value': float(value),
+            'unit': unit,
+            'dimensions': _format_string_values(dimensions),
+            'properties': _format_string_values(properties or {}),
+            'timestamp': time.time()
+        }
+        with self._lock:
+            self._data_points.append(data_point)
+
+    @contextmanager
+    def timer(self, metric_name: str, properties: dict = None, **dimensions):
+        """
+        Records the time spent in the with block, in milliseconds.
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(metric_name, (time.perf_counter() - start_time) * 1000, unit='Milliseconds',
+                        properties=properties, **dimensions)
+
+    def drain(self) -> list[dict]:
+        """
+        :return: Every data point recorded since the last drain, in the format
+            [{'name': str, 'value': float, 'unit': str, 'dimensions': {name: value}, 'properties': {name: value},
+            'timestamp': epoch seconds}]
+        """
+        with self._lock:
+            data_points, self._data_points = self._data_points, []
+        return data_points
+
+    def clear(self):
+        with self._lock:
+            self._data_points = []
+
+    @staticmethod
+    def summarize(data_points: list[dict]) -> dict:
+        """
+        :return: {metric name: {'unit': str, 'count': int, 'sum': float, 'min': float, 'max': float}}, across every
+            dimension value
+        """
+        summary = {}
+        for data_point in data_points:
+            metric_summary = summary.setdefault(data_point['name'], {
+                'unit': data_point['unit'],
+                'count': 0,
+                'sum': 0.0,
+                'min': data_point['value'],
+                'max': data_point['value']
+            })
+            metric_summary['count'] += 1
+            metric_summary['sum'] += data_point['value']
+            metric_summary['min'] = min(metric_summary['min'], data_point['value'])
+            metric_summary['max'] = max(metric_summary['max'], data_point['value'])
+        for metric_summary in summary.values():
+            metric_summary['sum'] = round(metric_summary['sum'], 4)
+        return summary
+
+
+# Module level, so the managers and the handler instrumentation of a Lambda share one recorder
+_metrics_recorder = MetricsRecorder()
+
+
+def get_metrics_recorder() -> MetricsRecorder:
+    return _metrics_recorder
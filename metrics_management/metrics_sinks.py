@@ -0,0 +1,75 @@
+import json
+import logging
+import os
+import time
+
+
+class PowertoolsMetricsSink:
+    """
+    Publishes data points as CloudWatch Embedded Metric Format logs through aws_lambda_powertools. Data points are
+    grouped by their dimensions and properties, as every metric of an EMF object shares the object's dimensions and
+    properties. Properties are written as metadata, which is searchable in the logs but isn't part of the metric.
+    """
+
+    def __init__(self, namespace: str, service: str):
+        self.namespace = namespace
+        self.service = service
+
+    def emit(self, data_points: list[dict]):
+        # Imported on first use, so offline runs that only use the JSON sink don't pay for the import
+        from aws_lambda_powertools.metrics import EphemeralMetrics
+
+        data_points_by_group = {}
+        for data_point in data_points:
+            group_key = (tuple(sorted(data_point['dimensions'].items())),
+                         tuple(sorted(data_point.get('properties', {}).items())))
+            data_points_by_group.setdefault(group_key, []).append(data_point)
+
+        for (dimensions_key, properties_key), group_data_points in data_points_by_group.items():
+            # EphemeralMetrics keeps its own metric set, unlike Metrics, whose metrics are shared by every instance
+            metrics = EphemeralMetrics(namespace=self.namespace, service=self.service)
+            for dimension_name, dimension_value in dimensions_key:
+                metrics.add_dimension(name=dimension_name, value=dimension_value)
+            for property_name, property_value in properties_key:
+                metrics.add_metadata(key=property_name, value=property_value)
+            for data_point in group_data_points:
+                metrics.add_metric(name=data_point['name'], unit=data_point['unit'], value=data_point['value'])
+            metrics.flush_metrics()
+
+
+class JsonFileMetricsSink:
+    """
+    Appends each invocation's data points to a JSON lines file, one line per invocation, for offline runs and the
+    benchmarks.
+    """
+
+    def __init__(self, file_path: str, service: str):
+        self.file_path = file_path
+        self.service = service
+
+    def emit(self, data_points: list[dict]):
+        with open(self.file_path, 'a') as metrics_file:
+            metrics_file.write(json.dumps({
+                'service': self.service,
+                'timestamp': time.time(),
+                'data_points': data_points
+            }) + '\n')
+
+
+def create_metrics_sinks(namespace: str, service: str) -> list:
+    """
+    Creates the sinks listed in the METRICS_SINKS environment variable, a comma separated list of 'emf' (default) and
+    'json'. The JSON sink writes to METRICS_JSON_PATH, defaulting to /tmp/metrics.jsonl.
+    """
+    sinks = []
+    for sink_name in os.environ.get('METRICS_SINKS', 'emf').split(','):
+        sink_name = sink_name.strip()
+        if sink_name == 'emf':
+            sinks.append(PowertoolsMetricsSink(namespace=namespace, service=service))
+        elif sink_name == 'json':
+            sinks.append(JsonFileMetricsSink(file_path=os.environ.get('METRICS_JSON_PATH', '/tmp/metrics.jsonl'),
+                                             service=service))
+        elif sink_name:
+            logging.getLogger(name='MetricsSinks').error(f"Unknown metrics sink '{sink_name}'. Valid sinks are emf "
+                                                         f"and json.")
+    return sinks
@@ -1,69 +1,61 @@
-from json.decoder import JSONDecodeError
-import json
 import os
-import requests
-import time
 
-from aws_lambda_powertools import Logger
+from lambda_runtime_management import InitProfiler, create_parameter_cache, get_aws_variable_retriever
 
-from aws_cache_retrieval import AwsVariableRetriever
+init_profiler = InitProfiler()
 
-logger = Logger(service="pf_access_token_generator")
+with init_profiler.stage('aws_lambda_powertools'):
+    from aws_lambda_powertools import Logger
+
+with init_profiler.stage('project_modules'):
+    from http_transport_management import get_shared_transport
+    from metrics_management import instrument_handler
+    from petfinder_lambda.petfinder_api_management import PetfinderAccessTokenCache, SecretsManagerTokenStore
+
+SERVICE_NAME = "pf_access_token_generator"
+logger = Logger(service=SERVICE_NAME)
 
 
-AWS_SESSION_TOKEN = os.environ['AWS_SESSION_TOKEN']
 AWS_REGION = os.environ['AWS_REGION']
-CACHE_PORT = os.environ['PARAMETERS_SECRETS_EXTENSION_HTTP_PORT']
-PROJECT_NAME = os.environ['FRED_PROJECT_NAME']
 
-aws_variable_retriever = AwsVariableRetriever(cache_port=CACHE_PORT,
-                                              project_name=PROJECT_NAME,
-                                              aws_session_token=AWS_SESSION_TOKEN)
+# Everything below is created on first use and kept for warm invocations, so a still valid token is returned without
+# any network round trip
+access_token_cache = None
+access_token_cache_configs_version = None
+
+
+parameter_cache = create_parameter_cache()
 
+init_profiler.finish_init()
 
-class MaxGenerateAccessTokenTriesError(Exception):
-    pass
+
+def create_access_token_cache(config_values: dict) -> PetfinderAccessTokenCache:
+    token_store = SecretsManagerTokenStore(aws_variable_retriever=get_aws_variable_retriever(),
+                                           secret_name='pf_access_token',
+                                           secret_id=config_values.get('pf_access_token_secret_id'),
+                                           region=AWS_REGION)
+    return PetfinderAccessTokenCache(token_url=config_values['pf_token_url'],
+                                     client_id=config_values['pf_api_key'],
+                                     client_secret=config_values['pf_secret_key'],
+                                     token_store=token_store,
+                                     refresh_margin_seconds=config_values.get('pf_access_token_refresh_margin_seconds',
+                                                                              300),
+                                     transport=get_shared_transport(config_values=config_values))
 
 
 @logger.inject_lambda_context
+@instrument_handler(service=SERVICE_NAME, logger=logger)
 def lambda_handler(event, context):
     """
     Generates a new Petfinder access token if necessary, and returns a valid token.
     :return: Petfinder API access token.
     """
-    raw_config_values = aws_variable_retriever.retrieve_parameter_value(parameter_name='configs',
-                                                                        expect_json=True)
-    config_values = json.loads(raw_config_values)
-
-    data = {
-        'grant_type': 'client_credentials',
-        'client_id': config_values['pf_api_key'],
-        'client_secret': config_values['pf_secret_key']
-    }
-    retry_seconds = config_values['pf_access_token_retry_seconds']
-    max_tries = len(retry_seconds) + 1
-
-    for tries in range(max_tries):
-        if tries >= 1:
-            logger.info(f"Retry number {tries} for generating a Petfinder access token.")
-            # The 0th index of retry_seconds represents the sleep time for when "tries" is 1 (the second try).
-            time.sleep(retry_seconds[tries - 1])
-        try:
-            response = requests.post(url=config_values['pf_token_url'],
-                                     data=data)
-            response.raise_for_status()
-        except requests.exceptions.RequestException as e:
-            logger.error(str(e))
-            return e
-        try:
-            response_data = response.json()
-        except JSONDecodeError as e:
-            logger.error(str(e))
-            return e
-        try:
-            return response_data['access_token']
-        except KeyError as e:
-            logger.error(str(e))
-            raise e
-    logger.error(f"Max number of tries ({max_tries}) reached when generating Petfinder access token.")
-    raise MaxGenerateAccessTokenTriesError
+    init_profiler.log_cold_start_report(logger=logger)
+
+    global access_token_cache, access_token_cache_configs_version
+    config_values, configs_version = parameter_cache.get(parameter_name='configs')
+    if access_token_cache_configs_version != configs_version:
+        access_token_cache = create_access_token_cache(config_values=config_values)
+        access_token_cache_configs_version = configs_version
+
+    return access_token_cache.get_access_token()
@@ -1,93 +1,445 @@
-import json
+from datetime import date, timedelta
+from itertools import groupby
 import os
-import re
-import requests
-import urllib3
 
-from aws_lambda_powertools import Logger
+from lambda_runtime_management import InitProfiler, create_parameter_cache, get_aws_variable_retriever, \
+    get_dynamodb_manager
 
-from aws_cache_retrieval import AwsVariableRetriever
-from dynamodb_management import DynamoDbManager
+init_profiler = InitProfiler()
 
-from petfinder_lambda.petfinder_api_management import PetfinderApiConnectionManager as PfManager, \
-    PetfinderApiRequest as PfRequest
+with init_profiler.stage('aws_lambda_powertools'):
+    from aws_lambda_powertools import Logger
 
-logger = Logger(service="petfinder_api_pull")
+with init_profiler.stage('requests'):
+    import requests
 
-http = urllib3.PoolManager()
+with init_profiler.stage('botocore_exceptions'):
+    # Only the exception classes. boto3 itself is still imported on first use by DynamoDbManager.
+    from botocore.exceptions import BotoCoreError, ClientError
+
+with init_profiler.stage('project_modules'):
+    from backfill_management import BackfillCheckpointStore, BackfillRunner, plan_backfill_chunks
+    from dynamodb_management import DynamoDbManager
+    from dynamodb_management.dynamodb_manager import MaxBatchRequestTriesError, MaxConditionalWriteTriesError
+    from http_transport_management import get_shared_transport
+    from metrics_management import instrument_handler
+    from petfinder_lambda.petfinder_api_management import PetfinderApiConnectionManager as PfManager, \
+        PetfinderApiRequest as PfRequest, PetfinderAccessTokenCache, SecretsManagerTokenStore, DynamoDbQuotaStore, \
+        PetfinderQuotaExhaustedError, PetfinderRequestScheduler
+    from petfinder_lambda.petfinder_api_management.petfinder_api_connection_manager import \
+        MaxPetfinderRequestTriesError
+    from petfinder_lambda.petfinder_aggregation import AnimalCountAggregator
+    from petfinder_lambda.petfinder_state_collection import StateFanOutCollector, US_STATES, create_state_request
+
+SERVICE_NAME = "petfinder_api_pull"
+logger = Logger(service=SERVICE_NAME)
 
-AWS_SESSION_TOKEN = os.environ['AWS_SESSION_TOKEN']
 AWS_REGION = os.environ['AWS_REGION']
-CACHE_PORT = os.environ['PARAMETERS_SECRETS_EXTENSION_HTTP_PORT']
-PROJECT_NAME = os.environ['FRED_PROJECT_NAME']
 
-aws_variable_retriever = AwsVariableRetriever(cache_port=CACHE_PORT,
-                                              project_name=PROJECT_NAME,
-                                              aws_session_token=AWS_SESSION_TOKEN)
+# Breakdowns of requests that don't list their own 'breakdowns'. These feed the "by size" charts.
+DEFAULT_BREAKDOWNS = ['size']
+# Backfill chunking when 'pf_backfill_chunk_months' and 'pf_backfill_max_concurrency' are not set in configs
+DEFAULT_BACKFILL_CHUNK_MONTHS = 1
+DEFAULT_BACKFILL_MAX_CONCURRENCY = 4
+# No new backfill chunks are started with less time than this left before the Lambda times out
+BACKFILL_MIN_REMAINING_MILLIS = 60000
+# States collected at once by the state fan-out when 'pf_state_max_concurrency' is not set in configs
+DEFAULT_STATE_MAX_CONCURRENCY = 10
+
+# Everything below is created on first use and kept for warm invocations. The access token cache in particular means a
+# still valid token is reused without reading the secret again.
+cached_pf_manager = None
+cached_managers_configs_version = None
+pf_access_token_cache = None
+pf_request_scheduler = None
+
+
+parameter_cache = create_parameter_cache()
+
+init_profiler.finish_init()
+
+
+def get_managers(config_values: dict, configs_version: str) -> tuple[DynamoDbManager, PfManager]:
+    """
+    Returns the DynamoDB and Petfinder managers (and access token cache and request scheduler) of previous invocations,
+    unless the configs have changed since they were built.
+    """
+    global cached_pf_manager, cached_managers_configs_version, pf_access_token_cache, pf_request_scheduler
+    dynamodb_manager = get_dynamodb_manager(config_values=config_values, configs_version=configs_version)
+    if cached_managers_configs_version != configs_version:
+        if pf_request_scheduler is not None:
+            # Requests counted by the replaced scheduler still have to reach the quota store
+            pf_request_scheduler.flush()
+        pf_request_scheduler = PetfinderRequestScheduler(
+            max_requests_per_second=config_values.get('pf_max_requests_per_second', 50),
+            daily_quota=config_values.get('pf_daily_request_quota', 1000),
+            optional_quota_reserve=config_values.get('pf_optional_quota_reserve', 100),
+            quota_store=DynamoDbQuotaStore(dynamodb_manager=dynamodb_manager, quota_name='petfinder')
+        )
+        transport = get_shared_transport(config_values=config_values)
+        token_store = SecretsManagerTokenStore(aws_variable_retriever=get_aws_variable_retriever(),
+                                               secret_name='pf_access_token',
+                                               secret_id=config_values.get('pf_access_token_secret_id'),
+                                               region=AWS_REGION)
+        pf_access_token_cache = PetfinderAccessTokenCache(
+            token_url=config_values['pf_token_url'],
+            client_id=config_values['pf_api_key'],
+            client_secret=config_values['pf_secret_key'],
+            token_store=token_store,
+            refresh_margin_seconds=config_values.get('pf_access_token_refresh_margin_seconds', 300),
+            transport=transport
+        )
+        cached_pf_manager = PfManager(api_url=config_values['petfinder_api_url'],
+                                      access_token=None,
+                                      access_token_cache=pf_access_token_cache,
+                                      transport=transport,
+                                      scheduler=pf_request_scheduler)
+        cached_managers_configs_version = configs_version
+    return dynamodb_manager, cached_pf_manager
 
 
 def create_pf_requests(requests_json) -> list[PfRequest]:
     pf_requests = []
     for request_name, request_values in requests_json.items():
         request_category = request_values['category']
-        request_params = request_values.get('parameters', {})
+        # Copied, as requests add their own parameters and requests_json is cached across invocations
+        request_params = dict(request_values.get('parameters', {}))
+        request_states = request_values.get('states', [])
         new_request = PfRequest(name=request_name,
                                 category=request_category,
-                                parameters=request_params)
+                                parameters=request_params,
+                                breakdowns=request_values.get('breakdowns', DEFAULT_BREAKDOWNS),
+                                priority=PetfinderRequestScheduler.PRIORITY_OPTIONAL if request_values.get('optional')
+                                else PetfinderRequestScheduler.PRIORITY_CRITICAL,
+                                states=list(US_STATES) if request_states == 'all' else list(request_states))
         pf_requests.append(new_request)
-    return pf_requests
+    # Daily-critical requests run first, so optional ones only use what is left of the quota
+    return sorted(pf_requests, key=lambda request: request.priority)
+
+
+def format_breakdown_partition_key_value(partition_key_value: str, dimension: str, dimension_value: str) -> str:
+    """
+    :return: Partition key of a breakdown series, e.g. 'pf_dogs#size#Small'
+    """
+    return f"{partition_key_value}#{dimension}#{dimension_value}"
+
+
+def format_state_partition_key_value(request: PfRequest, state: str) -> str:
+    """
+    Every state of a state fan-out request is its own series, so the state's writes (and its rollups) go to a
+    partition of their own instead of all landing on the request's partition.
+
+    :return: Partition key of a state fan-out request's state, e.g. 'pf_dogs_by_state#state#CA'
+    """
+    return format_breakdown_partition_key_value(partition_key_value=f"pf_{request.name}",
+                                                dimension='state',
+                                                dimension_value=state)
+
+
+def get_known_breakdown_values(partition_key_value: str, dimension: str, known_partition_key_values) -> set[str]:
+    """
+    :param known_partition_key_values: Partition keys of every stored series, e.g. the keys of the series registry
+    :return: Values of the dimension that already have a breakdown series under the partition key
+    """
+    prefix = format_breakdown_partition_key_value(partition_key_value=partition_key_value,
+                                                  dimension=dimension,
+                                                  dimension_value='')
+    return {known_partition_key_value[len(prefix):] for known_partition_key_value in known_partition_key_values
+            if known_partition_key_value.startswith(prefix) and '#' not in known_partition_key_value[len(prefix):]}
+
+
+def fill_missing_days(dates_data: dict, window_start: date, window_end: date) -> dict:
+    """
+    Petfinder only returns the days animals were published on, so a day without animals has to be written as an
+    explicit 0. Otherwise it is a gap in the charts, and the watermark stops at the last day with animals, so the empty
+    days would be requested again on every run.
+
+    :param dates_data: {date in the format YYYY-MM-DD: count}
+    :param window_end: First day after the window
+    :return: The counts, with 0 for every day of the window that has none
+    """
+    filled_data = {(window_start + timedelta(days=day_offset)).isoformat(): 0
+                   for day_offset in range((window_end - window_start).days)}
+    filled_data.update(dates_data)
+    return filled_data
+
+
+def get_requests_by_partition_key_value(pf_requests: list[PfRequest]) -> dict:
+    """
+    :return: {partition key value: request}, with a nationwide request under 'pf_<request name>' and every state of a
+        state fan-out request under its state partition key, with the request limited to the state
+    """
+    requests_by_partition_key_value = {}
+    for request in pf_requests:
+        if request.states:
+            for state in request.states:
+                requests_by_partition_key_value[format_state_partition_key_value(request=request, state=state)] = \
+                    create_state_request(request=request, state=state)
+        else:
+            requests_by_partition_key_value[f"pf_{request.name}"] = request
+    return requests_by_partition_key_value
+
+
+def aggregate_pf_request(request: PfRequest, pf_manager: PfManager, pf_access_token: str) -> AnimalCountAggregator:
+    """
+    Counts the animals of every page matching the request's parameters, by date and by each of its breakdowns.
+    """
+    aggregator = AnimalCountAggregator(dimensions=('date', *request.breakdowns))
+    for page_data in pf_manager.iter_pages(access_token=pf_access_token,
+                                           petfinder_api_request=request):
+        aggregator.add_page(animals=page_data['animals'])
+    return aggregator
 
 
-def count_data_by_date(json_data, pf_date_format):
-    dates_data = {}
-    animals = json_data['animals']
-    for animal in animals:
-        date_time = animal['published_at']
-        date_match = re.match(r'([^T]+)T', date_time)
-        date = date_match.group(1)
-        dates_data[date]
-    num_animals = len(animals)
-    return num_animals
+def store_pf_counts(aggregator: AnimalCountAggregator, request: PfRequest, partition_key_value: str,
+                    window_start: date, window_end: date, known_partition_key_values,
+                    dynamodb_manager: DynamoDbManager, config_values: dict):
+    """
+    Stores the request's per date totals under its partition key, and each breakdown under its own partition key, with
+    0 for every day of the requested window without animals. Breakdown values are those in the aggregator and those
+    already stored, since a value with no animals in the window doesn't appear in the aggregator at all.
+
+    :param window_start: First day that was requested
+    :param window_end: First day after the requested window, which must only contain complete days
+    :param known_partition_key_values: Partition keys of every stored series. See get_known_breakdown_values.
+    """
+    dynamodb_manager.put_pf_data(data=fill_missing_days(dates_data=aggregator.totals(dimensions=('date',)),
+                                                        window_start=window_start,
+                                                        window_end=window_end),
+                                 partition_key_value=partition_key_value,
+                                 values_attribute_name=config_values['db_pf_values_attribute_name'])
+    for dimension in request.breakdowns:
+        date_breakdown = aggregator.date_breakdown(dimension=dimension)
+        dimension_values = set(date_breakdown) | get_known_breakdown_values(
+            partition_key_value=partition_key_value,
+            dimension=dimension,
+            known_partition_key_values=known_partition_key_values
+        )
+        for dimension_value in sorted(dimension_values):
+            dynamodb_manager.put_pf_data(
+                data=fill_missing_days(dates_data=date_breakdown.get(dimension_value, {}),
+                                       window_start=window_start,
+                                       window_end=window_end),
+                partition_key_value=format_breakdown_partition_key_value(partition_key_value=partition_key_value,
+                                                                         dimension=dimension,
+                                                                         dimension_value=dimension_value),
+                values_attribute_name=config_values['db_pf_values_attribute_name']
+            )
+
+
+def update_pf_request(request: PfRequest, partition_key_value: str, last_updated_day, known_partition_key_values,
+                      pf_manager: PfManager, pf_access_token: str, dynamodb_manager: DynamoDbManager,
+                      config_values: dict) -> AnimalCountAggregator:
+    """
+    Aggregates the animals published since the series' last update and stores their counts. Only complete days are
+    requested (up to the start of today), since a partial day's count would be stored and the watermark moved past it,
+    and the rest of the day would never be pulled.
+
+    :param last_updated_day: datetime of the last day stored under the partition key, or None to request the full
+        history. The full history's zeros start at the first day with animals, or at yesterday when there are none.
+    :param known_partition_key_values: Partition keys of every stored series. See store_pf_counts.
+    """
+    today = date.today()
+    if last_updated_day is not None:
+        day_after_last_update = last_updated_day + timedelta(days=1)
+        if day_after_last_update.date() >= today:
+            # Yesterday is already stored, so there is no complete day to request
+            return AnimalCountAggregator(dimensions=('date', *request.breakdowns))
+        # Petfinder expects ISO8601 timestamps for 'after' and 'before'
+        request.add_parameter(name='after',
+                              value=day_after_last_update.strftime('%Y-%m-%dT00:00:00Z'))
+    request.add_parameter(name='before',
+                          value=today.strftime('%Y-%m-%dT00:00:00Z'))
+    aggregator = aggregate_pf_request(request=request,
+                                      pf_manager=pf_manager,
+                                      pf_access_token=pf_access_token)
+    if last_updated_day is not None:
+        window_start = day_after_last_update.date()
+    else:
+        dates_data = aggregator.totals(dimensions=('date',))
+        window_start = date.fromisoformat(min(dates_data)) if dates_data else today - timedelta(days=1)
+    store_pf_counts(aggregator=aggregator,
+                    request=request,
+                    partition_key_value=partition_key_value,
+                    window_start=window_start,
+                    window_end=today,
+                    known_partition_key_values=known_partition_key_values,
+                    dynamodb_manager=dynamodb_manager,
+                    config_values=config_values)
+    return aggregator
 
 
 @logger.inject_lambda_context
+@instrument_handler(service=SERVICE_NAME, logger=logger)
 def lambda_handler(event, context):
-    raw_config_values = aws_variable_retriever.retrieve_parameter_value(parameter_name='configs',
-                                                                        expect_json=True)
-    config_values = json.loads(raw_config_values)
+    init_profiler.log_cold_start_report(logger=logger)
 
-    raw_pf_requests = aws_variable_retriever.retrieve_parameter_value(parameter_name='pf_requests',
-                                                                      expect_json=True)
-    pf_requests_json = json.loads(raw_pf_requests)
+    config_values, configs_version = parameter_cache.get(parameter_name='configs')
+    pf_requests_json, _ = parameter_cache.get(parameter_name='pf_requests')
     pf_requests = create_pf_requests(requests_json=pf_requests_json)
 
-    pf_access_token = aws_variable_retriever.retrieve_secret_value(secret_name='pf_access_token')
+    dynamodb_manager, pf_manager = get_managers(config_values=config_values,
+                                                configs_version=configs_version)
+    pf_access_token = pf_access_token_cache.get_access_token()
+    pf_request_scheduler.sync()
 
-    pf_manager = PfManager(api_url=config_values['petfinder_api_url'],
-                           access_token=pf_access_token)
+    last_updated_days = dynamodb_manager.get_last_updated_days(
+        partition_key_values=list(get_requests_by_partition_key_value(pf_requests=pf_requests)),
+        values_attribute_name=config_values['db_pf_values_attribute_name']
+    )
+    known_partition_key_values = set(dynamodb_manager.get_registered_watermarks())
 
-    dynamodb_manager = DynamoDbManager(table_name=config_values['db_table_name'],
-                                       region=AWS_REGION,
-                                       partition_key_name=config_values['db_partition_key_name'],
-                                       sort_key_name=config_values['db_sort_key_name'])
+    def collect_state(request, state):
+        partition_key_value = format_state_partition_key_value(request=request, state=state)
+        return update_pf_request(request=create_state_request(request=request, state=state),
+                                 partition_key_value=partition_key_value,
+                                 last_updated_day=last_updated_days[partition_key_value],
+                                 known_partition_key_values=known_partition_key_values,
+                                 pf_manager=pf_manager,
+                                 pf_access_token=pf_access_token,
+                                 dynamodb_manager=dynamodb_manager,
+                                 config_values=config_values)
 
-    for request in pf_requests:
-        last_updated_day = dynamodb_manager.get_last_updated_day(partition_key_value=request.name,
-                                                                 values_attribute_name=config_values[
-                                                                     'db_pf_values_attribute_name']
-                                                                 )
-        request.add_parameter(name='after',
-                              value=last_updated_day)
-
-        try:
-            request_json_data = pf_manager.make_request(access_token=pf_access_token,
-                                                        petfinder_api_request=request,
-                                                        retry_seconds=config_values['pf_request_retry_seconds'])
-            data_count = count_request_data(json_data=request_json_data)
-            partition_key_value = f"pf_{request.name}"
-            dynamodb_manager.put_pf_data(data=data_count,
-                                         partition_key_value=partition_key_value,
-                                         values_attribute_name=config_values['db_pf_values_attribute_name'])
-        except requests.exceptions.JSONDecodeError as e:
-            logger.error(str(e))
-            continue
+    state_fan_out_collector = StateFanOutCollector(
+        collect_state=collect_state,
+        max_concurrency=int(config_values.get('pf_state_max_concurrency', DEFAULT_STATE_MAX_CONCURRENCY))
+    )
+
+    num_queries = sum(len(request.states) or 1 for request in pf_requests)
+    failed_request_names = []
+    quota_skipped_request_names = []
+    try:
+        # Requests are sorted by priority. Within each priority, the nationwide requests run one at a time, followed
+        # by the state fan-out requests' states, run concurrently.
+        for _, priority_requests in groupby(pf_requests, key=lambda request: request.priority):
+            priority_requests = list(priority_requests)
+            request_results = {}
+            for request in priority_requests:
+                if request.states:
+                    continue
+                partition_key_value = f"pf_{request.name}"
+                try:
+                    request_results[request.name] = update_pf_request(
+                        request=request,
+                        partition_key_value=partition_key_value,
+                        last_updated_day=last_updated_days[partition_key_value],
+                        known_partition_key_values=known_partition_key_values,
+                        pf_manager=pf_manager,
+                        pf_access_token=pf_access_token,
+                        dynamodb_manager=dynamodb_manager,
+                        config_values=config_values
+                    )
+                except (PetfinderQuotaExhaustedError, requests.exceptions.RequestException,
+                        MaxPetfinderRequestTriesError, ClientError, BotoCoreError, MaxBatchRequestTriesError,
+                        MaxConditionalWriteTriesError) as e:
+                    request_results[request.name] = e
+
+            state_results = state_fan_out_collector.run(
+                requests=[request for request in priority_requests if request.states])
+            request_results.update({f"{request_name} {state}": result
+                                    for (request_name, state), result in state_results.items()})
+
+            for request_name, result in request_results.items():
+                if isinstance(result, AnimalCountAggregator):
+                    logger.info(f"Aggregated {result.num_animals} animals for request {request_name}.")
+                elif isinstance(result, PetfinderQuotaExhaustedError):
+                    # Nothing was stored, so the next run picks the request up from its unchanged watermark
+                    logger.warning(f"Petfinder request {request_name} skipped.\nDetails: {str(result)}")
+                    quota_skipped_request_names.append(request_name)
+                elif isinstance(result, (requests.exceptions.RequestException, MaxPetfinderRequestTriesError)):
+                    logger.error(f"Petfinder request {request_name} failed.\nDetails: {str(result)}")
+                    failed_request_names.append(request_name)
+                elif isinstance(result, (ClientError, BotoCoreError, MaxBatchRequestTriesError,
+                                         MaxConditionalWriteTriesError)):
+                    # The watermark never advances past months that weren't written, so the next run picks the
+                    # request up again
+                    logger.error(f"Storing Petfinder request {request_name} failed.\nDetails: {str(result)}")
+                    failed_request_names.append(request_name)
+                else:
+                    raise result
+    finally:
+        pf_request_scheduler.flush()
+
+    if failed_request_names:
+        logger.error(f"{len(failed_request_names)} of {num_queries} Petfinder requests failed: "
+                     f"{', '.join(failed_request_names)}")
+    if quota_skipped_request_names:
+        logger.warning(f"{len(quota_skipped_request_names)} of {num_queries} Petfinder requests were skipped to "
+                       f"stay within the daily quota: {', '.join(quota_skipped_request_names)}")
+
+
+@logger.inject_lambda_context
+@instrument_handler(service=SERVICE_NAME, logger=logger)
+def backfill_handler(event, context):
+    """
+    Loads the Petfinder history in windows of whole months ('after'/'before' pairs), fetched and written across a
+    worker pool. Completed windows are checkpointed, so invoking the handler again after a timeout resumes the backfill.
+
+    The event may set 'start_date' and 'end_date' (YYYY-MM-DD, defaulting to 'default_data_start_date' and yesterday,
+    the last complete day) and 'series', a list of request names to backfill instead of all of them.
+    """
+    init_profiler.log_cold_start_report(logger=logger)
+
+    config_values, configs_version = parameter_cache.get(parameter_name='configs')
+    pf_requests_json, _ = parameter_cache.get(parameter_name='pf_requests')
+    pf_requests = create_pf_requests(requests_json=pf_requests_json)
+    if event.get('series'):
+        pf_requests = [request for request in pf_requests if request.name in event['series']]
+
+    dynamodb_manager, pf_manager = get_managers(config_values=config_values,
+                                                configs_version=configs_version)
+    pf_access_token = pf_access_token_cache.get_access_token()
+    pf_request_scheduler.sync()
+
+    chunks = plan_backfill_chunks(start_date=event.get('start_date', config_values['default_data_start_date']),
+                                  end_date=event.get('end_date', (date.today() - timedelta(days=1)).isoformat()),
+                                  chunk_months=int(config_values.get('pf_backfill_chunk_months',
+                                                                     DEFAULT_BACKFILL_CHUNK_MONTHS)))
+    requests_by_partition_key_value = get_requests_by_partition_key_value(pf_requests=pf_requests)
+    known_partition_key_values = set(dynamodb_manager.get_registered_watermarks())
+
+    def get_chunk_window_end(chunk) -> date:
+        # Capped at the start of today, so a partial day is never stored
+        return min(date.fromisoformat(chunk[1]) + timedelta(days=1), date.today())
+
+    def fetch_chunk(partition_key_value, chunk):
+        request = requests_by_partition_key_value[partition_key_value]
+        chunk_start, _ = chunk
+        day_after_chunk_end = get_chunk_window_end(chunk=chunk)
+        # Each chunk gets its own request, as chunks of the same series run concurrently. Backfills are optional
+        # work, so they never use the quota reserved for the daily update.
+        chunk_request = PfRequest(name=request.name,
+                                  category=request.category,
+                                  parameters={**request.parameters,
+                                              'after': f"{chunk_start}T00:00:00Z",
+                                              'before': day_after_chunk_end.strftime('%Y-%m-%dT00:00:00Z')},
+                                  breakdowns=request.breakdowns,
+                                  priority=PetfinderRequestScheduler.PRIORITY_OPTIONAL)
+        return aggregate_pf_request(request=chunk_request,
+                                    pf_manager=pf_manager,
+                                    pf_access_token=pf_access_token)
+
+    def store_chunk(partition_key_value, chunk, aggregator):
+        store_pf_counts(aggregator=aggregator,
+                        request=requests_by_partition_key_value[partition_key_value],
+                        partition_key_value=partition_key_value,
+                        window_start=date.fromisoformat(chunk[0]),
+                        window_end=get_chunk_window_end(chunk=chunk),
+                        known_partition_key_values=known_partition_key_values,
+                        dynamodb_manager=dynamodb_manager,
+                        config_values=config_values)
+
+    backfill_runner = BackfillRunner(checkpoint_store=BackfillCheckpointStore(dynamodb_manager=dynamodb_manager),
+                                     max_workers=max(1, int(config_values.get('pf_backfill_max_concurrency',
+                                                                              DEFAULT_BACKFILL_MAX_CONCURRENCY))),
+                                     context=context,
+                                     min_remaining_millis=BACKFILL_MIN_REMAINING_MILLIS)
+    series_chunks = {partition_key_value: chunks for partition_key_value in requests_by_partition_key_value}
+    try:
+        backfill_summary = backfill_runner.run(series_chunks=series_chunks,
+                                               fetch_chunk=fetch_chunk,
+                                               store_chunk=store_chunk)
+    finally:
+        pf_request_scheduler.flush()
+    logger.info(f"Petfinder backfill finished: {backfill_summary}")
+    return backfill_summary
@@ -0,0 +1 @@
+from .animal_count_aggregator import AnimalCountAggregator
@@ -0,0 +1,116 @@
+import logging
+
+import numpy as np
+
+
+def _extract_date(animal) -> str:
+    # 'published_at' is an ISO8601 timestamp, e.g. 2024-01-31T22:15:03+0000
+    return animal['published_at'][:10]
+
+
+def _extract_species(animal) -> str:
+    return animal.get('species') or animal.get('type') or 'Unknown'
+
+
+def _extract_size(animal) -> str:
+    return animal.get('size') or 'Unknown'
+
+
+def _extract_state(animal) -> str:
+    return ((animal.get('contact') or {}).get('address') or {}).get('state') or 'Unknown'
+
+
+class AnimalCountAggregator:
+    """
+    Counts Petfinder animals by several dimensions at once (e.g. date x species x size), one page at a time.
+
+    Each page's fields are pulled into arrays, encoded as integer codes and combined into a single key per animal, so
+    the page is grouped with one vectorized np.unique call. The page's group counts are then merged into the running
+    totals, which only hold one entry per distinct combination of dimension values.
+    """
+
+    DIMENSION_EXTRACTORS = {
+        'date': _extract_date,
+        'species': _extract_species,
+        'size': _extract_size,
+        'state': _extract_state
+    }
+
+    def __init__(self, dimensions: tuple = ('date', 'species', 'size')):
+        """
+
+        :param dimensions: Dimensions to count by. Valid dimensions are the keys of DIMENSION_EXTRACTORS.
+        """
+        unknown_dimensions = set(dimensions) - set(self.DIMENSION_EXTRACTORS)
+        if unknown_dimensions:
+            raise ValueError(f"Unknown dimensions {', '.join(sorted(unknown_dimensions))}. Valid dimensions are "
+                             f"{', '.join(self.DIMENSION_EXTRACTORS)}.")
+        self.dimensions = tuple(dimensions)
+        # {(dimension values in the order of self.dimensions): count}
+        self.counts = {}
+        self.num_animals = 0
+        self.logger = logging.getLogger(name='AnimalCountAggregator')
+
+    def add_page(self, animals: list[dict]):
+        """
+        Adds the animals of a single page to the running counts.
+
+        :param animals: The 'animals' list of a Petfinder response page
+        """
+        if not animals:
+            return
+
+        dimension_uniques = []
+        dimension_codes = []
+        for dimension in self.dimensions:
+            extractor = self.DIMENSION_EXTRACTORS[dimension]
+            values = np.array([extractor(animal) for animal in animals])
+            uniques, codes = np.unique(values, return_inverse=True)
+            dimension_uniques.append(uniques)
+            dimension_codes.append(codes)
+
+        # Mixed radix encoding of each animal's dimension codes into a single integer key
+        combined_keys = np.ravel_multi_index(dimension_codes, dims=[len(uniques) for uniques in dimension_uniques])
+        unique_keys, key_counts = np.unique(combined_keys, return_counts=True)
+        unraveled_codes = np.unravel_index(unique_keys, shape=[len(uniques) for uniques in dimension_uniques])
+
+        for group_index, count in enumerate(key_counts.tolist()):
+            group = tuple(str(uniques[codes[group_index]])
+                          for uniques, codes in zip(dimension_uniques, unraveled_codes))
+            self.counts[group] = self.counts.get(group, 0) + count
+        self.num_animals += len(animals)
+
+    def merge(self, other: 'AnimalCountAggregator'):
+        """
+        Adds the counts of another aggregator over the same dimensions, e.g. one that aggregated other pages.
+        """
+        if other.dimensions != self.dimensions:
+            raise ValueError(f"Cannot merge counts by {other.dimensions} into counts by {self.dimensions}.")
+        for group, count in other.counts.items():
+            self.counts[group] = self.counts.get(group, 0) + count
+        self.num_animals += other.num_animals
+
+    def totals(self, dimensions: tuple = ('date',)) -> dict:
+        """
+        Sums the counts over every dimension not listed.
+
+        :param dimensions: Dimensions to keep, a subset of the aggregator's dimensions
+        :return: {value: count} for a single dimension, or {(values...): count} for several
+        """
+        dimension_indexes = [self.dimensions.index(dimension) for dimension in dimensions]
+        totals = {}
+        for group, count in self.counts.items():
+            total_key = group[dimension_indexes[0]] if len(dimension_indexes) == 1 \
+                else tuple(group[dimension_index] for dimension_index in dimension_indexes)
+            totals[total_key] = totals.get(total_key, 0) + count
+        return totals
+
+    def date_breakdown(self, dimension: str) -> dict[str, dict]:
+        """
+        :param dimension: Dimension to break the per-date counts down by, e.g. 'size'
+        :return: {dimension value: {date: count}}
+        """
+        breakdown = {}
+        for (date, dimension_value), count in self.totals(dimensions=('date', dimension)).items():
+            breakdown.setdefault(dimension_value, {})[date] = count
+        return breakdown
@@ -1 +1,4 @@
-from .petfinder_api_connection_manager import PetfinderApiConnectionManager, PetfinderApiRequest
\ No newline at end of file
+from .petfinder_api_connection_manager import PetfinderApiConnectionManager, PetfinderApiRequest
+from .petfinder_access_token_cache import PetfinderAccessTokenCache, SecretsManagerTokenStore
+from .petfinder_request_scheduler import DynamoDbQuotaStore, PetfinderQuotaExhaustedError, \
+    PetfinderRequestScheduler
@@ -0,0 +1,161 @@
+import json
+import logging
+import threading
+import time
+from typing import Union
+
+import requests
+
+from http_transport_management import HttpTransport, MaxHttpRequestTriesError, get_shared_transport
+from .petfinder_api_connection_manager import MaxGenerateAccessTokenTriesError
+
+
+class SecretsManagerTokenStore:
+    """
+    Persists the access token and its expiry in the 'pf_access_token' secret, so cold containers can reuse a token
+    generated by another container. The secret value is JSON formatted {"access_token": str, "expires_at": epoch}.
+    """
+
+    def __init__(self, aws_variable_retriever, secret_name='pf_access_token', secret_id=None, region=None):
+        """
+
+        :param aws_variable_retriever: Used to read the secret through the Parameters and Secrets Lambda extension
+        :param secret_name: Secret name passed to the AwsVariableRetriever
+        :param secret_id: Full Secrets Manager ID or ARN of the secret. Writes are skipped when not provided.
+        :param region: AWS region of the secret
+        """
+        self.aws_variable_retriever = aws_variable_retriever
+        self.secret_name = secret_name
+        self.secret_id = secret_id
+        self.region = region
+        self.logger = logging.getLogger(name='SecretsManagerTokenStore')
+
+    def load(self) -> Union[tuple[str, float], None]:
+        """
+        :return: (access token, expiry epoch seconds), or None if the secret has no token with a known expiry
+        """
+        secret_value = self.aws_variable_retriever.retrieve_secret_value(secret_name=self.secret_name)
+        try:
+            token_data = json.loads(secret_value)
+            return token_data['access_token'], float(token_data['expires_at'])
+        except (TypeError, ValueError, KeyError):
+            # Secrets written before expiries were stored only hold the raw token, whose age is unknown
+            self.logger.info("Stored Petfinder access token has no expiry. It will be regenerated.")
+            return None
+
+    def save(self, access_token: str, expires_at: float):
+        if not self.secret_id:
+            self.logger.info("No secret ID configured for the Petfinder access token. Skipping the secret write.")
+            return
+        import boto3
+
+        secrets_manager_client = boto3.client('secretsmanager', region_name=self.region)
+        secrets_manager_client.put_secret_value(SecretId=self.secret_id,
+                                                SecretString=json.dumps({
+                                                    'access_token': access_token,
+                                                    'expires_at': expires_at
+                                                }))
+
+
+class PetfinderAccessTokenCache:
+    """
+    Keeps the Petfinder access token in process memory for warm containers, backed by an optional persistent token
+    store. Tokens are refreshed shortly before they expire, and concurrent callers share a single refresh.
+    """
+
+    def __init__(self, token_url, client_id, client_secret, token_store=None, refresh_margin_seconds: float = 300,
+                 transport: HttpTransport = None):
+        """
+
+        :param token_url: Petfinder OAuth token URL
+        :param client_id: Petfinder API key
+        :param client_secret: Petfinder secret key
+        :param token_store: Optional persistent store with load() and save(access_token, expires_at) methods
+        :param refresh_margin_seconds: Tokens are refreshed once they are within this many seconds of expiring
+        :param transport: HTTP transport used for token requests. Defaults to the shared pooled transport.
+        """
+        self.token_url = token_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.token_store = token_store
+        self.refresh_margin_seconds = refresh_margin_seconds
+        self.transport = transport or get_shared_transport()
+
+        self.access_token = None
+        self.expires_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self.logger = logging.getLogger(name='PetfinderAccessTokenCache')
+
+    def _is_fresh(self, expires_at: float) -> bool:
+        return time.time() < expires_at - self.refresh_margin_seconds
+
+    def get_access_token(self) -> str:
+        """
+        :return: A Petfinder access token that is not about to expire
+        """
+        if self.access_token and self._is_fresh(self.expires_at):
+            return self.access_token
+
+        with self._refresh_lock:
+            # Another caller may have refreshed the token while this one waited on the lock
+            if self.access_token and self._is_fresh(self.expires_at):
+                return self.access_token
+
+            if self.token_store:
+                stored_token = self.token_store.load()
+                if stored_token and self._is_fresh(stored_token[1]):
+                    self.access_token, self.expires_at = stored_token
+                    return self.access_token
+
+            return self._refresh()
+
+    def refresh_access_token(self, stale_access_token: str = None) -> str:
+        """
+        Forces a new token, e.g. after the API rejected a token with a 401.
+
+        :param stale_access_token: The rejected token. If another caller has already replaced it, the replacement is
+            returned instead of requesting yet another token.
+        :return: A new Petfinder access token
+        """
+        with self._refresh_lock:
+            if self.access_token and self.access_token != stale_access_token and self._is_fresh(self.expires_at):
+                return self.access_token
+            return self._refresh()
+
+    def _refresh(self) -> str:
+        access_token, expires_in = self._request_access_token()
+        self.access_token = access_token
+        self.expires_at = time.time() + expires_in
+        self.logger.info(f"Generated a new Petfinder access token expiring in {expires_in} seconds.")
+
+        if self.token_store:
+            self.token_store.save(access_token=self.access_token,
+                                  expires_at=self.expires_at)
+        return self.access_token
+
+    def _request_access_token(self) -> tuple[str, int]:
+        """
+        :return: (access token, seconds until the token expires)
+        """
+        data = {
+            'grant_type': 'client_credentials',
+            'client_id': self.client_id,
+            'client_secret': self.client_secret
+        }
+        try:
+            response = self.transport.post(url=self.token_url,
+                                           request_name="Petfinder access token",
+                                           metric_dimensions={'api': 'petfinder_token'},
+                                           data=data)
+            response_data = response.json()
+        except MaxHttpRequestTriesError as e:
+            self.logger.error("Max number of tries reached when generating Petfinder access token.")
+            raise MaxGenerateAccessTokenTriesError(str(e)) from e
+        except requests.exceptions.RequestException as e:
+            self.logger.error(str(e))
+            raise e
+        try:
+            return response_data['access_token'], int(response_data['expires_in'])
+        except KeyError as e:
+            self.logger.error(str(e))
+            raise e
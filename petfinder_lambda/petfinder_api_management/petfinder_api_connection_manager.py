@@ -1,9 +1,10 @@
 import logging
-from json.decoder import JSONDecodeError
-import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from urllib.parse import urljoin
 
+from http_transport_management import HttpTransport, MaxHttpRequestTriesError, get_shared_transport
+from metrics_management import get_metrics_recorder
 from .petfinder_api_request import PetfinderApiRequest
 
 
@@ -11,58 +12,139 @@ class MaxGenerateAccessTokenTriesError(Exception):
     pass
 
 
+class MaxPetfinderRequestTriesError(Exception):
+    pass
+
+
 class PetfinderApiConnectionManager:
 
-    def __init__(self, api_url, access_token):
+    # Largest page size allowed by the Petfinder API
+    MAX_PAGE_LIMIT = 100
+
+    def __init__(self, api_url, access_token, access_token_cache=None, transport: HttpTransport = None,
+                 scheduler=None):
         """
 
         :param api_url: Petfinder API URL
         :param access_token: Petfinder access token
+        :param access_token_cache: Optional PetfinderAccessTokenCache. When provided, tokens come from the cache and a
+            rejected token (401) is refreshed instead of failing the request.
+        :param transport: HTTP transport used for requests. Defaults to the shared pooled transport.
+        :param scheduler: Optional PetfinderRequestScheduler that every request, including retries, goes through
         """
         self.api_url = api_url
         self.access_token = access_token
+        self.access_token_cache = access_token_cache
+        self.transport = transport or get_shared_transport()
+        self.scheduler = scheduler
         self.logger = logging.getLogger(name="PetfinderApiConnectionManager")
 
     def format_url_with_category(self, category):
         return urljoin(self.api_url, category)
 
-    def make_request(self, petfinder_api_request: PetfinderApiRequest, access_token, retry_seconds):
+    def _request_json(self, api_url, parameters, request_name, access_token, priority: int = 0,
+                      series_name: str = None):
         """
+        :param series_name: Name of the Petfinder request the call belongs to, logged as the 'series' metric property
         :return: JSON request data
         """
+        if self.access_token_cache:
+            access_token = self.access_token_cache.get_access_token()
+        metrics_recorder = get_metrics_recorder()
+        metric_dimensions = {'api': 'petfinder'}
+        metric_properties = {'series': series_name or request_name}
+
+        try:
+            try:
+                response = self.transport.get(url=api_url,
+                                              request_name=f"Petfinder request {request_name}",
+                                              headers={'Authorization': f'Bearer {access_token}'},
+                                              params=parameters,
+                                              rate_limiter=self.scheduler,
+                                              priority=priority,
+                                              metric_dimensions=metric_dimensions,
+                                              metric_properties=metric_properties)
+            except requests.exceptions.HTTPError as error:
+                if error.response is None or error.response.status_code != 401 or not self.access_token_cache:
+                    raise error
+                # The token expired or was revoked before its expected expiry. Refresh it once and retry right away.
+                self.logger.info(f"Petfinder rejected the access token for request {request_name}. Refreshing it.")
+                access_token = self.access_token_cache.refresh_access_token(stale_access_token=access_token)
+                response = self.transport.get(url=api_url,
+                                              request_name=f"Petfinder request {request_name}",
+                                              headers={'Authorization': f'Bearer {access_token}'},
+                                              params=parameters,
+                                              rate_limiter=self.scheduler,
+                                              priority=priority,
+                                              metric_dimensions=metric_dimensions,
+                                              metric_properties=metric_properties)
+        except MaxHttpRequestTriesError as error:
+            raise MaxPetfinderRequestTriesError(str(error)) from error
+        except requests.exceptions.RequestException as error:
+            self.logger.error(f"Petfinder API failed request for request {request_name}.\nDetails: {str(error)}")
+            raise error
 
-        access_token_header = {
-            'Authorization': f'Bearer {access_token}'
-        }
+        metrics_recorder.record('api_response_bytes', len(response.content), unit='Bytes', properties=metric_properties,
+                                **metric_dimensions)
+        try:
+            with metrics_recorder.timer('json_decode_time', properties=metric_properties, **metric_dimensions):
+                return response.json()
+        except requests.exceptions.JSONDecodeError as error:
+            self.logger.error(f"Error when attempting to decode JSON for request {request_name}.\n"
+                              f"Details: {str(error)}")
+            raise error
 
+    def make_request(self, petfinder_api_request: PetfinderApiRequest, access_token):
+        """
+        :return: JSON request data
+        """
         # Have to append category to the API URL, per Petfinder API documentation
         api_url = self.format_url_with_category(category=petfinder_api_request.category)
+        return self._request_json(api_url=api_url,
+                                  parameters=petfinder_api_request.parameters,
+                                  request_name=petfinder_api_request.name,
+                                  access_token=access_token,
+                                  priority=petfinder_api_request.priority,
+                                  series_name=petfinder_api_request.name)
 
-        max_tries = len(retry_seconds) + 1
-        for tries in range(max_tries):
-            if tries >= 1:
-                self.logger.info(
-                    f"Beginning Petfinder API request retry number {tries} for series {petfinder_api_request.name}.")
-                # The 0th index of retry_seconds represents the sleep time for when "tries" is 1 (the second try).
-                time.sleep(retry_seconds[tries - 1])
-            try:
-                response = requests.get(headers=access_token_header,
-                                        url=api_url,
-                                        params=petfinder_api_request.parameters)
-                response.raise_for_status()
-            except requests.exceptions.RequestException as e:
-                continue
-            try:
-                json_data = response.json()
-                return json_data
-            except requests.exceptions.JSONDecodeError as error:
-                if tries == max_tries:
-                    self.logger.error(
-                        f"Reached last API request try. Exception raised when decoding JSON.\nDetails: {str(error)}\n"
-                        f"Exiting this API request.")
-                    raise error
+    def iter_pages(self, petfinder_api_request: PetfinderApiRequest, access_token, page_limit: int = MAX_PAGE_LIMIT):
+        """
+        Yields the JSON data of every page of the request, following 'pagination.total_pages'. The next page is
+        requested in the background while the caller processes the current one, and only those two pages are held
+        in memory at a time.
+
+        :param petfinder_api_request:
+        :param access_token:
+        :param page_limit: Number of results per page. Capped at the Petfinder maximum of 100.
+        :return: Generator of page JSON data
+        """
+        api_url = self.format_url_with_category(category=petfinder_api_request.category)
+        page_limit = min(page_limit, self.MAX_PAGE_LIMIT)
+
+        def request_page(page_number):
+            parameters = dict(petfinder_api_request.parameters)
+            parameters['page'] = page_number
+            parameters['limit'] = page_limit
+            return self._request_json(api_url=api_url,
+                                      parameters=parameters,
+                                      request_name=f"{petfinder_api_request.name} page {page_number}",
+                                      access_token=access_token,
+                                      priority=petfinder_api_request.priority,
+                                      series_name=petfinder_api_request.name)
+
+        with ThreadPoolExecutor(max_workers=1) as prefetch_executor:
+            page_number = 1
+            next_page_future = prefetch_executor.submit(request_page, page_number)
+            while next_page_future is not None:
+                page_data = next_page_future.result()
+                total_pages = page_data.get('pagination', {}).get('total_pages', 1)
+                self.logger.info(f"Received page {page_number} of {total_pages} for Petfinder request "
+                                 f"{petfinder_api_request.name}.")
+
+                if page_number < total_pages:
+                    page_number += 1
+                    next_page_future = prefetch_executor.submit(request_page, page_number)
                 else:
-                    self.logger.error(f"Error when attempting to decode JSON.\nDetails: {str(error)}")
+                    next_page_future = None
 
-        self.logger.error(f"Max number of tries ({max_tries}) reached when making Petfinder API request.\n"
-                          f"Request name is {petfinder_api_request.name}.")
+                yield page_data
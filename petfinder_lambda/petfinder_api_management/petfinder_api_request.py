@@ -2,12 +2,19 @@
 
 class PetfinderApiRequest:
 
-    def __init__(self, name: str, category: str, parameters: dict):
+    def __init__(self, name: str, category: str, parameters: dict, breakdowns: list[str] = None, priority: int = 0,
+                 states: list[str] = None):
         # 'name' is the request's identifier throughout the lifecycle
         self.name = name
 
         self.category = category
         self.parameters = parameters
+        # Dimensions (e.g. 'size') that the request's per-date counts are also broken down by
+        self.breakdowns = breakdowns if breakdowns is not None else []
+        # Scheduling priority of the request's API calls. 0 is daily-critical, higher values are optional.
+        self.priority = priority
+        # States (e.g. 'CA') queried one at a time by the state fan-out, instead of a single nationwide query
+        self.states = states if states is not None else []
 
     def add_parameter(self, name, value):
         self.parameters[name] = value
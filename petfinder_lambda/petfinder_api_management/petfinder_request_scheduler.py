@@ -0,0 +1,184 @@
+from datetime import datetime, timezone
+import logging
+import threading
+
+from http_transport_management import TokenBucket
+
+
+class PetfinderQuotaExhaustedError(Exception):
+    pass
+
+
+class DynamoDbQuotaStore:
+    """
+    Persists the number of requests used per UTC day in the data table, under a 'quota#<quota name>' partition with one
+    item per day, so every container and invocation draws from the same daily quota. Counts are added with atomic ADD
+    updates, so concurrent containers don't overwrite each other's usage.
+    """
+
+    QUOTA_PARTITION_KEY_PREFIX = 'quota#'
+    REQUESTS_USED_ATTRIBUTE_NAME = 'requests_used'
+
+    def __init__(self, dynamodb_manager, quota_name='petfinder'):
+        """
+
+        :param dynamodb_manager: DynamoDbManager of the data table
+        :param quota_name: Identifier of the quota
+        """
+        self.dynamodb_manager = dynamodb_manager
+        self.quota_name = quota_name
+
+    def _format_key(self, day: str) -> dict:
+        return {
+            self.dynamodb_manager.partition_key_name: f"{self.QUOTA_PARTITION_KEY_PREFIX}{self.quota_name}",
+            self.dynamodb_manager.sort_key_name: day
+        }
+
+    def load(self, day: str) -> int:
+        """
+        :param day: UTC day, in the format YYYY-MM-DD
+        :return: Requests used on the day so far
+        """
+        quota_item = self.dynamodb_manager.get_item(key=self._format_key(day)) or {}
+        return int(quota_item.get(self.REQUESTS_USED_ATTRIBUTE_NAME, 0))
+
+    def add(self, day: str, requests_used: int):
+        self.dynamodb_manager.update_item(
+            key=self._format_key(day),
+            UpdateExpression="ADD #requests_used :requests_used",
+            ExpressionAttributeNames={'#requests_used': self.REQUESTS_USED_ATTRIBUTE_NAME},
+            ExpressionAttributeValues={':requests_used': requests_used}
+        )
+
+
+class PetfinderRequestScheduler:
+    """
+    Rate limiter for every Petfinder API request, passed to HttpTransport as its rate_limiter.
+
+    Requests draw from a priority ordered TokenBucket, so critical requests are sent before queued optional ones. The
+    rate starts at max_requests_per_second, is halved (and the bucket paused for any Retry-After) on a 429, and creeps
+    back up on successful responses, which keeps throughput as high as Petfinder allows without repeated throttling.
+
+    Requests also count against the daily quota. Optional requests are refused once fewer than optional_quota_reserve
+    requests remain, so they can't use up the quota needed by the critical ones. Usage is kept in an optional quota
+    store and flushed every flush_every requests. The configured daily quota is never changed by responses, but the
+    rate limit headers lower the remaining quota when Petfinder reports fewer requests left than counted locally, as
+    long as they describe the daily window (see observe).
+    """
+
+    PRIORITY_CRITICAL = 0
+    PRIORITY_OPTIONAL = 1
+
+    # Rate limit headers read from every response, when present
+    LIMIT_HEADER = 'X-RateLimit-Limit'
+    REMAINING_HEADER = 'X-RateLimit-Remaining'
+
+    def __init__(self, max_requests_per_second: float = 50, daily_quota: int = 1000, optional_quota_reserve: int = 100,
+                 quota_store=None, flush_every: int = 25, min_requests_per_second: float = 1):
+        """
+
+        :param max_requests_per_second: Highest request rate, used until Petfinder throttles a request
+        :param daily_quota: Requests allowed per UTC day
+        :param optional_quota_reserve: Requests of the daily quota that only critical requests may use
+        :param quota_store: Optional store with load(day) and add(day, requests_used) methods, e.g. DynamoDbQuotaStore
+        :param flush_every: Requests counted locally before they are added to the quota store
+        :param min_requests_per_second: Lowest rate the limiter backs off to
+        """
+        self.max_requests_per_second = max_requests_per_second
+        self.min_requests_per_second = min_requests_per_second
+        self.daily_quota = daily_quota
+        self.optional_quota_reserve = optional_quota_reserve
+        self.quota_store = quota_store
+        self.flush_every = flush_every
+
+        self.token_bucket = TokenBucket(rate_per_second=max_requests_per_second)
+        self.quota_day = None
+        self.requests_used = 0
+        self._unflushed_requests = 0
+        self._quota_lock = threading.Lock()
+        self.logger = logging.getLogger(name='PetfinderRequestScheduler')
+
+    @staticmethod
+    def _today() -> str:
+        return datetime.now(timezone.utc).date().isoformat()
+
+    def sync(self):
+        """
+        Reloads the quota used today from the quota store, picking up requests made by other containers. Call at the
+        start of every invocation.
+        """
+        self.flush()
+        with self._quota_lock:
+            self._start_day_if_new()
+            if self.quota_store:
+                self.requests_used = self.quota_store.load(self.quota_day) + self._unflushed_requests
+
+    def _start_day_if_new(self):
+        today = self._today()
+        if self.quota_day != today:
+            # The quota reset since the last request. Requests not yet flushed were made on the previous day.
+            if self.quota_store and self._unflushed_requests and self.quota_day:
+                self.quota_store.add(self.quota_day, self._unflushed_requests)
+            self.quota_day = today
+            self.requests_used = 0
+            self._unflushed_requests = 0
+
+    def remaining_quota(self) -> int:
+        with self._quota_lock:
+            return self.daily_quota - self.requests_used
+
+    def acquire(self, priority: int = PRIORITY_CRITICAL):
+        """
+        Takes one request of the daily quota, then blocks until the request may be sent.
+
+        :raises PetfinderQuotaExhaustedError: When the remaining quota doesn't allow a request of this priority
+        """
+        with self._quota_lock:
+            self._start_day_if_new()
+            reserved_quota = self.optional_quota_reserve if priority >= self.PRIORITY_OPTIONAL else 0
+            if self.daily_quota - self.requests_used <= reserved_quota:
+                raise PetfinderQuotaExhaustedError(
+                    f"Petfinder daily quota has {self.daily_quota - self.requests_used} requests left, reserved for "
+                    f"higher priority requests." if reserved_quota else "Petfinder daily quota is used up.")
+            self.requests_used += 1
+            self._unflushed_requests += 1
+            flush_needed = self._unflushed_requests >= self.flush_every
+
+        if flush_needed:
+            self.flush()
+        self.token_bucket.acquire(priority=priority)
+
+    def observe(self, response):
+        """
+        Adjusts the request rate and remaining quota to a Petfinder response.
+
+        X-RateLimit-Remaining only lowers the remaining quota when X-RateLimit-Limit equals the daily quota. The headers
+        don't say which window they count, and a per-second or per-minute window would otherwise look like an almost
+        used up daily quota.
+        """
+        remaining = response.headers.get(self.REMAINING_HEADER, '')
+        limit = response.headers.get(self.LIMIT_HEADER, '')
+        if remaining.isdigit() and limit.isdigit() and int(limit) == self.daily_quota:
+            with self._quota_lock:
+                self.requests_used = max(self.requests_used, self.daily_quota - int(remaining))
+
+        if response.status_code == 429:
+            retry_after = response.headers.get('Retry-After', '')
+            self.token_bucket.pause(float(retry_after) if retry_after.isdigit() else 1.0)
+            new_rate = max(self.min_requests_per_second, self.token_bucket.rate_per_second / 2)
+            self.logger.info(f"Petfinder throttled a request. Lowering the request rate to {new_rate:.2f} per second.")
+            self.token_bucket.set_rate(new_rate)
+        elif response.ok and self.token_bucket.rate_per_second < self.max_requests_per_second:
+            # Additive increase, so the rate recovers over a few dozen requests after a 429
+            self.token_bucket.set_rate(min(self.max_requests_per_second,
+                                           self.token_bucket.rate_per_second + self.max_requests_per_second / 20))
+
+    def flush(self):
+        """
+        Adds the requests counted since the last flush to the quota store. Call at the end of every invocation.
+        """
+        with self._quota_lock:
+            unflushed_requests, self._unflushed_requests = self._unflushed_requests, 0
+            quota_day = self.quota_day
+        if self.quota_store and unflushed_requests and quota_day:
+            self.quota_store.add(quota_day, unflushed_requests)
@@ -0,0 +1 @@
+from .state_fan_out_collector import StateFanOutCollector, US_STATES, create_state_request
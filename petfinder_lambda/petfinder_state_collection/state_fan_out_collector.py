@@ -0,0 +1,73 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+from typing import Callable
+
+from petfinder_lambda.petfinder_api_management import PetfinderApiRequest
+
+
+US_STATES = ['AL', 'AK', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA', 'HI', 'ID', 'IL', 'IN', 'IA', 'KS', 'KY', 'LA',
+             'ME', 'MD', 'MA', 'MI', 'MN', 'MS', 'MO', 'MT', 'NE', 'NV', 'NH', 'NJ', 'NM', 'NY', 'NC', 'ND', 'OH', 'OK',
+             'OR', 'PA', 'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY']
+
+
+def create_state_request(request: PetfinderApiRequest, state: str) -> PetfinderApiRequest:
+    """
+    :return: Copy of the request limited to one state through Petfinder's 'location' parameter, named e.g. 'dogs_ca'
+    """
+    return PetfinderApiRequest(name=f"{request.name}_{state.lower()}",
+                               category=request.category,
+                               parameters={**request.parameters, 'location': state},
+                               breakdowns=request.breakdowns,
+                               priority=request.priority)
+
+
+class StateFanOutCollector:
+    """
+    Runs the per-state queries of state fan-out requests concurrently on an asyncio event loop. Every (request, state)
+    pair is one task, and a semaphore caps how many of them are in flight at once.
+
+    The Petfinder client is blocking (the shared HttpTransport, PetfinderRequestScheduler and the pagination prefetch
+    are all thread based), so each task runs collect_state in a worker thread through asyncio.to_thread. The worker
+    pool is sized to the concurrency cap, which keeps the number of threads, and of pooled connections in use, bounded
+    however many states are queried. The scheduler's token bucket still paces the requests of all tasks together.
+    """
+
+    def __init__(self, collect_state: Callable[[PetfinderApiRequest, str], object], max_concurrency: int = 10):
+        """
+
+        :param collect_state: Called as collect_state(request, state) for every state of every request. Fetches,
+            aggregates and stores the state's counts, e.g. for the request made by create_state_request.
+        :param max_concurrency: Number of states collected at once
+        """
+        self.collect_state = collect_state
+        self.max_concurrency = max(1, max_concurrency)
+        self.logger = logging.getLogger(name='StateFanOutCollector')
+
+    async def _collect_all(self, requests: list[PetfinderApiRequest]) -> dict:
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        # asyncio.run shuts the default executor down when the loop closes
+        asyncio.get_running_loop().set_default_executor(
+            ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='pf_state'))
+
+        async def collect(request, state):
+            async with semaphore:
+                return await asyncio.to_thread(self.collect_state, request, state)
+
+        request_states = [(request, state) for request in requests for state in request.states]
+        results = await asyncio.gather(*(collect(request, state) for request, state in request_states),
+                                       return_exceptions=True)
+        return {(request.name, state): result for (request, state), result in zip(request_states, results)}
+
+    def run(self, requests: list[PetfinderApiRequest]) -> dict:
+        """
+        Collects every state of every request. A failing state doesn't stop the others.
+
+        :param requests: Requests with a 'states' list
+        :return: {(request name, state): collect_state's return value, or the exception it raised}
+        """
+        if not requests:
+            return {}
+        self.logger.info(f"Collecting {sum(len(request.states) for request in requests)} state queries of "
+                         f"{len(requests)} requests, {self.max_concurrency} at a time.")
+        return asyncio.run(self._collect_all(requests))